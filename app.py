@@ -1,41 +1,60 @@
 from flask import Flask
 from backend.config import Config
+from backend.database import configure_engine
+from backend.hashing import hasher
+from backend.auth import load_token_user
+from backend.profiling import instrumentation
+from backend.submissions import submission_queue
+from backend.purge import purger
+from backend.quiz_sessions import quiz_sessions
+from backend.ratelimit import rate_limiter
 from backend.models import db, User, Role
 from backend.resources import api
+from backend.routes import routes
+from backend.commands import commands
 from flask_security.core import Security
 from flask_security.datastore import SQLAlchemyUserDatastore
-from flask_security.utils import hash_password
 from flask_cors import CORS
 
 
-def createApp():
+# Builds the app without touching the database. Create the schema and the default
+# users with `flask --app app init-db` and `flask --app app seed`. config overrides
+# settings of Config, e.g. the database of a test.
+def createApp(config=None):
     app = Flask(__name__, template_folder="frontend", static_folder="frontend")
     app.config.from_object(Config)
+    app.config.update(config or {})
     CORS(app)
     db.init_app(app)
+    configure_engine(app, db)
+    hasher.init_app(app)
+    instrumentation.init_app(app, db)
+    submission_queue.init_app(app)
+    purger.init_app(app)
+    quiz_sessions.init_app(app)
+    rate_limiter.init_app(app)
     api.init_app(app)
     datastore = SQLAlchemyUserDatastore(db, User, Role)
     app.security = Security(app, datastore=datastore, register_blueprint=False)  # type: ignore
-    app.app_context().push()
+    app.security.login_manager.request_loader(load_token_user)  # type: ignore
+    app.register_blueprint(routes)
+    app.register_blueprint(commands)
     return app
 
 
+# `app:app` for WSGI servers and `flask --app app` keep working, but the app is only
+# built when first asked for, so importing this module has no side effects.
+def __getattr__(name):
+    if name == "app":
+        globals()["app"] = createApp()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-app = createApp()
-
-with app.app_context():
-    db.create_all()
-    userdatastore : SQLAlchemyUserDatastore = app.security.datastore # type: ignore
-    userdatastore.find_or_create_role(name="admin", description="Administrator")
-    userdatastore.find_or_create_role(name="user", description="Normal User")
-    db.session.commit()
-    if not userdatastore.find_user(email="admin@quizmaster.com"):
-        userdatastore.create_user(name="Administrator", email="admin@quizmaster.com", password=hash_password("admin"), roles=["admin"])
-    if not userdatastore.find_user(email="testuser@quizmaster.com"):
-        userdatastore.create_user(name="Test User", email="testuser@quizmaster.com", password=hash_password("testuser"), roles=["user"])
-    db.session.commit()
-
-import backend.routes #noqa
 
 if __name__ == "__main__":
-    app.run(debug=True, port=8000)
\ No newline at end of file
+    from backend.bootstrap import init_db, seed_users
+    app = createApp()
+    with app.app_context():
+        init_db()
+        seed_users()
+    app.run(debug=True, port=8000)
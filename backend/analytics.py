@@ -0,0 +1,167 @@
+from collections import defaultdict
+from itertools import chain
+from math import floor, isinf, sqrt
+from sqlalchemy import delete, select
+from .models import Attempt, Question, Response, QuestionStats, QuestionAnswerCount, db
+from .grading import ANS_TYPES, NUMERIC, option_set, numeric_value, load_answer_keys
+from .leaderboard import upsert
+from .export import stream_rows
+from .packing import expand_rows
+
+STAT_COLUMNS = ("response_count", "correct_count", "blank_count", "score_sum", "score_sq_sum", "correct_score_sum")
+
+
+# Numeric answers are bucketed by the width of the accepted range, so the
+# correct range is one bucket and the neighbouring ones show near misses.
+# The key is the bucket's start as the shortest repr that reads back as the
+# same float, so distinct buckets never share a key however large or finely
+# spaced they are. Whole numbers drop the ".0", which keeps the keys counted
+# before the switch from format(start, "g") wherever that was exact.
+def _bucket(value, low, high):
+    finite = not isinf(low) and not isinf(high)
+    width = high - low if finite and high > low else 1.0
+    origin = low if not isinf(low) else (high if not isinf(high) else 0.0)
+    return repr(float(origin + floor((value - origin) / width) * width)).removesuffix(".0")
+
+
+def answer_values(key, index, answer):
+    if key.types[index] == NUMERIC:
+        value = numeric_value(answer)
+        return [] if value is None else [_bucket(value, key.mins[index], key.maxs[index])]
+    return sorted(str(option) for option in option_set(answer))
+
+
+# Accumulates counter deltas in memory and adds them to the tables in two executemany upserts
+class ItemCounters():
+    def __init__(self):
+        self.stats = {}
+        self.values = defaultdict(int)
+
+    def add(self, key, question_id, answer, is_correct, attempt_score):
+        index = key.position.get(question_id)
+        if index is None:
+            return
+        stats = self.stats.get(question_id)
+        if stats is None:
+            stats = self.stats[question_id] = dict.fromkeys(STAT_COLUMNS, 0)
+            stats["quiz_id"] = key.quiz_id
+        values = answer_values(key, index, answer)
+        stats["response_count"] += 1
+        stats["blank_count"] += 0 if values else 1
+        stats["score_sum"] += attempt_score
+        stats["score_sq_sum"] += attempt_score * attempt_score
+        if is_correct:
+            stats["correct_count"] += 1
+            stats["correct_score_sum"] += attempt_score
+        for value in values:
+            self.values[(question_id, value)] += 1
+
+    def write(self):
+        if self.stats:
+            statement = upsert(QuestionStats)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=["question_id"],
+                set_={column: getattr(QuestionStats, column) + getattr(statement.excluded, column) for column in STAT_COLUMNS}
+            ), [{"question_id": question_id, **stats} for question_id, stats in self.stats.items()])
+        if self.values:
+            statement = upsert(QuestionAnswerCount)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=["question_id", "value"],
+                set_={"count": QuestionAnswerCount.count + statement.excluded.count}
+            ), [{"question_id": question_id, "value": value, "count": count}
+                for (question_id, value), count in self.values.items()])
+        self.stats = {}
+        self.values = defaultdict(int)
+
+
+# Called from grading with the already graded submission, in the caller's transaction
+def record_responses(key, answers, results, score):
+    counters = ItemCounters()
+    for (question_id, answer), is_correct in zip(answers, results):
+        counters.add(key, question_id, answer, is_correct, score)
+    counters.write()
+
+
+# Recomputes the counters from the responses table in chunks of batch_size rows. Caller commits.
+def rebuild(quiz_ids=None, batch_size=5000):
+    questions = select(Question.id)
+    if quiz_ids is not None:
+        questions = questions.where(Question.quiz_id.in_(quiz_ids))
+    db.session.execute(delete(QuestionAnswerCount).where(QuestionAnswerCount.question_id.in_(questions)))
+    db.session.execute(delete(QuestionStats).where(QuestionStats.question_id.in_(questions)))
+
+    statement = select(Attempt.quiz_id, Response.question_id, Response.answer, Response.is_correct, Attempt.score).join(
+        Attempt, Attempt.id == Response.attempt_id).order_by(Response.id)
+    packed = select(Attempt.quiz_id, Attempt.packed_answers, Attempt.score).where(
+        Attempt.packed_answers.isnot(None)).order_by(Attempt.id)
+    if quiz_ids is not None:
+        statement = statement.where(Attempt.quiz_id.in_(quiz_ids))
+        packed = packed.where(Attempt.quiz_id.in_(quiz_ids))
+    rows = chain(stream_rows(statement, batch_size), expand_rows(stream_rows(packed, batch_size), 1, 0))
+    keys = {}
+    counters = ItemCounters()
+    pending = 0
+    for quiz_id, question_id, answer, is_correct, score in rows:
+        if quiz_id not in keys:
+            keys.update(load_answer_keys([quiz_id]))
+        counters.add(keys[quiz_id], question_id, answer, is_correct, score or 0)
+        pending += 1
+        if pending >= batch_size:
+            counters.write()
+            pending = 0
+    counters.write()
+
+
+def _discrimination(stats):
+    n, correct = stats.response_count, stats.correct_count
+    if not n or correct in (0, n):
+        return None
+    mean = stats.score_sum / n
+    variance = stats.score_sq_sum / n - mean * mean
+    if variance <= 0:
+        return None
+    mean_correct = stats.correct_score_sum / correct
+    mean_incorrect = (stats.score_sum - stats.correct_score_sum) / (n - correct)
+    p = correct / n
+    return round((mean_correct - mean_incorrect) / sqrt(variance) * sqrt(p * (1 - p)), 4)
+
+
+# Per question difficulty, point-biserial discrimination and answer distribution, read from the counters only
+def item_report(quiz_id):
+    questions = db.session.query(Question.id, Question.question_statement, Question.ans_type, Question.options).filter(
+        Question.quiz_id == quiz_id).order_by(Question.id).all()
+    stats = {row.question_id: row for row in QuestionStats.query.filter(QuestionStats.quiz_id == quiz_id)}
+    distribution = defaultdict(list)
+    for question_id, value, count in db.session.query(
+            QuestionAnswerCount.question_id, QuestionAnswerCount.value, QuestionAnswerCount.count
+    ).join(Question, Question.id == QuestionAnswerCount.question_id).filter(Question.quiz_id == quiz_id):
+        distribution[question_id].append((value, count))
+
+    report = []
+    for question_id, statement, ans_type, options in questions:
+        row = stats.get(question_id)
+        values = distribution.get(question_id, [])
+        if ANS_TYPES.get(ans_type) == NUMERIC:
+            values.sort(key=lambda item: float(item[0]))
+        else:
+            values.sort()
+        report.append({
+            "question_id": question_id,
+            "question_statement": statement,
+            "ans_type": ans_type,
+            "response_count": row.response_count if row else 0,
+            "blank_count": row.blank_count if row else 0,
+            "percent_correct": round(100 * row.correct_count / row.response_count, 2) if row and row.response_count else None,
+            "discrimination": _discrimination(row) if row else None,
+            "distribution": [{"value": value, "option": _option_label(options, value), "count": count} for value, count in values],
+        })
+    return report
+
+
+def _option_label(options, value):
+    if not options:
+        return None
+    try:
+        return options[int(value)]
+    except (ValueError, IndexError, TypeError):
+        return value if value in options else None
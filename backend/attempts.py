@@ -0,0 +1,53 @@
+from datetime import datetime
+from sqlalchemy import BigInteger, LargeBinary, func, insert, literal, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from .models import Attempt, db
+
+ALLOCATE_RETRIES = 5
+
+
+# Inserts the next attempt for (student, quiz) with a single INSERT ... SELECT MAX()+1 statement,
+# so the number is computed and claimed atomically. The unique constraint on
+# (student_id, quiz_id, attempt_number) catches the rare collision, which is retried
+# inside a savepoint. packed_answers is the blob of RESPONSE_STORAGE=packed, paper_seed the
+# seed of a pooled quiz's paper. Returns (attempt_id, attempt_number).
+def allocate_attempt(student_id, quiz_id, score=0, packed_answers=None, paper_seed=None):
+    next_number = select(
+        literal(student_id), literal(quiz_id),
+        func.coalesce(func.max(Attempt.attempt_number), 0) + 1,
+        literal(datetime.now()), literal(score), literal(packed_answers, LargeBinary), literal(paper_seed, BigInteger)
+    ).where(Attempt.student_id == student_id, Attempt.quiz_id == quiz_id)
+    statement = insert(Attempt).from_select(
+        ["student_id", "quiz_id", "attempt_number", "attempt_date", "score", "packed_answers", "paper_seed"], next_number
+    ).returning(Attempt.id, Attempt.attempt_number)
+    for retry in range(ALLOCATE_RETRIES):
+        try:
+            with db.session.begin_nested():
+                return tuple(db.session.execute(statement).one())
+        except IntegrityError:
+            if retry == ALLOCATE_RETRIES - 1:
+                raise
+
+
+# allocate_attempt for a batch: one query for the current numbers of every (student, quiz)
+# in it and one multi-row INSERT. If a request allocates for the same pair in between,
+# the unique constraint fails the insert and the batch falls back to allocate_attempt
+# row by row. attempts is [(student_id, quiz_id, score, packed_answers, paper_seed), ...];
+# returns [(attempt_id, attempt_number), ...].
+def allocate_attempts(attempts):
+    pairs = {(student_id, quiz_id) for student_id, quiz_id, _, _, _ in attempts}
+    latest = {(student_id, quiz_id): number for student_id, quiz_id, number in db.session.execute(
+        select(Attempt.student_id, Attempt.quiz_id, func.max(Attempt.attempt_number))
+        .where(tuple_(Attempt.student_id, Attempt.quiz_id).in_(pairs)).group_by(Attempt.student_id, Attempt.quiz_id))}
+    now = datetime.now()
+    rows = []
+    for student_id, quiz_id, score, packed_answers, paper_seed in attempts:
+        number = latest[(student_id, quiz_id)] = latest.get((student_id, quiz_id), 0) + 1
+        rows.append({"student_id": student_id, "quiz_id": quiz_id, "attempt_number": number, "attempt_date": now,
+                     "score": score, "packed_answers": packed_answers, "paper_seed": paper_seed})
+    try:
+        with db.session.begin_nested():
+            return [tuple(row) for row in db.session.execute(
+                insert(Attempt).returning(Attempt.id, Attempt.attempt_number, sort_by_parameter_order=True), rows)]
+    except IntegrityError:
+        return [allocate_attempt(*attempt) for attempt in attempts]
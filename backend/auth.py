@@ -0,0 +1,191 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import g
+from flask_security.utils import config_value, get_request_attr, parse_auth_token, set_request_attr
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .config import Config
+from .models import User, UserRoles, db
+
+
+class CachedRole():
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_permissions(self):
+        return set()
+
+
+# What the role decorators need to know about a token's user, without touching the
+# database. Anything else a handler reads is loaded from the User row on first use.
+class CachedUser():
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, fs_uniquifier, active, role_names):
+        self.id = user_id
+        self.fs_uniquifier = fs_uniquifier
+        self.active = active
+        self.roles = [CachedRole(name) for name in role_names]
+        self._user = None
+
+    @property
+    def is_active(self):
+        return self.active
+
+    def get_id(self):
+        return str(self.fs_uniquifier)
+
+    def has_role(self, role):
+        name = role if isinstance(role, str) else role.name
+        return any(cached.name == name for cached in self.roles)
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name == "_user":
+            raise AttributeError(name)
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+        return getattr(self._user, name)
+
+
+# Two bounded LRUs with a short TTL: verified token -> (fs_uniquifier, user id), and
+# user id -> (fs_uniquifier, active, role names). Invalidation drops the user entry, so
+# the next request with any of that user's tokens goes through full verification again.
+# The cache is per process, other workers see changes once AUTH_CACHE_TTL has passed.
+class AuthCache():
+    def __init__(self, maxsize=4096, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._tokens = OrderedDict()
+        self._users = OrderedDict()
+        self._lock = Lock()
+
+    def _put(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def _get(self, entries, key, now):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return entry
+
+    def lookup(self, token):
+        now = time.monotonic()
+        with self._lock:
+            token_entry = self._get(self._tokens, token, now)
+            user_entry = token_entry and self._get(self._users, token_entry[2], now)
+            if user_entry is None or user_entry[1] != token_entry[1]:
+                self.misses += 1
+                return None
+            self.hits += 1
+        _, fs_uniquifier, active, role_names = user_entry
+        return CachedUser(token_entry[2], fs_uniquifier, active, role_names)
+
+    def remember(self, token, tdata, user):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        expires = now + self.ttl
+        if tdata.get("exp"):
+            # Never outlive the token's own expiry
+            expires = min(expires, now + tdata["exp"] - time.time())
+        with self._lock:
+            self._put(self._tokens, token, (expires, user.fs_uniquifier, user.id))
+            self._put(self._users, user.id, (now + self.ttl, user.fs_uniquifier, bool(user.active),
+                                             tuple(role.name for role in user.roles)))
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                if self._users.pop(user_id, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "tokens": len(self._tokens),
+                "users": len(self._users),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+auth_cache = AuthCache(Config.AUTH_CACHE_SIZE, Config.AUTH_CACHE_TTL)
+
+
+def _request_token(request):
+    token = request.args.get(config_value("TOKEN_AUTHENTICATION_KEY"), request.headers.get(config_value("TOKEN_AUTHENTICATION_HEADER")))
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        if isinstance(data, dict):
+            token = data.get(config_value("TOKEN_AUTHENTICATION_KEY"), token)
+    return token
+
+
+# Replaces Flask-Security's token request loader. Same checks, but a verified token is
+# served from auth_cache until it expires or the user changes.
+def load_token_user(request):
+    if get_request_attr("fs_authn_via") == "token":
+        return g._login_user
+    token = _request_token(request)
+    if not token:
+        return None
+    user = auth_cache.lookup(token)
+    if user is None:
+        try:
+            tdata = parse_auth_token(token)
+            user = User.query.filter_by(fs_uniquifier=tdata["uid"]).first()
+        except Exception:
+            return None
+        if not user or not user.verify_auth_token(tdata):
+            return None
+        auth_cache.remember(token, tdata, user)
+    if not user.active:
+        return None
+    set_request_attr("fs_authn_via", "token")
+    return user
+
+
+# Users whose row or roles changed are dropped from the cache once the change commits
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault("auth_changed_users", set())
+    for instance in (*session.dirty, *session.deleted):
+        if isinstance(instance, User):
+            changed.add(instance.id)
+    for instance in (*session.new, *session.deleted):
+        if isinstance(instance, UserRoles):
+            changed.add(instance.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    changed = session.info.pop("auth_changed_users", None)
+    if changed:
+        auth_cache.invalidate(*changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("auth_changed_users", None)
@@ -0,0 +1,32 @@
+from flask import current_app
+from .models import db
+from .migrations import upgrade
+from .hashing import hasher
+
+ROLES = (("admin", "Administrator"), ("user", "Normal User"))
+DEFAULT_USERS = (
+    ("Administrator", "admin@quizmaster.com", "admin", "admin"),
+    ("Test User", "testuser@quizmaster.com", "testuser", "user"),
+)
+
+
+# Schema, migrations and roles. Run once per deployment (flask init-db), not per worker start.
+def init_db():
+    ran = upgrade()
+    datastore = current_app.security.datastore
+    for name, description in ROLES:
+        datastore.find_or_create_role(name=name, description=description)
+    db.session.commit()
+    return ran
+
+
+# Default accounts for development (flask seed). Returns the emails that were created.
+def seed_users():
+    datastore = current_app.security.datastore
+    created = []
+    for name, email, password, role in DEFAULT_USERS:
+        if not datastore.find_user(email=email):
+            datastore.create_user(name=name, email=email, password=hasher.hash(password), roles=[role])
+            created.append(email)
+    db.session.commit()
+    return created
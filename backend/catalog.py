@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from threading import Lock
+from flask import g, has_request_context
+from sqlalchemy import select, update
+from sqlalchemy.orm import selectinload
+from .config import Config
+from .models import CatalogVersion, Subject, Chapter, Quiz, db, subject_chapter_association
+
+
+# Keyset page over a model ordered by id. Fetches one extra row to tell if another page exists.
+def _page(query, model, after, limit):
+    if after is not None:
+        query = query.filter(model.id > after)
+    query = query.order_by(model.id)
+    if limit is None:
+        return query.all(), None
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+# Subjects -> chapters -> quizzes in at most three queries regardless of catalog size.
+# depth 0 skips the children entirely, depth 1 stops at chapters.
+def subjects_with_tree(after=None, limit=None, depth=2):
+    query = Subject.query
+    if depth >= 2:
+        query = query.options(selectinload(Subject.chapters).selectinload(Chapter.quizzes))
+    elif depth == 1:
+        query = query.options(selectinload(Subject.chapters))
+    return _page(query, Subject, after, limit)
+
+
+def subject_with_tree(subject_id):
+    return Subject.query.options(
+        selectinload(Subject.chapters).selectinload(Chapter.quizzes)
+    ).filter(Subject.id == subject_id).first()
+
+
+def chapters_with_quizzes(subject_id=None, after=None, limit=None, depth=1):
+    query = Chapter.query
+    if depth >= 1:
+        query = query.options(selectinload(Chapter.quizzes))
+    if subject_id is not None:
+        query = query.join(subject_chapter_association, subject_chapter_association.c.chapter_id == Chapter.id).filter(
+            subject_chapter_association.c.subject_id == subject_id)
+    return _page(query, Chapter, after, limit)
+
+
+def list_quizzes(after=None, limit=None):
+    return _page(Quiz.query, Quiz, after, limit)
+
+
+# Serialized catalog payloads, valid only for the catalog version they were built at. The
+# version lives in the catalog_version row, so it is shared by every worker process: admin
+# writes commit and then call bump(), and each request reads the row once (a primary key
+# lookup, kept in g) before using the cache. A reader in any worker therefore never gets
+# data older than the last committed write. bump() must come after the write's commit, or
+# another worker could cache the old data under the new version.
+class CatalogCache():
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.version = None  # (epoch, version) the cached slices were built at
+        self.hits = 0
+        self.misses = 0
+        self._slices = OrderedDict()
+        self._lock = Lock()
+
+    def _seen(self, version):
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._slices.clear()
+        if has_request_context():
+            g._catalog_version = version
+        return version
+
+    # The shared version, read once per request (every call outside of one)
+    def current(self):
+        if has_request_context() and "_catalog_version" in g:
+            return g._catalog_version
+        return self._seen(tuple(db.session.execute(
+            select(CatalogVersion.epoch, CatalogVersion.version).where(CatalogVersion.id == 1)).one()))
+
+    def bump(self):
+        version = tuple(db.session.execute(update(CatalogVersion).where(CatalogVersion.id == 1).values(
+            version=CatalogVersion.version + 1).returning(CatalogVersion.epoch, CatalogVersion.version)).one())
+        db.session.commit()
+        self._seen(version)
+
+    # Catalog pages and per-subject / per-chapter payloads, bounded LRU
+    def slice(self, kind, key, loader):
+        cache_key = (kind, key)
+        version = self.current()
+        with self._lock:
+            entry = self._slices.get(cache_key)
+            if entry is not None and entry[0] == version:
+                self._slices.move_to_end(cache_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        data = loader()
+        with self._lock:
+            if self.version == version:
+                self._slices[cache_key] = (version, data)
+                self._slices.move_to_end(cache_key)
+                while len(self._slices) > self.maxsize:
+                    self._slices.popitem(last=False)
+        return data
+
+    # Strong validator for a catalog resource, no body hashing needed
+    def etag(self, *parts):
+        epoch, version = self.current()
+        return "-".join([epoch, str(version), *map(str, parts)])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version and self.version[1],
+                "hits": self.hits,
+                "misses": self.misses,
+                "slices": len(self._slices),
+                "maxsize": self.maxsize,
+            }
+
+
+catalog_cache = CatalogCache(Config.CATALOG_CACHE_SIZE)
@@ -0,0 +1,149 @@
+import time
+import click
+from flask import Blueprint
+from .models import Attempt, db
+from .grading import grade_attempts
+from .leaderboard import rebuild
+from . import analytics
+from .migrations import upgrade, explain_hot_queries
+from .bootstrap import init_db, seed_users
+from . import search
+from .submissions import submission_queue
+from . import purge
+from . import packing
+from .quiz_sessions import quiz_sessions
+
+# cli_group=None puts the commands at the top level: flask regrade, flask init-db, ...
+commands = Blueprint("commands", __name__, cli_group=None)
+
+
+@commands.cli.command("regrade")
+@click.option("--quiz-id", type=int, default=None, help="Only regrade attempts of this quiz.")
+@click.option("--batch-size", type=int, default=500, show_default=True)
+def regrade(quiz_id, batch_size):
+    """Re-grade stored attempts in batches."""
+    query = db.session.query(Attempt.id).order_by(Attempt.id)
+    if quiz_id is not None:
+        query = query.filter(Attempt.quiz_id == quiz_id)
+    attempt_ids = [attempt_id for (attempt_id,) in query.all()]
+    keys = {}
+    for start in range(0, len(attempt_ids), batch_size):
+        grade_attempts(attempt_ids[start:start + batch_size], keys=keys)
+        db.session.commit()
+    rebuild(None if quiz_id is None else [quiz_id])
+    analytics.rebuild(None if quiz_id is None else [quiz_id])
+    db.session.commit()
+    click.echo(f"Regraded {len(attempt_ids)} attempts")
+
+
+@commands.cli.command("rebuild-leaderboards")
+@click.option("--quiz-id", type=int, default=None, help="Only rebuild this quiz.")
+def rebuild_leaderboards(quiz_id):
+    """Recompute leaderboards and score aggregates from the attempt table."""
+    rebuild(None if quiz_id is None else [quiz_id])
+    db.session.commit()
+    click.echo("Leaderboards rebuilt")
+
+
+@commands.cli.command("rebuild-item-analytics")
+@click.option("--quiz-id", type=int, default=None, help="Only rebuild this quiz.")
+@click.option("--batch-size", type=int, default=5000, show_default=True)
+def rebuild_item_analytics(quiz_id, batch_size):
+    """Recompute per-question analytics from the responses table."""
+    analytics.rebuild(None if quiz_id is None else [quiz_id], batch_size)
+    db.session.commit()
+    click.echo("Item analytics rebuilt")
+
+
+@commands.cli.command("init-db")
+def init_db_command():
+    """Create the tables, apply pending migrations and create the roles."""
+    ran = init_db()
+    click.echo("\n".join(ran) if ran else "Database is up to date")
+
+
+@commands.cli.command("seed")
+def seed_command():
+    """Create the default admin and test user accounts if they are missing."""
+    created = seed_users()
+    click.echo(f"Created {', '.join(created)}" if created else "Default users already exist")
+
+
+@commands.cli.command("db-upgrade")
+def db_upgrade():
+    """Apply pending schema migrations."""
+    ran = upgrade()
+    click.echo("\n".join(ran) if ran else "Database is up to date")
+
+
+@commands.cli.command("db-explain")
+def db_explain():
+    """Show EXPLAIN QUERY PLAN for the hot lookups, exit 1 if any of them scans."""
+    with db.engine.connect() as connection:
+        report = explain_hot_queries(connection)
+    for entry in report:
+        click.echo(f"{'ok  ' if entry['indexed'] else 'SCAN'} {entry['query']}: {' | '.join(entry['plan'])}")
+    if not all(entry["indexed"] for entry in report):
+        raise SystemExit(1)
+
+
+@commands.cli.command("rebuild-search")
+def rebuild_search():
+    """Repopulate the full-text search index from the catalog tables."""
+    with db.engine.begin() as connection:
+        if not search.available(connection):
+            raise click.ClickException("Full-text search needs SQLite with FTS5")
+        search.create_index(connection)
+        count = search.rebuild(connection)
+    click.echo(f"Indexed {count} rows")
+
+
+@commands.cli.command("grade-submissions")
+@click.option("--batch-size", type=int, default=None, help="Submissions per transaction (default SUBMISSION_BATCH_SIZE).")
+@click.option("--once", is_flag=True, help="Exit when the queue is empty instead of waiting for more.")
+def grade_submissions(batch_size, once):
+    """Grade queued submissions in the foreground, as a standalone worker."""
+    graded = 0
+    while True:
+        done = submission_queue.drain_once(batch_size)
+        graded += done
+        if not done:
+            if once:
+                break
+            time.sleep(submission_queue.poll_interval)
+    click.echo(f"Processed {graded} submissions")
+
+
+@commands.cli.command("purge")
+@click.option("--quiz-id", type=int, default=None, help="Delete this quiz with everything under it.")
+@click.option("--chapter-id", type=int, default=None, help="Delete this chapter with everything under it.")
+def purge_command(quiz_id, chapter_id):
+    """Delete a large quiz or chapter in chunks, then resume any interrupted background deletes."""
+    for kind, target_id in (("quiz", quiz_id), ("chapter", chapter_id)):
+        if target_id is not None:
+            purge.enqueue(kind, target_id)
+            db.session.commit()
+    ran = purge.purger.run_pending()
+    click.echo(f"Ran {ran} deletion jobs")
+
+
+@commands.cli.command("compact-responses")
+@click.option("--quiz-id", type=int, default=None, help="Only convert attempts of this quiz.")
+@click.option("--batch-size", type=int, default=500, show_default=True, help="Attempts per transaction.")
+@click.option("--expand", is_flag=True, help="Convert packed attempts back to one response row per answer.")
+@click.option("--vacuum", is_flag=True, help="Run VACUUM afterwards so the file shrinks (SQLite, locks the database).")
+def compact_responses(quiz_id, batch_size, expand, vacuum):
+    """Pack each attempt's response rows into one blob, or expand them back."""
+    quiz_ids = None if quiz_id is None else [quiz_id]
+    count = (packing.expand if expand else packing.compact)(quiz_ids, batch_size)
+    click.echo(f"{'Expanded' if expand else 'Packed'} {count} attempts")
+    if vacuum:
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql("VACUUM")
+
+
+@commands.cli.command("sweep-sessions")
+def sweep_sessions():
+    """Submit overdue quiz sessions of the database store (QUIZ_SESSION_STORE=database) with their saved answers."""
+    expired = quiz_sessions.sweep()
+    click.echo(f"Expired {expired} quiz sessions")
@@ -1,8 +1,63 @@
+import os
+from .database import database_uri, engine_options, sqlite_pragmas
+
 class Config():
-    SQLALCHEMY_DATABASE_URI = "sqlite:///database.sqlite3"
+    SQLALCHEMY_DATABASE_URI = database_uri()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_PRAGMAS = sqlite_pragmas()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECURITY_PASSWORD_HASH = "bcrypt"
+    BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+    PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", 32))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10))
     SECURITY_PASSWORD_SALT = "my_precious_two"
     SECURITY_TOKEN_AUTHENTICATION_HEADER = "Token"
     SECRET_KEY = "secret_key"
     WTF_CSRF_ENABLED = False
+    CATALOG_CACHE_SIZE = 256
+    AUTH_CACHE_SIZE = 4096
+    AUTH_CACHE_TTL = int(os.environ.get("AUTH_CACHE_TTL", 30))
+    PAGE_MAX_LIMIT = 500
+    IMPORT_CHUNK_SIZE = 1000
+    EXPORT_BATCH_SIZE = 1000
+    # rows stores one Response row per answer; packed stores one blob per attempt
+    RESPONSE_STORAGE = os.environ.get("RESPONSE_STORAGE", "rows")
+    # sync grades in the request; queue stores the submission and grades it in the background
+    SUBMISSION_MODE = os.environ.get("SUBMISSION_MODE", "sync")
+    SUBMISSION_WORKERS = int(os.environ.get("SUBMISSION_WORKERS", 1))
+    SUBMISSION_BATCH_SIZE = int(os.environ.get("SUBMISSION_BATCH_SIZE", 200))
+    SUBMISSION_POLL_INTERVAL = float(os.environ.get("SUBMISSION_POLL_INTERVAL", 0.25))
+    SUBMISSION_CLAIM_TIMEOUT = int(os.environ.get("SUBMISSION_CLAIM_TIMEOUT", 300))
+    # DELETE /api/quiz/<id>?mode=background deletes in chunks of this many rows, pausing in between
+    PURGE_CHUNK_SIZE = int(os.environ.get("PURGE_CHUNK_SIZE", 5000))
+    PURGE_PAUSE = float(os.environ.get("PURGE_PAUSE", 0.05))
+    # Timed quiz sessions: memory for a single process, database when several workers serve them
+    QUIZ_SESSION_STORE = os.environ.get("QUIZ_SESSION_STORE", "memory")
+    QUIZ_SESSION_GRACE = int(os.environ.get("QUIZ_SESSION_GRACE", 5))  # seconds a submit may arrive late
+    QUIZ_SESSION_UNTIMED_LIMIT = int(os.environ.get("QUIZ_SESSION_UNTIMED_LIMIT", 24 * 3600))  # quizzes without time_limit
+    QUIZ_SESSION_RETENTION = int(os.environ.get("QUIZ_SESSION_RETENTION", 3600))  # finished sessions stay readable this long
+    QUIZ_SESSION_SWEEP_INTERVAL = float(os.environ.get("QUIZ_SESSION_SWEEP_INTERVAL", 15))
+    QUIZ_SESSION_SWEEP_BATCH = int(os.environ.get("QUIZ_SESSION_SWEEP_BATCH", 500))
+    # Token buckets per client, "requests/seconds" each; empty or 0 turns a limit off.
+    # memory keeps them per process, database shares them between workers through RATE_LIMIT_DATABASE
+    RATE_LIMITING = os.environ.get("RATE_LIMITING", "1").lower() in ("1", "true", "yes")
+    RATE_LIMITS = {
+        "login": os.environ.get("RATE_LIMIT_LOGIN", "30/60"),  # per address; a class behind one NAT signs in together
+        "account": os.environ.get("RATE_LIMIT_ACCOUNT", "10/300"),  # register and delete_account
+        "submit": os.environ.get("RATE_LIMIT_SUBMIT", "30/60"),
+        "session": os.environ.get("RATE_LIMIT_SESSION", "30/60"),
+        "heartbeat": os.environ.get("RATE_LIMIT_HEARTBEAT", "240/60"),
+        "import": os.environ.get("RATE_LIMIT_IMPORT", "10/60"),
+    }
+    RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory")
+    RATE_LIMIT_DATABASE = os.environ.get("RATE_LIMIT_DATABASE", "ratelimit.sqlite3")  # relative to the instance folder
+    RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 100000))
+    # Write requests running at once per process, and how long one waits for a slot before a 503
+    WRITE_CONCURRENCY = int(os.environ.get("WRITE_CONCURRENCY", 16))
+    WRITE_ADMISSION_WAIT = float(os.environ.get("WRITE_ADMISSION_WAIT", 0.1))
+    PROFILING = os.environ.get("PROFILING", "0").lower() in ("1", "true", "yes")
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.01))
+    PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 500))
+    PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+    PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 20))
@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+from sqlalchemy import literal, select
+from .models import Quiz, Attempt, Response, User, db
+from .packing import expand_rows
+
+ATTEMPT_COLUMNS = ("attempt_id", "student_id", "student_email", "quiz_id", "attempt_number", "attempt_date", "score")
+RESPONSE_COLUMNS = ("response_id", "attempt_id", "student_id", "quiz_id", "attempt_number", "question_id", "answer", "is_correct")
+
+
+def _scoped(statement, scope, scope_id):
+    if scope == "quiz":
+        return statement.where(Attempt.quiz_id == scope_id)
+    if scope == "chapter":
+        return statement.where(Attempt.quiz_id.in_(select(Quiz.id).where(Quiz.chapter_id == scope_id)))
+    return statement
+
+
+def attempts_query(scope="all", scope_id=None):
+    statement = select(
+        Attempt.id, Attempt.student_id, User.email, Attempt.quiz_id,
+        Attempt.attempt_number, Attempt.attempt_date, Attempt.score
+    ).join(User, User.id == Attempt.student_id, isouter=True).order_by(Attempt.id)
+    return _scoped(statement, scope, scope_id), ATTEMPT_COLUMNS
+
+
+def responses_query(scope="all", scope_id=None):
+    statement = select(
+        Response.id, Response.attempt_id, Attempt.student_id, Attempt.quiz_id,
+        Attempt.attempt_number, Response.question_id, Response.answer, Response.is_correct
+    ).join(Attempt, Attempt.id == Response.attempt_id).order_by(Response.id)
+    return _scoped(statement, scope, scope_id), RESPONSE_COLUMNS
+
+
+# The same columns for attempts stored with RESPONSE_STORAGE=packed, which have no response ids
+def packed_response_rows(scope="all", scope_id=None, batch_size=1000):
+    statement = select(
+        literal(None), Attempt.id, Attempt.student_id, Attempt.quiz_id, Attempt.attempt_number, Attempt.packed_answers
+    ).where(Attempt.packed_answers.isnot(None)).order_by(Attempt.id)
+    return expand_rows(stream_rows(_scoped(statement, scope, scope_id), batch_size), 5, 3)
+
+
+# Rows are pulled from the cursor in batches of batch_size, nothing is held beyond that
+def stream_rows(statement, batch_size=1000):
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        result.close()
+
+
+def _plain(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+# Each yielded chunk covers one batch of rows so the response starts flowing immediately
+def csv_chunks(rows, columns, batch_size=1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([json.dumps(value) if isinstance(value, (list, dict)) else _plain(value) for value in row])
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_chunks(rows, columns, batch_size=1000):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({column: _plain(value) for column, value in zip(columns, row)}))
+        if len(lines) >= batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
@@ -0,0 +1,178 @@
+from array import array
+from math import inf
+from sqlalchemy import update
+from .models import Question, Attempt, Response, db
+from .packing import PackedAnswers, with_results
+
+SINGLE, MULTIPLE, NUMERIC = 0, 1, 2
+ANS_TYPES = {
+    "single": SINGLE, "single_choice": SINGLE,
+    "multiple": MULTIPLE, "multiple_choice": MULTIPLE,
+    "numeric": NUMERIC, "numerical": NUMERIC,
+}
+
+
+def option_key(value):
+    # Options may arrive as ints (indices) or strings ("2" or the option text)
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, float)):
+        return int(value) if float(value).is_integer() else value
+    text = str(value).strip()
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def option_set(value):
+    if value is None or value == "" or value == []:
+        return frozenset()
+    if not isinstance(value, (list, tuple, set)):
+        value = [value]
+    return frozenset(option_key(v) for v in value)
+
+
+def numeric_value(value):
+    if isinstance(value, (list, tuple)):
+        if len(value) != 1:
+            return None
+        value = value[0]
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AnswerKey():
+    # Compact answer key for one quiz, indexed by question position.
+    __slots__ = ("quiz_id", "question_ids", "position", "types", "correct", "mins", "maxs", "marks", "total_marks")
+
+    def __init__(self, quiz_id, rows):
+        self.quiz_id = quiz_id
+        self.question_ids = array("q")
+        self.position = {}
+        self.types = array("b")
+        self.correct = []
+        self.mins = array("d")
+        self.maxs = array("d")
+        self.marks = array("q")
+        for question_id, ans_type, correct_options, correct_min, correct_max, marks in rows:
+            self.position[question_id] = len(self.question_ids)
+            self.question_ids.append(question_id)
+            self.types.append(ANS_TYPES.get(ans_type, NUMERIC if correct_options is None else MULTIPLE))
+            self.correct.append(option_set(correct_options))
+            self.mins.append(-inf if correct_min is None else correct_min)
+            self.maxs.append(inf if correct_max is None else correct_max)
+            self.marks.append(marks or 0)
+        self.total_marks = sum(self.marks)
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def is_correct(self, index, answer):
+        if self.types[index] == NUMERIC:
+            value = numeric_value(answer)
+            return value is not None and self.mins[index] <= value <= self.maxs[index]
+        selected = option_set(answer)
+        if not selected:
+            return False
+        if self.types[index] == SINGLE and len(selected) != 1:
+            return False
+        return selected == self.correct[index]
+
+    # Answers to questions outside the quiz never score and cannot be stored as responses
+    # (their question_id would violate the foreign key), so they are dropped before grading.
+    # A question answered more than once keeps its last answer, in the place of its first.
+    def known(self, answers):
+        latest = {}
+        for question_id, answer in answers:
+            if question_id in self.position:
+                latest[question_id] = answer
+        return list(latest.items())
+
+    # Grade a list of (question_id, answer) pairs, returns ([is_correct, ...], score).
+    # A repeated question scores once, by its last answer.
+    def grade(self, answers):
+        results = []
+        earned = {}
+        for question_id, answer in answers:
+            index = self.position.get(question_id)
+            correct = index is not None and self.is_correct(index, answer)
+            results.append(correct)
+            if index is not None:
+                earned[question_id] = self.marks[index] if correct else 0
+        return results, sum(earned.values())
+
+
+def load_answer_key(quiz_id):
+    rows = db.session.query(
+        Question.id, Question.ans_type, Question.correct_options,
+        Question.correct_min, Question.correct_max, Question.marks
+    ).filter(Question.quiz_id == quiz_id).order_by(Question.id).all()
+    return AnswerKey(quiz_id, rows)
+
+
+def load_answer_keys(quiz_ids):
+    rows = db.session.query(
+        Question.quiz_id, Question.id, Question.ans_type, Question.correct_options,
+        Question.correct_min, Question.correct_max, Question.marks
+    ).filter(Question.quiz_id.in_(quiz_ids)).order_by(Question.quiz_id, Question.id).all()
+    grouped = {quiz_id: [] for quiz_id in quiz_ids}
+    for row in rows:
+        grouped[row[0]].append(row[1:])
+    return {quiz_id: AnswerKey(quiz_id, key_rows) for quiz_id, key_rows in grouped.items()}
+
+
+# Re-grade already stored attempts in one pass: one query for the answer keys,
+# one for the responses and two bulk UPDATEs. Packed attempts get their correctness
+# bitmap rewritten in place. Caller commits.
+def grade_attempts(attempt_ids, keys=None):
+    attempt_ids = list(attempt_ids)
+    if not attempt_ids:
+        return {}
+    attempts = db.session.query(Attempt.id, Attempt.quiz_id, Attempt.packed_answers).filter(Attempt.id.in_(attempt_ids)).all()
+    quiz_of = {attempt_id: quiz_id for attempt_id, quiz_id, _ in attempts}
+    keys = {} if keys is None else keys
+    missing = {quiz_id for quiz_id in quiz_of.values() if quiz_id not in keys}
+    if missing:
+        keys.update(load_answer_keys(missing))
+
+    responses = db.session.query(Response.id, Response.attempt_id, Response.question_id, Response.answer).filter(
+        Response.attempt_id.in_(quiz_of.keys())).order_by(Response.id).all()
+    # (attempt_id, question_id) -> marks; a question stored more than once scores by its last answer
+    earned = {}
+    response_rows = []
+    for response_id, attempt_id, question_id, answer in responses:
+        key = keys[quiz_of[attempt_id]]
+        index = key.position.get(question_id)
+        correct = index is not None and key.is_correct(index, answer)
+        if index is not None:
+            earned[attempt_id, question_id] = key.marks[index] if correct else 0
+        response_rows.append({"id": response_id, "is_correct": correct})
+
+    packed_rows = []
+    for attempt_id, quiz_id, blob in attempts:
+        if blob is None:
+            continue
+        key = keys[quiz_id]
+        packed = PackedAnswers(blob)
+        results = []
+        for question_id, answer in zip(packed.question_ids, packed.answers):
+            index = key.position.get(question_id)
+            correct = index is not None and key.is_correct(index, answer)
+            if index is not None:
+                earned[attempt_id, question_id] = key.marks[index] if correct else 0
+            results.append(correct)
+        packed_rows.append({"id": attempt_id, "packed_answers": with_results(blob, results)})
+
+    scores = {attempt_id: 0 for attempt_id in quiz_of}
+    for (attempt_id, _), marks in earned.items():
+        scores[attempt_id] += marks
+
+    if packed_rows:
+        db.session.execute(update(Attempt), packed_rows)
+    if response_rows:
+        db.session.execute(update(Response), response_rows)
+    db.session.execute(update(Attempt), [{"id": attempt_id, "score": score} for attempt_id, score in scores.items()])
+    return scores
@@ -0,0 +1,148 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from threading import BoundedSemaphore, Lock
+import bcrypt
+from flask_security.utils import get_hmac, use_double_hash, verify_password
+from .profiling import record
+
+
+class HasherSaturated(Exception):
+    pass
+
+
+# Run in the worker processes. They only see the HMAC'd secret, never the app.
+def _hash(secret, rounds):
+    started = time.time()
+    hashed = bcrypt.hashpw(secret, bcrypt.gensalt(rounds)).decode("ascii")
+    return hashed, started, time.time()
+
+
+def _verify(secret, password_hash):
+    started = time.time()
+    matches = bcrypt.checkpw(secret, password_hash)
+    return matches, started, time.time()
+
+
+def _secret(password, password_hash=None):
+    # Same pre-hash Flask-Security applies, so hashes stay interchangeable with hash_password()
+    if use_double_hash(password_hash):
+        return get_hmac(password)
+    return password.encode("utf-8") if isinstance(password, str) else password
+
+
+# bcrypt on a bounded process pool. At most PASSWORD_HASH_QUEUE operations may be queued or
+# running; beyond that callers get HasherSaturated straight away instead of waiting.
+# PASSWORD_HASH_WORKERS = 0 hashes on the calling thread (development and tests).
+class PasswordHasher():
+    def __init__(self):
+        self.workers = 0
+        self.rounds = 12
+        self.timeout = 10
+        self._executor = None
+        self._slots = BoundedSemaphore(1)
+        self._lock = Lock()
+        self.metrics = {"hashes": 0, "verifies": 0, "rejected": 0, "timeouts": 0,
+                        "hash_seconds": 0.0, "hash_seconds_max": 0.0, "queue_wait_seconds": 0.0, "queue_wait_seconds_max": 0.0}
+
+    def init_app(self, app):
+        self.shutdown()
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.rounds = app.config["BCRYPT_ROUNDS"]
+        self.timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+        self._slots = BoundedSemaphore(app.config["PASSWORD_HASH_QUEUE"])
+        # Flask-Security hashes with passlib (hash_password, change password), at the same cost
+        app.config["SECURITY_PASSWORD_HASH_PASSLIB_OPTIONS"] = {
+            **app.config.get("SECURITY_PASSWORD_HASH_PASSLIB_OPTIONS", {}), "bcrypt__rounds": self.rounds}
+
+    # Started by the first hash, so building the app forks nothing. That is usually on a request
+    # thread, and forking a threaded process is unsafe, so the workers are spawned.
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"))
+            return self._executor
+
+    # Drops a pool whose worker died; the next call starts a new one
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, kind, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.metrics["rejected"] += 1
+            raise HasherSaturated()
+        submitted = time.time()
+        try:
+            result, started, finished = self._call(fn, args)
+        finally:
+            record("hash", time.time() - submitted)
+        waited = max(started - submitted, 0.0)
+        with self._lock:
+            self.metrics[kind] += 1
+            self.metrics["hash_seconds"] += finished - started
+            self.metrics["hash_seconds_max"] = max(self.metrics["hash_seconds_max"], finished - started)
+            self.metrics["queue_wait_seconds"] += waited
+            self.metrics["queue_wait_seconds_max"] = max(self.metrics["queue_wait_seconds_max"], waited)
+        return result
+
+    # Runs fn on the pool, releasing the slot _run took once the work is done
+    def _call(self, fn, args):
+        future = None
+        if self.workers:
+            try:
+                executor = self._pool()
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._discard(executor)
+            except BaseException:
+                self._slots.release()
+                raise
+            else:
+                # Not when this caller stops waiting: a timed out job still occupies a worker
+                future.add_done_callback(lambda _: self._slots.release())
+                try:
+                    return future.result(self.timeout)
+                except FutureTimeout:
+                    with self._lock:
+                        self.metrics["timeouts"] += 1
+                    raise HasherSaturated()
+                except BrokenProcessPool:
+                    self._discard(executor)
+        # No workers, or one died: serve this call inline
+        try:
+            return fn(*args)
+        finally:
+            if future is None:
+                self._slots.release()
+
+    def hash(self, password):
+        return self._run("hashes", _hash, _secret(password), self.rounds)
+
+    def verify(self, password, password_hash):
+        if not password_hash or not password_hash.startswith("$2"):
+            # Not bcrypt (e.g. a legacy scheme), let Flask-Security handle it inline
+            return verify_password(password, password_hash)
+        return self._run("verifies", _verify, _secret(password, password_hash), password_hash.encode("ascii"))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+        done = stats["hashes"] + stats["verifies"]
+        stats["hash_seconds_avg"] = round(stats["hash_seconds"] / done, 4) if done else None
+        stats["queue_wait_seconds_avg"] = round(stats["queue_wait_seconds"] / done, 4) if done else None
+        stats.update(workers=self.workers, rounds=self.rounds)
+        return stats
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,282 @@
+import csv
+import io
+import json
+from time import perf_counter
+from sqlalchemy import insert
+from .models import Subject, Chapter, Quiz, Question, db, subject_chapter_association
+from .grading import ANS_TYPES, SINGLE, MULTIPLE, NUMERIC
+from .pools import pool_settings
+
+LIST_COLUMNS = ("options", "correct_options")
+TYPE_NAMES = {SINGLE: "single", MULTIPLE: "multiple", NUMERIC: "numeric"}
+MAX_REPORTED_ERRORS = 100
+
+
+class RowError(Exception):
+    pass
+
+
+# Rows from a JSON-lines stream, one object per line, read lazily
+def jsonl_rows(stream):
+    for line_no, line in enumerate(io.TextIOWrapper(stream, encoding="utf-8"), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, RowError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line_no, RowError("Each line must be a JSON object")
+            continue
+        yield line_no, row
+
+
+# Rows from a CSV stream with a header line. List columns hold JSON arrays or "a|b|c".
+def csv_rows(stream):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline=""))
+    for row in reader:
+        row = {key: value for key, value in row.items() if key and value not in (None, "")}
+        try:
+            for column in LIST_COLUMNS:
+                value = row.get(column)
+                if isinstance(value, str):
+                    row[column] = json.loads(value) if value.startswith("[") else value.split("|")
+        except ValueError as e:
+            yield reader.line_num, RowError(f"Invalid JSON in '{column}': {e}")
+            continue
+        yield reader.line_num, row
+
+
+def _required(row, *names):
+    missing = [name for name in names if row.get(name) in (None, "")]
+    if missing:
+        raise RowError(f"Missing required fields: {', '.join(missing)}")
+
+
+def _integer(row, name, default=None):
+    value = row.get(name, default)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"'{name}' must be an integer")
+
+
+def _number(row, name):
+    value = row.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"'{name}' must be a number")
+
+
+# Streams subject/chapter/quiz/question rows into the database. Parents are resolved by
+# id or by name (subject -> chapter -> quiz) and reused if they already exist. Questions
+# are buffered and written with executemany inserts, one transaction per chunk.
+class CatalogImporter():
+    def __init__(self, chunk_size=1000, on_commit=None):
+        self.chunk_size = chunk_size
+        self.on_commit = on_commit
+        self.subjects = {}
+        self.chapters = {}
+        self.quizzes = {}
+        self.known = set()
+        self.questions = []
+        self.pending = 0
+        self.rows = 0
+        self.created = {"subject": 0, "chapter": 0, "quiz": 0, "question": 0}
+        self.uncommitted = dict.fromkeys(self.created, 0)
+        self.errors = []
+        self.error_count = 0
+
+    def run(self, rows):
+        start = perf_counter()
+        self.reset()
+        for line_no, row in rows:
+            self.rows += 1
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                self.add(row)
+                if self.pending >= self.chunk_size:
+                    self.flush()
+            except RowError as e:
+                self.error(line_no, str(e))
+            except Exception as e:
+                self.rollback(line_no, e)
+        try:
+            self.flush()
+        except Exception as e:
+            self.rollback(None, e)
+        elapsed = perf_counter() - start
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed else None,
+        }
+
+    # Forget everything since the last commit, used at start and after a rollback
+    def reset(self):
+        self.subjects = {name: subject_id for subject_id, name in db.session.query(Subject.id, Subject.name)}
+        self.chapters = {}
+        self.quizzes = {}
+        self.known = set()
+        self.questions = []
+        self.pending = 0
+        self.uncommitted = dict.fromkeys(self.created, 0)
+
+    def rollback(self, line_no, e):
+        db.session.rollback()
+        self.error(line_no, f"Database error, {self.pending} uncommitted rows rolled back: {e}")
+        self.reset()
+
+    def error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def add(self, row):
+        kind = row.get("type")
+        if kind == "subject":
+            self.subject_id(row, create=True)
+        elif kind == "chapter":
+            self.chapter_id(row, create=True)
+        elif kind == "quiz":
+            self.quiz_id(row, create=True)
+        elif kind == "question":
+            self.add_question(row)
+        else:
+            raise RowError("'type' must be one of subject, chapter, quiz, question")
+
+    def flush(self):
+        if self.questions:
+            db.session.execute(insert(Question), self.questions)
+            self.uncommitted["question"] += len(self.questions)
+            self.questions = []
+        if self.pending:
+            db.session.commit()
+            for kind, count in self.uncommitted.items():
+                self.created[kind] += count
+            self.uncommitted = dict.fromkeys(self.created, 0)
+            self.pending = 0
+            if self.on_commit:
+                self.on_commit()
+
+    # Parent given by id, checked once per id
+    def existing_id(self, model, row, column):
+        pk = _integer(row, column)
+        if (model, pk) not in self.known:
+            if db.session.query(model.id).filter(model.id == pk).first() is None:
+                raise RowError(f"No {model.__tablename__} with id {pk}")
+            self.known.add((model, pk))
+        return pk
+
+    def subject_id(self, row, create=False):
+        if not create and row.get("subject_id") is not None:
+            return self.existing_id(Subject, row, "subject_id")
+        name = row.get("name") if create else row.get("subject")
+        if not name:
+            raise RowError("Missing subject name" if create else "Missing 'subject' or 'subject_id'")
+        subject_id = self.subjects.get(name)
+        if subject_id is None:
+            if not create:
+                raise RowError(f"Unknown subject '{name}'")
+            _required(row, "description", "image_url")
+            subject_id = db.session.execute(insert(Subject).values(
+                name=name, description=row["description"], image_url=row["image_url"])).inserted_primary_key[0]
+            self.subjects[name] = subject_id
+            self.uncommitted["subject"] += 1
+            self.pending += 1
+        return subject_id
+
+    def chapter_id(self, row, create=False):
+        if not create and row.get("chapter_id") is not None:
+            return self.existing_id(Chapter, row, "chapter_id")
+        name = row.get("name") if create else row.get("chapter")
+        if not name:
+            raise RowError("Missing chapter name" if create else "Missing 'chapter' or 'chapter_id'")
+        subject_id = self.subject_id(row)
+        key = (subject_id, name)
+        if key not in self.chapters:
+            existing = db.session.query(Chapter.id).join(subject_chapter_association).filter(
+                subject_chapter_association.c.subject_id == subject_id, Chapter.name == name).first()
+            if existing:
+                self.chapters[key] = existing[0]
+            elif not create:
+                raise RowError(f"Unknown chapter '{name}'")
+            else:
+                _required(row, "description")
+                chapter_id = db.session.execute(insert(Chapter).values(
+                    name=name, description=row["description"])).inserted_primary_key[0]
+                db.session.execute(insert(subject_chapter_association).values(subject_id=subject_id, chapter_id=chapter_id))
+                self.chapters[key] = chapter_id
+                self.uncommitted["chapter"] += 1
+                self.pending += 1
+        return self.chapters[key]
+
+    def quiz_id(self, row, create=False):
+        if not create and row.get("quiz_id") is not None:
+            return self.existing_id(Quiz, row, "quiz_id")
+        name = row.get("name") if create else row.get("quiz")
+        if not name:
+            raise RowError("Missing quiz name" if create else "Missing 'quiz' or 'quiz_id'")
+        chapter_id = self.chapter_id(row)
+        key = (chapter_id, name)
+        if key not in self.quizzes:
+            existing = db.session.query(Quiz.id).filter(Quiz.chapter_id == chapter_id, Quiz.name == name).first()
+            if existing:
+                self.quizzes[key] = existing[0]
+            elif not create:
+                raise RowError(f"Unknown quiz '{name}'")
+            else:
+                _required(row, "description", "total_marks")
+                try:
+                    pool = pool_settings(row.get("pool_size"), row.get("pool_strata"), row.get("shuffle_options") or False)
+                except ValueError as e:
+                    raise RowError(str(e))
+                quiz_id = db.session.execute(insert(Quiz).values(
+                    name=name, description=row["description"], chapter_id=chapter_id,
+                    total_marks=_integer(row, "total_marks"), time_limit=_integer(row, "time_limit", 30), **pool)).inserted_primary_key[0]
+                self.quizzes[key] = quiz_id
+                self.uncommitted["quiz"] += 1
+                self.pending += 1
+        return self.quizzes[key]
+
+    def add_question(self, row):
+        _required(row, "question_statement", "ans_type", "marks")
+        ans_type = ANS_TYPES.get(row["ans_type"])
+        if ans_type is None:
+            raise RowError("'ans_type' must be single, multiple or numeric")
+        question = {
+            "quiz_id": self.quiz_id(row),
+            "question_statement": row["question_statement"],
+            "ans_type": TYPE_NAMES[ans_type],
+            "options": None,
+            "correct_options": None,
+            "correct_min": None,
+            "correct_max": None,
+            "marks": _integer(row, "marks"),
+        }
+        if ans_type in (SINGLE, MULTIPLE):
+            _required(row, "options", "correct_options")
+            if not isinstance(row["options"], list) or not isinstance(row["correct_options"], list):
+                raise RowError("'options' and 'correct_options' must be lists")
+            if ans_type == SINGLE and len(row["correct_options"]) != 1:
+                raise RowError("Single choice questions need exactly one correct option")
+            question["options"] = row["options"]
+            question["correct_options"] = row["correct_options"]
+        elif ans_type == NUMERIC:
+            question["correct_min"] = _number(row, "correct_min")
+            question["correct_max"] = _number(row, "correct_max")
+            if question["correct_min"] is None and question["correct_max"] is None:
+                raise RowError("Numeric questions need 'correct_min' and/or 'correct_max'")
+        self.questions.append(question)
+        self.pending += 1
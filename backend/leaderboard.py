@@ -0,0 +1,204 @@
+from sqlalchemy import case, delete, func, insert, select, tuple_, update, and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import Attempt, User, QuizStats, QuizScoreCount, QuizBestScore, db
+
+
+def upsert(model):
+    dialect = postgresql if db.session.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def _greatest(column, value):
+    return case((column < value, value), else_=column)
+
+
+def _least(column, value):
+    return case((column > value, value), else_=column)
+
+
+# Folds one graded attempt into the per-quiz aggregates, in the caller's transaction
+def record_attempt(quiz_id, student_id, score):
+    previous = db.session.execute(select(QuizBestScore.best_score).where(
+        QuizBestScore.quiz_id == quiz_id, QuizBestScore.student_id == student_id)).scalar()
+    new_student = previous is None
+    if new_student:
+        db.session.execute(insert(QuizBestScore).values(quiz_id=quiz_id, student_id=student_id, best_score=score, attempt_count=1))
+    else:
+        db.session.execute(update(QuizBestScore).where(
+            QuizBestScore.quiz_id == quiz_id, QuizBestScore.student_id == student_id
+        ).values(best_score=_greatest(QuizBestScore.best_score, score), attempt_count=QuizBestScore.attempt_count + 1))
+
+    # The student's best score moves up to this one, or is new
+    improved = new_student or score > previous
+    db.session.execute(
+        upsert(QuizScoreCount).values(quiz_id=quiz_id, score=score, count=1, best_count=1 if improved else 0)
+        .on_conflict_do_update(index_elements=["quiz_id", "score"], set_={
+            "count": QuizScoreCount.count + 1,
+            "best_count": QuizScoreCount.best_count + (1 if improved else 0),
+        })
+    )
+    if improved and not new_student:
+        db.session.execute(update(QuizScoreCount).where(QuizScoreCount.quiz_id == quiz_id, QuizScoreCount.score == previous)
+                           .values(best_count=QuizScoreCount.best_count - 1))
+    db.session.execute(
+        upsert(QuizStats).values(quiz_id=quiz_id, attempt_count=1, student_count=1, score_sum=score, min_score=score, max_score=score)
+        .on_conflict_do_update(index_elements=["quiz_id"], set_={
+            "attempt_count": QuizStats.attempt_count + 1,
+            "student_count": QuizStats.student_count + (1 if new_student else 0),
+            "score_sum": QuizStats.score_sum + score,
+            "min_score": _least(QuizStats.min_score, score),
+            "max_score": _greatest(QuizStats.max_score, score),
+        })
+    )
+
+
+# record_attempt for a batch of (quiz_id, student_id, score), folded in memory first so each
+# aggregate table gets one executemany upsert however many attempts the batch holds
+def record_attempts(attempts):
+    pairs = {(quiz_id, student_id) for quiz_id, student_id, _ in attempts}
+    previous = {(quiz_id, student_id): best_score for quiz_id, student_id, best_score in db.session.execute(
+        select(QuizBestScore.quiz_id, QuizBestScore.student_id, QuizBestScore.best_score).where(
+            tuple_(QuizBestScore.quiz_id, QuizBestScore.student_id).in_(pairs)))}
+    best, counts, stats = {}, {}, {}
+    for quiz_id, student_id, score in attempts:
+        row = best.setdefault((quiz_id, student_id), {"quiz_id": quiz_id, "student_id": student_id, "best_score": score, "attempt_count": 0})
+        row["best_score"] = max(row["best_score"], score)
+        row["attempt_count"] += 1
+        count = counts.setdefault((quiz_id, score), {"quiz_id": quiz_id, "score": score, "count": 0, "best_count": 0})
+        count["count"] += 1
+        quiz = stats.setdefault(quiz_id, {"quiz_id": quiz_id, "attempt_count": 0, "student_count": 0,
+                                          "score_sum": 0, "min_score": score, "max_score": score})
+        quiz["attempt_count"] += 1
+        quiz["score_sum"] += score
+        quiz["min_score"] = min(quiz["min_score"], score)
+        quiz["max_score"] = max(quiz["max_score"], score)
+    # Each student's best score moves at most once per batch: off the stored one, onto the batch's best
+    for (quiz_id, student_id), row in best.items():
+        old = previous.get((quiz_id, student_id))
+        if old is None:
+            stats[quiz_id]["student_count"] += 1
+        elif row["best_score"] > old:
+            counts.setdefault((quiz_id, old), {"quiz_id": quiz_id, "score": old, "count": 0, "best_count": 0})["best_count"] -= 1
+        if old is None or row["best_score"] > old:
+            counts[(quiz_id, row["best_score"])]["best_count"] += 1
+
+    statement = upsert(QuizBestScore)
+    db.session.execute(statement.on_conflict_do_update(index_elements=["quiz_id", "student_id"], set_={
+        "best_score": _greatest(QuizBestScore.best_score, statement.excluded.best_score),
+        "attempt_count": QuizBestScore.attempt_count + statement.excluded.attempt_count,
+    }), list(best.values()))
+    statement = upsert(QuizScoreCount)
+    db.session.execute(statement.on_conflict_do_update(index_elements=["quiz_id", "score"], set_={
+        "count": QuizScoreCount.count + statement.excluded.count,
+        "best_count": QuizScoreCount.best_count + statement.excluded.best_count,
+    }), list(counts.values()))
+    statement = upsert(QuizStats)
+    db.session.execute(statement.on_conflict_do_update(index_elements=["quiz_id"], set_={
+        "attempt_count": QuizStats.attempt_count + statement.excluded.attempt_count,
+        "student_count": QuizStats.student_count + statement.excluded.student_count,
+        "score_sum": QuizStats.score_sum + statement.excluded.score_sum,
+        "min_score": _least(QuizStats.min_score, statement.excluded.min_score),
+        "max_score": _greatest(QuizStats.max_score, statement.excluded.max_score),
+    }), list(stats.values()))
+
+
+# Sets quiz_score_count.best_count from quiz_best_score, on tables so migrations can use it too
+def best_counts(score_counts, best_scores, quiz_ids=None):
+    statement = update(score_counts).values(best_count=select(func.count()).where(
+        best_scores.c.quiz_id == score_counts.c.quiz_id, best_scores.c.best_score == score_counts.c.score).scalar_subquery())
+    return statement if quiz_ids is None else statement.where(score_counts.c.quiz_id.in_(quiz_ids))
+
+
+# Recomputes the aggregates from the attempt table, for the given quizzes or all of them. Caller commits.
+def rebuild(quiz_ids=None):
+    def scoped(statement, column):
+        return statement if quiz_ids is None else statement.where(column.in_(quiz_ids))
+
+    for model in (QuizBestScore, QuizScoreCount, QuizStats):
+        db.session.execute(scoped(delete(model), model.quiz_id))
+
+    graded = Attempt.student_id.isnot(None)
+    db.session.execute(insert(QuizBestScore).from_select(
+        ["quiz_id", "student_id", "best_score", "attempt_count"],
+        scoped(select(Attempt.quiz_id, Attempt.student_id, func.max(Attempt.score), func.count())
+               .where(graded).group_by(Attempt.quiz_id, Attempt.student_id), Attempt.quiz_id)))
+    db.session.execute(insert(QuizScoreCount).from_select(
+        ["quiz_id", "score", "count"],
+        scoped(select(Attempt.quiz_id, Attempt.score, func.count())
+               .where(graded).group_by(Attempt.quiz_id, Attempt.score), Attempt.quiz_id)))
+    db.session.execute(best_counts(QuizScoreCount.__table__, QuizBestScore.__table__, quiz_ids))
+    db.session.execute(insert(QuizStats).from_select(
+        ["quiz_id", "attempt_count", "student_count", "score_sum", "min_score", "max_score"],
+        scoped(select(Attempt.quiz_id, func.count(), func.count(func.distinct(Attempt.student_id)),
+                      func.sum(Attempt.score), func.min(Attempt.score), func.max(Attempt.score))
+               .where(graded).group_by(Attempt.quiz_id), Attempt.quiz_id)))
+
+
+# Mean and median straight from the aggregates; the median walks the score histogram,
+# which has at most total_marks + 1 rows.
+def quiz_summary(quiz_id):
+    stats = db.session.get(QuizStats, quiz_id)
+    if not stats or not stats.attempt_count:
+        return {"quiz_id": quiz_id, "attempt_count": 0, "student_count": 0,
+                "mean": None, "median": None, "min_score": None, "max_score": None}
+    histogram = db.session.query(QuizScoreCount.score, QuizScoreCount.count).filter(
+        QuizScoreCount.quiz_id == quiz_id).order_by(QuizScoreCount.score).all()
+    total = stats.attempt_count
+    lower_index, upper_index = (total - 1) // 2, total // 2
+    seen = 0
+    lower = upper = None
+    for score, count in histogram:
+        if lower is None and seen + count > lower_index:
+            lower = score
+        if seen + count > upper_index:
+            upper = score
+            break
+        seen += count
+    return {
+        "quiz_id": quiz_id,
+        "attempt_count": total,
+        "student_count": stats.student_count,
+        "mean": round(stats.score_sum / total, 2),
+        "median": (lower + upper) / 2 if lower is not None and upper is not None else None,
+        "min_score": stats.min_score,
+        "max_score": stats.max_score,
+    }
+
+
+# One page of best scores, highest first. after is the (best_score, student_id) of the
+# last row of the previous page. Ranks use competition ranking (1, 2, 2, 4).
+def leaderboard_page(quiz_id, limit, after=None):
+    query = db.session.query(
+        QuizBestScore.student_id, User.name, QuizBestScore.best_score, QuizBestScore.attempt_count
+    ).join(User, User.id == QuizBestScore.student_id).filter(QuizBestScore.quiz_id == quiz_id)
+    if after is not None:
+        score, student_id = after
+        query = query.filter(or_(QuizBestScore.best_score < score,
+                                 and_(QuizBestScore.best_score == score, QuizBestScore.student_id > student_id)))
+    rows = query.order_by(QuizBestScore.best_score.desc(), QuizBestScore.student_id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].best_score}:{rows[-1].student_id}"
+    if not rows:
+        return [], None
+
+    stats = db.session.get(QuizStats, quiz_id)
+    students = stats.student_count if stats else len(rows)
+    # A score's rank is 1 + the students above it, whatever page the tie started on, read off
+    # the score histogram (at most total_marks + 1 rows) rather than counting the students
+    above = db.session.query(QuizScoreCount.score, QuizScoreCount.best_count).filter(
+        QuizScoreCount.quiz_id == quiz_id, QuizScoreCount.score > rows[-1].best_score, QuizScoreCount.best_count > 0).all()
+    ranks = {score: 1 + sum(count for higher, count in above if higher > score) for score in {row.best_score for row in rows}}
+    page = []
+    for student_id, name, best_score, attempt_count in rows:
+        rank = ranks[best_score]
+        page.append({
+            "rank": rank,
+            "student_id": student_id,
+            "name": name,
+            "best_score": best_score,
+            "attempt_count": attempt_count,
+            "percentile": round(100 * (students - rank + 1) / students, 2) if students else None,
+        })
+    return page, next_cursor
@@ -0,0 +1,162 @@
+from datetime import datetime
+from uuid import uuid4
+from sqlalchemy import bindparam, func, insert, inspect, select, update
+from .models import (Attempt, CatalogVersion, Chapter, Question, Quiz, QuizBestScore, QuizScoreCount, QuizSession, Response, UserRoles,
+                     db, subject_chapter_association)
+from .leaderboard import best_counts
+from . import search
+
+# db.create_all() only creates missing tables, so anything that changes an existing
+# table goes here as a numbered migration. Applied versions are recorded in
+# schema_migration and each migration runs in its own transaction.
+schema_migration = db.Table("schema_migration",
+    db.Column("version", db.Integer, primary_key=True),
+    db.Column("name", db.String, nullable=False),
+    db.Column("applied_at", db.DateTime, nullable=False))
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def register(apply):
+        MIGRATIONS.append((version, name, apply))
+        return apply
+    return register
+
+
+def _create_model_indexes(connection):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+@migration(1, "Unique attempt numbers and lookup indexes")
+def _lookup_indexes(connection):
+    # Attempts numbered before allocation was atomic may collide; renumber those
+    # (student, quiz) histories in id order so the unique index can be built.
+    attempts = Attempt.__table__
+    duplicated = connection.execute(
+        select(attempts.c.student_id, attempts.c.quiz_id)
+        .group_by(attempts.c.student_id, attempts.c.quiz_id, attempts.c.attempt_number)
+        .having(func.count() > 1)
+    ).all()
+    renumber = update(attempts).where(attempts.c.id == bindparam("attempt_id")).values(attempt_number=bindparam("number"))
+    for student_id, quiz_id in set(duplicated):
+        attempt_ids = connection.execute(
+            select(attempts.c.id).where(attempts.c.student_id == student_id, attempts.c.quiz_id == quiz_id)
+            .order_by(attempts.c.attempt_number, attempts.c.id)
+        ).scalars().all()
+        connection.execute(renumber, [{"attempt_id": attempt_id, "number": -number} for number, attempt_id in enumerate(attempt_ids, start=1)])
+        connection.execute(renumber, [{"attempt_id": attempt_id, "number": number} for number, attempt_id in enumerate(attempt_ids, start=1)])
+    _create_model_indexes(connection)
+
+
+@migration(2, "Full-text search index")
+def _search_index(connection):
+    # FTS5 is SQLite only; elsewhere search falls back to LIKE scans
+    if search.available(connection):
+        search.create_index(connection)
+        search.rebuild(connection)
+
+
+@migration(3, "Foreign key indexes and orphan cleanup for database cascades")
+def _database_cascades(connection):
+    # Deletes used to cascade in the ORM, which missed the aggregate tables, and SQLite did not
+    # enforce foreign keys, so rows may point at parents that are gone. Remove them the way the
+    # ON DELETE action would have (or null the reference for SET NULL) before relying on cascades.
+    _create_model_indexes(connection)
+    if connection.dialect.name != "sqlite":
+        return
+    for table, rowid, _, fk_id in connection.exec_driver_sql("PRAGMA foreign_key_check").all():
+        foreign_keys = {row[0]: row for row in connection.exec_driver_sql(f'PRAGMA foreign_key_list("{table}")')}
+        _, _, _, column, _, _, on_delete, _ = foreign_keys[fk_id]
+        if on_delete == "SET NULL":
+            connection.exec_driver_sql(f'UPDATE "{table}" SET "{column}" = NULL WHERE rowid = ?', (rowid,))
+        else:
+            connection.exec_driver_sql(f'DELETE FROM "{table}" WHERE rowid = ?', (rowid,))
+
+
+# create_all adds new columns to new databases, existing tables need the ALTER
+def _add_columns(connection, table, columns):
+    existing = {column["name"] for column in inspect(connection).get_columns(table)}
+    for name, definition in columns.items():
+        if name not in existing:
+            connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+@migration(4, "Packed answers column on attempt")
+def _packed_answers(connection):
+    _add_columns(connection, "attempt", {"packed_answers": "BLOB"})
+
+
+@migration(5, "Question pools")
+def _question_pools(connection):
+    _add_columns(connection, "quiz", {"pool_size": "INTEGER", "pool_strata": "VARCHAR",
+                                      "shuffle_options": "BOOLEAN NOT NULL DEFAULT 0"})
+    _add_columns(connection, "attempt", {"paper_seed": "BIGINT"})
+    _add_columns(connection, "submission", {"paper_seed": "BIGINT"})
+
+
+@migration(6, "Shared catalog version")
+def _catalog_version(connection):
+    table = CatalogVersion.__table__
+    table.create(connection, checkfirst=True)
+    if connection.execute(select(table.c.id).where(table.c.id == 1)).first() is None:
+        connection.execute(insert(table).values(id=1, epoch=uuid4().hex[:8], version=0))
+
+
+@migration(7, "Best score counts for leaderboard ranks")
+def _best_score_counts(connection):
+    _add_columns(connection, "quiz_score_count", {"best_count": "INTEGER NOT NULL DEFAULT 0"})
+    connection.execute(best_counts(QuizScoreCount.__table__, QuizBestScore.__table__))
+
+
+def applied_versions(connection):
+    schema_migration.create(connection, checkfirst=True)
+    return set(connection.execute(select(schema_migration.c.version)).scalars())
+
+
+# Creates missing tables, applies pending migrations in order and returns the names of the ones that ran
+def upgrade(engine=None):
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        # Tables added since the database was made: the migrations alter and index the
+        # existing ones and expect the rest of the current schema to be there
+        db.metadata.create_all(connection)
+        applied = applied_versions(connection)
+    ran = []
+    for version, name, apply in sorted(MIGRATIONS, key=lambda item: item[0]):
+        if version in applied:
+            continue
+        with engine.begin() as connection:
+            apply(connection)
+            connection.execute(insert(schema_migration).values(version=version, name=name, applied_at=datetime.now()))
+        ran.append(f"{version}: {name}")
+    return ran
+
+
+def hot_queries():
+    return [
+        ("attempt history", select(Attempt.id).where(Attempt.student_id == 1, Attempt.quiz_id == 1).order_by(Attempt.attempt_number.desc())),
+        ("responses of attempt", select(Response.id).where(Response.attempt_id == 1)),
+        ("questions of quiz", select(Question.id).where(Question.quiz_id == 1)),
+        ("quizzes of chapter", select(Quiz.id).where(Quiz.chapter_id == 1)),
+        ("chapters of subject", select(Chapter.id).join(subject_chapter_association, subject_chapter_association.c.chapter_id == Chapter.id)
+            .where(subject_chapter_association.c.subject_id == 1)),
+        ("roles of user", select(UserRoles.role_id).where(UserRoles.user_id == 1)),
+        ("open quiz session", select(QuizSession.id).where(QuizSession.student_id == 1, QuizSession.quiz_id == 1, QuizSession.status == "active")),
+        ("overdue quiz sessions", select(QuizSession.id).where(QuizSession.status == "active", QuizSession.expires_at <= "2000-01-01")
+            .order_by(QuizSession.expires_at).limit(500)),
+    ]
+
+
+# EXPLAIN QUERY PLAN for the hot lookups. A query is fine when it never falls back to a
+# full table SCAN or a temporary b-tree for sorting. SQLite only.
+def explain_hot_queries(connection):
+    report = []
+    for name, statement in hot_queries():
+        sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+        plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+        indexed = not any((step.startswith("SCAN") and "INDEX" not in step) or "TEMP B-TREE" in step for step in plan)
+        report.append({"query": name, "plan": plan, "indexed": indexed})
+    return report
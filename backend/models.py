@@ -5,6 +5,11 @@ from sqlalchemy.dialects.sqlite import JSON
 
 db = SQLAlchemy()
 
+# Deletes cascade in the database: every foreign key has ON DELETE CASCADE (SQLite enforces
+# them through PRAGMA foreign_keys, see backend/database.py) and the relationships use
+# passive_deletes, so deleting a parent is one DELETE instead of loading every child row.
+# Every foreign key column is indexed, otherwise each cascade would scan the child table.
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
@@ -13,7 +18,7 @@ class User(db.Model, UserMixin):
     fs_uniquifier= db.Column(db.String, unique = True, nullable=False)
     active = db.Column(db.Boolean, default=True)
     roles = db.relationship("Role", backref="bearers", secondary="user_roles") # type: ignore
-    attempts = db.relationship("Attempt", cascade="all, delete-orphan", backref="user")
+    attempts = db.relationship("Attempt", cascade="all, delete-orphan", passive_deletes=True, backref="user")
     
 class Role(db.Model, RoleMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -23,39 +28,45 @@ class Role(db.Model, RoleMixin):
 class UserRoles(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete='CASCADE'))
-    role_id = db.Column(db.Integer, db.ForeignKey("role.id", ondelete='CASCADE'))
+    role_id = db.Column(db.Integer, db.ForeignKey("role.id", ondelete='CASCADE'), index=True)
+    __table_args__ = (db.Index("ix_user_roles_user_role", "user_id", "role_id"),)
     
 subject_chapter_association = db.Table("subject_chapter_association",
     db.Column("subject_id", db.Integer, db.ForeignKey("subject.id", ondelete="CASCADE"), primary_key=True),
-    db.Column("chapter_id", db.Integer, db.ForeignKey("chapter.id", ondelete="CASCADE"), primary_key=True))
+    db.Column("chapter_id", db.Integer, db.ForeignKey("chapter.id", ondelete="CASCADE"), primary_key=True, index=True))
 
 class Subject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
     description = db.Column(db.Text)
     image_url = db.Column(db.String, nullable=False)
-    chapters = db.relationship("Chapter", secondary=subject_chapter_association, back_populates="subjects")
+    chapters = db.relationship("Chapter", secondary=subject_chapter_association, back_populates="subjects", passive_deletes=True)
 
 class Chapter(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     description = db.Column(db.Text)
-    subjects = db.relationship("Subject", secondary=subject_chapter_association, back_populates="chapters")
-    quizzes = db.relationship("Quiz", cascade = "all, delete-orphan", backref="chapter")
+    subjects = db.relationship("Subject", secondary=subject_chapter_association, back_populates="chapters", passive_deletes=True)
+    quizzes = db.relationship("Quiz", cascade = "all, delete-orphan", passive_deletes=True, backref="chapter")
 
 class Quiz(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='CASCADE'))
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='CASCADE'), index=True)
     name = db.Column(db.String, nullable=False)
     description = db.Column(db.Text)
     total_marks = db.Column(db.Integer, nullable=False)
     time_limit = db.Column(db.Integer, default=30)
-    questions = db.relationship("Question", cascade = "all, delete-orphan", backref="quiz")
-    attempt = db.relationship("Attempt", cascade = "all, delete-orphan", backref="quiz")
+    # Question pool, see backend/pools.py: questions drawn per attempt (all when null), how the
+    # draw is stratified (ans_type, marks or null) and whether choice options are shuffled
+    pool_size = db.Column(db.Integer)
+    pool_strata = db.Column(db.String)
+    shuffle_options = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    questions = db.relationship("Question", cascade = "all, delete-orphan", passive_deletes=True, backref="quiz")
+    attempt = db.relationship("Attempt", cascade = "all, delete-orphan", passive_deletes=True, backref="quiz")
     
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'))
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), index=True)
     question_statement = db.Column(db.Text, nullable=False)
     ans_type = db.Column(db.String, nullable=False)  # 'single', 'multiple', 'numeric'
     options = db.Column(db.JSON, nullable=True)  # Only for single/multiple-choice questions
@@ -63,7 +74,7 @@ class Question(db.Model):
     correct_min = db.Column(db.Float, nullable=True)  # Only for numerical answers
     correct_max = db.Column(db.Float, nullable=True)  # Only for numerical answers
     marks = db.Column(db.Integer, nullable=False)
-    responses = db.relationship("Response", cascade = "all,delete-orphan", backref = "question")
+    responses = db.relationship("Response", cascade = "all,delete-orphan", passive_deletes=True, backref = "question")
 
 
 class Attempt(db.Model):
@@ -71,15 +82,119 @@ class Attempt(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'))
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'))
     attempt_number = db.Column(db.Integer, nullable=False)
-    attempt_date = db.Column(db.DateTime, default=datetime.now())
+    attempt_date = db.Column(db.DateTime, default=datetime.now)
     score = db.Column(db.Integer, default=0)
-    responses = db.relationship('Response', backref='attempt', cascade='all, delete-orphan')
+    # All answers of the attempt in one blob when RESPONSE_STORAGE=packed, see backend/packing.py
+    packed_answers = db.deferred(db.Column(db.LargeBinary))
+    # Seed of the question paper drawn for this attempt, null when the quiz had no pool
+    paper_seed = db.Column(db.BigInteger)
+    responses = db.relationship('Response', backref='attempt', cascade='all, delete-orphan', passive_deletes=True)
+    # Serves the (student, quiz) history ordered by attempt_number and keeps numbers unique
+    __table_args__ = (db.Index("uq_attempt_number", "student_id", "quiz_id", "attempt_number", unique=True),
+                      db.Index("ix_attempt_quiz_id", "quiz_id"))
     
     
 
 class Response(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    attempt_id = db.Column(db.Integer, db.ForeignKey('attempt.id', ondelete='CASCADE'), nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), nullable=False)
+    attempt_id = db.Column(db.Integer, db.ForeignKey('attempt.id', ondelete='CASCADE'), nullable=False, index=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), nullable=False, index=True)
     answer = db.Column(db.JSON)  # Can store multiple selected options or numeric input
-    is_correct = db.Column(db.Boolean, default=False)
\ No newline at end of file
+    is_correct = db.Column(db.Boolean, default=False)
+
+# A single row, the version of the catalog (subjects, chapters, quizzes, questions) shared by
+# every worker, see CatalogCache in backend/catalog.py. epoch is random per database, so
+# ETags of a rebuilt database never match old ones.
+class CatalogVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    epoch = db.Column(db.String(16), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Aggregates maintained at grading time, see backend/leaderboard.py
+class QuizStats(db.Model):
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), primary_key=True)
+    attempt_count = db.Column(db.Integer, nullable=False, default=0)
+    student_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)
+    min_score = db.Column(db.Integer)
+    max_score = db.Column(db.Integer)
+
+# Per score: attempts with it (count) and students whose best score it is (best_count)
+class QuizScoreCount(db.Model):
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    best_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+class QuizBestScore(db.Model):
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    best_score = db.Column(db.Integer, nullable=False)
+    attempt_count = db.Column(db.Integer, nullable=False, default=1)
+    __table_args__ = (db.Index("ix_quiz_best_score_rank", "quiz_id", "best_score", "student_id"),
+                      db.Index("ix_quiz_best_score_student", "student_id"))
+
+# Per-question counters maintained at grading time, see backend/analytics.py
+class QuestionStats(db.Model):
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), index=True)
+    response_count = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    blank_count = db.Column(db.Integer, nullable=False, default=0)
+    # Attempt totals of everyone / of correct responders, for the point-biserial discrimination index
+    score_sum = db.Column(db.Float, nullable=False, default=0)
+    score_sq_sum = db.Column(db.Float, nullable=False, default=0)
+    correct_score_sum = db.Column(db.Float, nullable=False, default=0)
+
+class QuestionAnswerCount(db.Model):
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), primary_key=True)
+    value = db.Column(db.String, primary_key=True)  # option for single/multiple, bucket start for numeric
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+# Submissions waiting for or done with background grading, see backend/submissions.py
+class Submission(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), nullable=False, index=True)
+    answers = db.Column(db.JSON, nullable=False)  # [[question_id, answer], ...] as submitted
+    paper_seed = db.Column(db.BigInteger)  # copied to the attempt
+    status = db.Column(db.String, nullable=False, default="queued")  # queued, grading, graded or failed
+    attempt_id = db.Column(db.Integer, db.ForeignKey('attempt.id', ondelete='SET NULL'), index=True)
+    total_marks = db.Column(db.Integer)
+    error = db.Column(db.String)
+    submitted_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    claimed_at = db.Column(db.DateTime)
+    graded_at = db.Column(db.DateTime)
+    # Workers claim the oldest queued rows, so this is the queue itself
+    __table_args__ = (db.Index("ix_submission_status", "status", "id"),)
+
+# Chunked background deletes of large quizzes and chapters, see backend/purge.py
+class PurgeJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String, nullable=False)  # quiz, chapter or subject
+    target_id = db.Column(db.Integer, nullable=False)  # no foreign key, the target is what gets deleted
+    status = db.Column(db.String, nullable=False, default="queued")  # queued, running, done or failed
+    deleted_rows = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+# Timed quiz sessions when QUIZ_SESSION_STORE=database, see backend/quiz_sessions.py
+class QuizSession(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # random token, handed to the client
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.String, nullable=False, default="active")  # active, submitted or expired
+    answers = db.Column(db.JSON, nullable=False)  # [[question_id, answer], ...] as of the last heartbeat
+    started_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    last_seen_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime)
+    attempt_id = db.Column(db.Integer, db.ForeignKey('attempt.id', ondelete='SET NULL'), index=True)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id', ondelete='SET NULL'), index=True)
+    # The sweep reads the active sessions past their deadline. A student has at most one
+    # open session per quiz, which is also how start finds it.
+    __table_args__ = (db.Index("ix_quiz_session_deadline", "status", "expires_at"),
+                      db.Index("uq_quiz_session_open", "student_id", "quiz_id", unique=True,
+                               sqlite_where=db.text("status = 'active'"), postgresql_where=db.text("status = 'active'")))
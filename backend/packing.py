@@ -0,0 +1,283 @@
+import json
+import struct
+from flask import current_app
+from sqlalchemy import delete, exists, insert, select, update
+from .models import Attempt, Question, Response, db
+from .attempts import allocate_attempt
+
+# Optional compact layout for submitted answers (RESPONSE_STORAGE=packed): instead of one
+# Response row with a JSON answer per question, an attempt keeps all of its answers in one
+# blob on attempt.packed_answers. Both layouts can coexist in a database; readers check
+# packed_answers per attempt, and `flask compact-responses` converts between them.
+#
+# Blob layout, integers are unsigned LEB128 varints:
+#   version, count, first question id (zigzag) then the gaps to the next ones (sorted),
+#   the is_correct bitmap (one bit per position), then one tagged answer per position.
+# The header alone gives question ids and correctness, so answers are only decoded when
+# something reads them.
+VERSION = 1
+NULL, INDICES, INTEGER, FLOAT, JSON = range(5)
+_double = struct.Struct("<d")
+
+
+def _varint(out, value):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(blob, offset):
+    value = shift = 0
+    while True:
+        byte = blob[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+def _encode_answer(out, answer):
+    kind = type(answer)
+    if answer is None:
+        out.append(NULL)
+    elif kind is list and all(type(value) is int and value >= 0 for value in answer):
+        out.append(INDICES)
+        _varint(out, len(answer))
+        for value in answer:
+            _varint(out, value)
+    elif kind is int:
+        out.append(INTEGER)
+        _varint(out, _zigzag(answer))
+    elif kind is float:
+        out.append(FLOAT)
+        out += _double.pack(answer)
+    else:
+        # Option text, bools, mixed lists: whatever the JSON column would have held
+        text = json.dumps(answer, separators=(",", ":")).encode()
+        out.append(JSON)
+        _varint(out, len(text))
+        out += text
+
+
+# entries: (question_id, answer, is_correct), in any order
+def encode(entries):
+    entries = sorted(entries, key=lambda entry: entry[0])
+    out = bytearray((VERSION,))
+    _varint(out, len(entries))
+    previous = None
+    for question_id, _, _ in entries:
+        _varint(out, _zigzag(question_id) if previous is None else question_id - previous)
+        previous = question_id
+    bitmap = bytearray((len(entries) + 7) // 8)
+    for index, (_, _, is_correct) in enumerate(entries):
+        if is_correct:
+            bitmap[index >> 3] |= 1 << (index & 7)
+    out += bitmap
+    for _, answer, _ in entries:
+        _encode_answer(out, answer)
+    return bytes(out)
+
+
+class PackedAnswers():
+    __slots__ = ("blob", "_ids", "_bitmap", "_answers_at", "_answers")
+
+    def __init__(self, blob):
+        self.blob = blob
+        self._ids = None
+        self._answers = None
+
+    def _header(self):
+        blob = self.blob
+        if blob[0] != VERSION:
+            raise ValueError(f"Unknown packed answers version {blob[0]}")
+        count, offset = _read_varint(blob, 1)
+        ids = []
+        previous = None
+        for _ in range(count):
+            value, offset = _read_varint(blob, offset)
+            previous = _unzigzag(value) if previous is None else previous + value
+            ids.append(previous)
+        self._bitmap = blob[offset:offset + (count + 7) // 8]
+        self._answers_at = offset + len(self._bitmap)
+        self._ids = ids
+
+    @property
+    def question_ids(self):
+        if self._ids is None:
+            self._header()
+        return self._ids
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def is_correct(self, index):
+        if self._ids is None:
+            self._header()
+        return bool(self._bitmap[index >> 3] >> (index & 7) & 1)
+
+    @property
+    def answers(self):
+        if self._answers is None:
+            count = len(self.question_ids)
+            blob, offset, answers = self.blob, self._answers_at, []
+            for _ in range(count):
+                tag = blob[offset]
+                offset += 1
+                if tag == NULL:
+                    answers.append(None)
+                elif tag == INDICES:
+                    length, offset = _read_varint(blob, offset)
+                    values = []
+                    for _ in range(length):
+                        value, offset = _read_varint(blob, offset)
+                        values.append(value)
+                    answers.append(values)
+                elif tag == INTEGER:
+                    value, offset = _read_varint(blob, offset)
+                    answers.append(_unzigzag(value))
+                elif tag == FLOAT:
+                    answers.append(_double.unpack_from(blob, offset)[0])
+                    offset += _double.size
+                else:
+                    length, offset = _read_varint(blob, offset)
+                    answers.append(json.loads(blob[offset:offset + length]))
+                    offset += length
+            self._answers = answers
+        return self._answers
+
+    # (question_id, answer, is_correct) in question id order
+    def __iter__(self):
+        for index, (question_id, answer) in enumerate(zip(self.question_ids, self.answers)):
+            yield question_id, answer, self.is_correct(index)
+
+
+# Same blob with a new is_correct bitmap, for regrading. Answers are copied, not decoded.
+def with_results(blob, results):
+    packed = PackedAnswers(blob)
+    count = len(packed)
+    if len(results) != count:
+        raise ValueError("One result per packed answer is required")
+    bitmap = bytearray((count + 7) // 8)
+    for index, is_correct in enumerate(results):
+        if is_correct:
+            bitmap[index >> 3] |= 1 << (index & 7)
+    start = packed._answers_at - len(bitmap)
+    return blob[:start] + bytes(bitmap) + blob[packed._answers_at:]
+
+
+def packed_storage():
+    return current_app.config["RESPONSE_STORAGE"] == "packed"
+
+
+# Allocates the attempt and stores its graded answers in the configured layout.
+# answers is [(question_id, answer), ...]. Caller commits. Returns (attempt_id, attempt_number).
+def save_attempt(student_id, quiz_id, answers, results, score, paper_seed=None):
+    if packed_storage():
+        blob = encode((question_id, answer, is_correct) for (question_id, answer), is_correct in zip(answers, results))
+        return allocate_attempt(student_id, quiz_id, score, blob, paper_seed)
+    attempt_id, attempt_number = allocate_attempt(student_id, quiz_id, score, paper_seed=paper_seed)
+    rows = response_rows(attempt_id, answers, results)
+    if rows:
+        db.session.execute(insert(Response), rows)
+    return attempt_id, attempt_number
+
+
+def response_rows(attempt_id, answers, results):
+    return [{"attempt_id": attempt_id, "question_id": question_id, "answer": answer, "is_correct": is_correct}
+            for (question_id, answer), is_correct in zip(answers, results)]
+
+
+# Stands in for a Response row of a packed attempt. There is no row, so there is no id.
+class PackedResponse():
+    __slots__ = ("id", "attempt_id", "question_id", "answer", "is_correct")
+
+    def __init__(self, attempt_id, question_id, answer, is_correct):
+        self.id = None
+        self.attempt_id = attempt_id
+        self.question_id = question_id
+        self.answer = answer
+        self.is_correct = is_correct
+
+
+# A deleted question takes its Response rows with it but stays in the blobs, so readers of
+# packed answers skip questions the quiz no longer has
+def question_ids_of(quiz_id):
+    return set(db.session.execute(select(Question.id).where(Question.quiz_id == quiz_id)).scalars())
+
+
+# The responses of an attempt in either layout
+def attempt_responses(attempt):
+    if attempt.packed_answers is None:
+        return attempt.responses
+    live = question_ids_of(attempt.quiz_id)
+    return [PackedResponse(attempt.id, question_id, answer, is_correct)
+            for question_id, answer, is_correct in PackedAnswers(attempt.packed_answers) if question_id in live]
+
+
+# Expands rows carrying a blob at position `at` into one row per answer, the blob replaced by
+# (question_id, answer, is_correct). quiz_at is the position of the quiz id, used to skip
+# answers to questions deleted since.
+def expand_rows(rows, at, quiz_at):
+    live = {}
+    for row in rows:
+        quiz_id = row[quiz_at]
+        if quiz_id not in live:
+            live[quiz_id] = question_ids_of(quiz_id)
+        head, tail = tuple(row[:at]), tuple(row[at + 1:])
+        for question_id, answer, is_correct in PackedAnswers(row[at]):
+            if question_id in live[quiz_id]:
+                yield head + (question_id, answer, is_correct) + tail
+
+
+def _attempts_to_convert(quiz_ids, packed):
+    statement = select(Attempt.id).order_by(Attempt.id)
+    if packed:
+        statement = statement.where(Attempt.packed_answers.isnot(None))
+    else:
+        statement = statement.where(Attempt.packed_answers.is_(None), exists().where(Response.attempt_id == Attempt.id))
+    if quiz_ids is not None:
+        statement = statement.where(Attempt.quiz_id.in_(quiz_ids))
+    return db.session.execute(statement).scalars().all()
+
+
+# Moves row-per-answer attempts into blobs, batch_size attempts per transaction. Returns the count.
+def compact(quiz_ids=None, batch_size=500):
+    attempt_ids = _attempts_to_convert(quiz_ids, packed=False)
+    for start in range(0, len(attempt_ids), batch_size):
+        batch = attempt_ids[start:start + batch_size]
+        entries = {attempt_id: [] for attempt_id in batch}
+        for attempt_id, question_id, answer, is_correct in db.session.execute(
+                select(Response.attempt_id, Response.question_id, Response.answer, Response.is_correct)
+                .where(Response.attempt_id.in_(batch)).order_by(Response.id)):
+            entries[attempt_id].append((question_id, answer, bool(is_correct)))
+        db.session.execute(update(Attempt), [{"id": attempt_id, "packed_answers": encode(rows)} for attempt_id, rows in entries.items()])
+        db.session.execute(delete(Response).where(Response.attempt_id.in_(batch)))
+        db.session.commit()
+    return len(attempt_ids)
+
+
+# The reverse of compact, back to one Response row per answer
+def expand(quiz_ids=None, batch_size=500):
+    attempt_ids = _attempts_to_convert(quiz_ids, packed=True)
+    for start in range(0, len(attempt_ids), batch_size):
+        batch = attempt_ids[start:start + batch_size]
+        # Answers to questions deleted since have no row to point at, as in expand_rows
+        packed = db.session.execute(select(Attempt.id, Attempt.quiz_id, Attempt.packed_answers).where(Attempt.id.in_(batch)))
+        rows = [{"attempt_id": attempt_id, "question_id": question_id, "answer": answer, "is_correct": is_correct}
+                for attempt_id, _, question_id, answer, is_correct in expand_rows(packed, 2, 1)]
+        if rows:
+            db.session.execute(insert(Response), rows)
+        db.session.execute(update(Attempt).where(Attempt.id.in_(batch)).values(packed_answers=None),
+                           execution_options={"synchronize_session": False})
+        db.session.commit()
+    return len(attempt_ids)
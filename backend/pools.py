@@ -0,0 +1,209 @@
+from array import array
+from sqlalchemy import select
+from .models import Question, Quiz, db
+from .catalog import catalog_cache
+from .grading import option_key
+
+# Question pools. A quiz with pool_size draws that many of its questions for each attempt,
+# split over strata (pool_strata: ans_type or marks) in proportion to their size, so every
+# paper has the same mix; with shuffle_options the options of choice questions are shown
+# in a per-paper order. A paper is a pure function of the quiz's pool and a 60-bit seed:
+# sessions derive it from their id, and attempts record it as paper_seed, so the paper
+# behind any attempt can be drawn again as long as the pool is unchanged.
+#
+# Students answer with the option positions they were shown. canonical() maps those back to
+# the stored option indices before grading, so responses, regrading, analytics and exports
+# never see a shuffled index.
+STRATA = ("ans_type", "marks")
+_MASK = (1 << 64) - 1
+
+
+# SplitMix64. random.Random's sampling is not guaranteed to stay the same across Python
+# versions, and a stored seed has to give the same paper forever.
+class _Stream():
+    __slots__ = ("state",)
+
+    def __init__(self, seed):
+        self.state = seed & _MASK
+
+    def next(self):
+        self.state = (self.state + 0x9E3779B97F4A7C15) & _MASK
+        z = self.state
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+        return z ^ (z >> 31)
+
+    def below(self, n):
+        return self.next() % n
+
+    # k distinct items, a partial Fisher-Yates over a dict of swapped positions: O(k), not O(len(items))
+    def sample(self, items, k):
+        swapped, chosen = {}, []
+        for i in range(k):
+            j = i + self.below(len(items) - i)
+            chosen.append(items[swapped.get(j, j)])
+            swapped[j] = swapped.get(i, i)
+        return chosen
+
+    def shuffle(self, items):
+        for i in range(len(items) - 1, 0, -1):
+            j = self.below(i + 1)
+            items[i], items[j] = items[j], items[i]
+        return items
+
+
+# What drawing needs to know about a quiz, built once per catalog version: question ids per
+# stratum, the number of questions each stratum contributes to a paper, and the option count
+# and marks of every question. Drawing never reads the question table.
+class PoolIndex():
+    __slots__ = ("quiz_id", "pool_size", "shuffle_options", "strata", "quotas", "option_counts", "marks")
+
+    def __init__(self, quiz_id, pool_size, strata_by, shuffle_options, rows):
+        self.quiz_id = quiz_id
+        self.shuffle_options = bool(shuffle_options)
+        grouped = {}
+        self.option_counts = {}
+        self.marks = {}
+        for question_id, ans_type, marks, options in rows:
+            key = {"ans_type": ans_type, "marks": marks}.get(strata_by, "")
+            grouped.setdefault(str(key), array("q")).append(question_id)
+            self.option_counts[question_id] = len(options) if isinstance(options, list) else 0
+            self.marks[question_id] = marks or 0
+        self.strata = [grouped[key] for key in sorted(grouped)]
+        total = len(self.marks)
+        self.pool_size = min(pool_size, total) if pool_size else None
+        self.quotas = self._quotas(self.pool_size if self.pool_size is not None else total, total)
+
+    # Largest remainder apportionment, ties to the earlier stratum, so it is the same for every paper
+    def _quotas(self, size, total):
+        if not total:
+            return [0] * len(self.strata)
+        exact = [size * len(ids) / total for ids in self.strata]
+        quotas = [int(share) for share in exact]
+        by_remainder = sorted(range(len(exact)), key=lambda index: (quotas[index] - exact[index], index))
+        for index in by_remainder[:size - sum(quotas)]:
+            quotas[index] += 1
+        return quotas
+
+    @property
+    def randomized(self):
+        return self.pool_size is not None or self.shuffle_options
+
+    def paper(self, seed):
+        if not self.randomized:
+            return Paper(self.quiz_id, None, sorted(self.marks), {}, sum(self.marks.values()))
+        stream = _Stream(seed)
+        if self.pool_size is None:
+            question_ids = sorted(self.marks)
+        else:
+            question_ids = [question_id for ids, quota in zip(self.strata, self.quotas) for question_id in stream.sample(ids, quota)]
+            stream.shuffle(question_ids)
+        orders = {}
+        if self.shuffle_options:
+            for question_id in question_ids:
+                count = self.option_counts[question_id]
+                if count > 1:
+                    orders[question_id] = tuple(stream.shuffle(list(range(count))))
+        return Paper(self.quiz_id, seed, question_ids, orders, sum(self.marks[question_id] for question_id in question_ids))
+
+
+# The questions of one attempt in the order shown. orders[question_id][shown position] is
+# the stored index of that option. Quizzes without a pool give every question in id order
+# and no seed.
+class Paper():
+    __slots__ = ("quiz_id", "seed", "question_ids", "orders", "total_marks")
+
+    def __init__(self, quiz_id, seed, question_ids, orders, total_marks):
+        self.quiz_id = quiz_id
+        self.seed = seed
+        self.question_ids = question_ids
+        self.orders = orders
+        self.total_marks = total_marks
+
+    # Answers as shown -> answers as stored. Answers to questions not on the paper are dropped.
+    def canonical(self, answers):
+        drawn = set(self.question_ids)
+        return [(question_id, self._unshuffle(question_id, answer)) for question_id, answer in answers if question_id in drawn]
+
+    def _unshuffle(self, question_id, answer):
+        order = self.orders.get(question_id)
+        if order is None or answer is None:
+            return answer
+        if isinstance(answer, (list, tuple)):
+            return [self._position(order, value) for value in answer]
+        return self._position(order, answer)
+
+    @staticmethod
+    def _position(order, value):
+        # Option text is left alone, positions are mapped
+        key = option_key(value)
+        return order[key] if type(key) is int and 0 <= key < len(order) else value
+
+
+# Validated pool columns for a quiz from request or import values. Raises ValueError.
+def pool_settings(pool_size=None, pool_strata=None, shuffle_options=False):
+    if pool_size in (None, ""):
+        pool_size = None
+    else:
+        try:
+            pool_size = int(pool_size)
+        except (TypeError, ValueError):
+            pool_size = 0
+        if pool_size < 1:
+            raise ValueError("'pool_size' must be a positive integer")
+    if pool_strata in (None, ""):
+        pool_strata = None
+    elif pool_strata not in STRATA:
+        raise ValueError(f"'pool_strata' must be one of {', '.join(STRATA)}")
+    if isinstance(shuffle_options, str):
+        shuffle_options = shuffle_options.strip().lower() in ("1", "true", "yes")
+    return {"pool_size": pool_size, "pool_strata": pool_strata, "shuffle_options": bool(shuffle_options)}
+
+
+def _build(quiz_id):
+    quiz = db.session.execute(select(Quiz.pool_size, Quiz.pool_strata, Quiz.shuffle_options).where(Quiz.id == quiz_id)).one_or_none()
+    if quiz is None:
+        return None
+    rows = db.session.execute(select(Question.id, Question.ans_type, Question.marks, Question.options)
+                              .where(Question.quiz_id == quiz_id).order_by(Question.id)).all()
+    return PoolIndex(quiz_id, quiz.pool_size, quiz.pool_strata, quiz.shuffle_options, rows)
+
+
+# The quiz's pool index, from the catalog cache (None if the quiz is gone)
+def load_pool(quiz_id):
+    return catalog_cache.slice("pool", quiz_id, lambda: _build(quiz_id))
+
+
+# Pooled quizzes are shown to students one drawn paper at a time, through a quiz session
+def is_pooled(quiz_id):
+    pool = load_pool(quiz_id)
+    return pool is not None and pool.randomized
+
+
+def draw(quiz_id, seed):
+    pool = load_pool(quiz_id)
+    return pool and pool.paper(seed)
+
+
+# Sessions draw from their random id, so a resumed session shows the same paper
+def session_seed(session_id):
+    return int(session_id[:15], 16)
+
+
+def attempt_paper(attempt):
+    return None if attempt.paper_seed is None else draw(attempt.quiz_id, attempt.paper_seed)
+
+
+# The paper's questions as shown, options reordered. One primary key lookup for the drawn questions.
+def paper_questions(paper):
+    questions = {question.id: question for question in Question.query.filter(Question.id.in_(paper.question_ids))}
+    shown = []
+    for question_id in paper.question_ids:
+        question = questions.get(question_id)
+        if question is None:
+            continue
+        order = paper.orders.get(question_id)
+        options = [question.options[index] for index in order] if order else question.options
+        shown.append({"id": question.id, "quiz_id": question.quiz_id, "question_statement": question.question_statement,
+                      "ans_type": question.ans_type, "options": options, "marks": question.marks})
+    return shown
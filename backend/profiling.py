@@ -0,0 +1,156 @@
+import cProfile
+import os
+import random
+import time
+from threading import Lock
+from uuid import uuid4
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# Opt-in request instrumentation, enabled with PROFILING=1. Every request gets a
+# Server-Timing header with its total, SQL, serialization and password hashing time,
+# and the same numbers are aggregated per endpoint for /metrics (Prometheus text format).
+# A sample of requests (PROFILE_SAMPLE_RATE) runs under cProfile and the ones slower than
+# PROFILE_SLOW_MS are written to PROFILE_DIR, keeping the PROFILE_KEEP slowest.
+# Metrics are per process.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ("sql", "serialize", "hash")
+
+
+# Adds time spent in a phase to the current request. Cheap no-op when instrumentation is
+# off or outside a request, so hot paths can call it unconditionally.
+def record(phase, seconds):
+    if has_request_context():
+        timings = g.get("_timings")
+        if timings is not None:
+            timings[phase] += seconds
+
+
+class Instrumentation():
+    def __init__(self):
+        self.enabled = False
+        self._lock = Lock()
+        self._profiler_lock = Lock()
+        self.requests = {}  # (method, endpoint, status) -> count
+        self.durations = {}  # endpoint -> [bucket counts..., sum, count]
+        self.phases = {}  # (endpoint, phase) -> seconds
+        self.queries = {}  # endpoint -> count
+        self.profiles = []  # (seconds, path) of the kept profiles, fastest first
+
+    def init_app(self, app, db):
+        self.enabled = app.config.get("PROFILING", False)
+        if not self.enabled:
+            return
+        self.sample_rate = app.config["PROFILE_SAMPLE_RATE"]
+        self.slow_seconds = app.config["PROFILE_SLOW_MS"] / 1000
+        self.profile_dir = app.config["PROFILE_DIR"]
+        self.keep = app.config["PROFILE_KEEP"]
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", self._before_query)
+        event.listen(engine, "after_cursor_execute", self._after_query)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    def _before_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_query_started", []).append(time.perf_counter())
+
+    def _after_query(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["_query_started"].pop()
+        if has_request_context() and g.get("_timings") is not None:
+            g._timings["sql"] += time.perf_counter() - started
+            g._query_count += 1
+
+    def _start(self):
+        g._timings = dict.fromkeys(PHASES, 0.0)
+        g._query_count = 0
+        g._profiler = None
+        # cProfile can only run one profiler at a time, so concurrent samples are skipped
+        if self.sample_rate and random.random() < self.sample_rate and self._profiler_lock.acquire(blocking=False):
+            g._profiler = cProfile.Profile()
+            g._profiler.enable()
+        g._started = time.perf_counter()
+
+    def _finish(self, response):
+        if g.get("_timings") is None:
+            return response
+        elapsed = time.perf_counter() - g._started
+        if g._profiler is not None:
+            g._profiler.disable()
+            try:
+                if elapsed >= self.slow_seconds:
+                    self._keep_profile(g._profiler, elapsed)
+            finally:
+                g._profiler = None
+                self._profiler_lock.release()
+
+        timings = g._timings
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        response.headers["Server-Timing"] = ", ".join([
+            f"total;dur={elapsed * 1000:.2f}",
+            f'sql;dur={timings["sql"] * 1000:.2f};desc="{g._query_count} queries"',
+            f"serialize;dur={timings['serialize'] * 1000:.2f}",
+            f"hash;dur={timings['hash'] * 1000:.2f}",
+        ])
+        with self._lock:
+            key = (request.method, endpoint, response.status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.durations.setdefault(endpoint, [0] * len(BUCKETS) + [0.0, 0])
+            for index, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    histogram[index] += 1
+            histogram[-2] += elapsed
+            histogram[-1] += 1
+            for phase, seconds in timings.items():
+                self.phases[(endpoint, phase)] = self.phases.get((endpoint, phase), 0.0) + seconds
+            self.queries[endpoint] = self.queries.get(endpoint, 0) + g._query_count
+        return response
+
+    def _keep_profile(self, profiler, elapsed):
+        with self._lock:
+            if len(self.profiles) >= self.keep and elapsed <= self.profiles[0][0]:
+                return
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}_{request.method}_{request.path.strip('/').replace('/', '_') or 'root'}_{elapsed * 1000:.0f}ms_{uuid4().hex[:6]}.prof"
+            path = os.path.join(self.profile_dir, name)
+            profiler.dump_stats(path)
+            self.profiles.append((elapsed, path))
+            self.profiles.sort()
+            while len(self.profiles) > self.keep:
+                _, dropped = self.profiles.pop(0)
+                if os.path.exists(dropped):
+                    os.remove(dropped)
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            family("quiz_http_requests_total", "counter", "Requests by method, endpoint and status.")
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f'quiz_http_requests_total{{method="{method}",endpoint="{endpoint}",status="{status}"}} {count}')
+            family("quiz_http_request_duration_seconds", "histogram", "Request duration by endpoint.")
+            for endpoint, histogram in sorted(self.durations.items()):
+                for bound, count in zip(BUCKETS, histogram):
+                    lines.append(f'quiz_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'quiz_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram[-1]}')
+                lines.append(f'quiz_http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram[-2]:.6f}')
+                lines.append(f'quiz_http_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram[-1]}')
+            family("quiz_phase_seconds_total", "counter", "Time spent in SQL, serialization and password hashing by endpoint.")
+            for (endpoint, phase), seconds in sorted(self.phases.items()):
+                lines.append(f'quiz_phase_seconds_total{{endpoint="{endpoint}",phase="{phase}"}} {seconds:.6f}')
+            family("quiz_sql_queries_total", "counter", "SQL statements executed by endpoint.")
+            for endpoint, count in sorted(self.queries.items()):
+                lines.append(f'quiz_sql_queries_total{{endpoint="{endpoint}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        return self.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+instrumentation = Instrumentation()
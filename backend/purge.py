@@ -0,0 +1,157 @@
+import time
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from sqlalchemy import delete, insert, or_, select, update
+from .models import Attempt, Chapter, PurgeJob, Question, Quiz, Response, Subject, db
+from .catalog import catalog_cache
+
+# A plain DELETE of a quiz cascades through every attempt and response in one transaction,
+# which holds SQLite's write lock for as long as that takes. A purge deletes the same rows
+# leaf first in chunks of PURGE_CHUNK_SIZE, one transaction each with PURGE_PAUSE seconds in
+# between so submissions keep getting through, and deletes the quiz or chapter itself last.
+# Chapters are shared between subjects and outlive them, so a subject purge has no children to
+# chunk: its one DELETE only cascades to subject_chapter_association.
+# The final DELETE still cascades, so attempts made while the purge runs are removed too.
+# Until then the target stays visible. Jobs are rows in purge_job, so a purge interrupted by
+# a restart is resumed: every step is idempotent.
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+KINDS = {"quiz": Quiz, "chapter": Chapter, "subject": Subject}
+STALE_AFTER = timedelta(minutes=5)
+RETRY_AFTER, RETRY_MAX = 1, 60  # seconds, doubled per consecutive worker failure
+
+
+def _quiz_ids(kind, target_id):
+    return select(Quiz.id).where(Quiz.chapter_id == target_id) if kind == "chapter" else select(Quiz.id).where(Quiz.id == target_id)
+
+
+# (model, ids to delete) in the order they are deleted, children before parents
+def plan(kind, target_id):
+    target = (KINDS[kind], select(KINDS[kind].id).where(KINDS[kind].id == target_id))
+    if kind == "subject":
+        return [target]
+    quiz_ids = _quiz_ids(kind, target_id)
+    attempt_ids = select(Attempt.id).where(Attempt.quiz_id.in_(quiz_ids))
+    return [
+        (Response, select(Response.id).where(Response.attempt_id.in_(attempt_ids))),
+        (Attempt, attempt_ids),
+        (Question, select(Question.id).where(Question.quiz_id.in_(quiz_ids))),
+        (Quiz, quiz_ids),
+        target,
+    ]
+
+
+# Queues a purge. Caller commits and then calls purger.start().
+def enqueue(kind, target_id):
+    return db.session.execute(insert(PurgeJob).values(
+        kind=kind, target_id=target_id, status=QUEUED, deleted_rows=0, created_at=datetime.now()
+    ).returning(PurgeJob.id)).scalar_one()
+
+
+def claim():
+    now = datetime.now()
+    claimable = select(PurgeJob.id).where(or_(
+        PurgeJob.status == QUEUED, (PurgeJob.status == RUNNING) & (PurgeJob.updated_at < now - STALE_AFTER)
+    )).order_by(PurgeJob.id).limit(1).scalar_subquery()
+    job = db.session.execute(update(PurgeJob).where(PurgeJob.id == claimable).values(status=RUNNING, updated_at=now)
+                             .returning(PurgeJob.id, PurgeJob.kind, PurgeJob.target_id)).one_or_none()
+    db.session.commit()
+    return job
+
+
+# Runs one job to completion, committing after every chunk. Returns the rows it deleted.
+def run(job_id, kind, target_id, chunk_size, pause):
+    deleted = 0
+    for model, ids in plan(kind, target_id):
+        while True:
+            count = db.session.execute(delete(model).where(model.id.in_(ids.limit(chunk_size))),
+                                       execution_options={"synchronize_session": False}).rowcount
+            deleted += count
+            db.session.execute(update(PurgeJob).where(PurgeJob.id == job_id).values(
+                deleted_rows=PurgeJob.deleted_rows + count, updated_at=datetime.now()))
+            db.session.commit()
+            if count < chunk_size:
+                break
+            if pause:
+                time.sleep(pause)
+    db.session.execute(update(PurgeJob).where(PurgeJob.id == job_id).values(status=DONE, finished_at=datetime.now()))
+    db.session.commit()
+    catalog_cache.bump()
+    return deleted
+
+
+def job_status(job_id):
+    job = db.session.get(PurgeJob, job_id)
+    if job is None:
+        return None
+    return {
+        "job_id": job.id, "kind": job.kind, "target_id": job.target_id, "status": job.status,
+        "deleted_rows": job.deleted_rows, "error": job.error,
+        "created_at": job.created_at.isoformat(), "finished_at": job.finished_at and job.finished_at.isoformat(),
+    }
+
+
+# One background thread per process, started by the first purge request and gone once no
+# job is left. Purges are rare, so there is nothing to poll for in between.
+class Purger():
+    def __init__(self):
+        self.app = None
+        self.chunk_size = 5000
+        self.pause = 0.05
+        self._thread = None
+        self._again = False
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.chunk_size = app.config["PURGE_CHUNK_SIZE"]
+        self.pause = app.config["PURGE_PAUSE"]
+
+    def start(self):
+        with self._lock:
+            self._again = True
+            if self._thread is None:
+                self._thread = Thread(target=self._loop, name="purge-worker", daemon=True)
+                self._thread.start()
+
+    # A database error outside a job (claiming one, or marking it failed) leaves the job
+    # claimable, so the worker backs off and tries again rather than dying with _thread set.
+    def _loop(self):
+        failures = 0
+        while True:
+            with self._lock:
+                self._again = False
+            with self.app.app_context():  # type: ignore
+                try:
+                    done = self.run_pending()
+                    failures = 0
+                except Exception:
+                    self.app.logger.exception("Purge worker failed")  # type: ignore
+                    db.session.rollback()
+                    failures += 1
+            if failures:
+                time.sleep(min(RETRY_AFTER * 2 ** (failures - 1), RETRY_MAX))
+                continue
+            with self._lock:
+                if not done and not self._again:
+                    self._thread = None
+                    return
+
+    # Runs queued and abandoned jobs until none is left, returns how many ran. Needs an app context.
+    def run_pending(self):
+        ran = 0
+        while True:
+            job = claim()
+            if job is None:
+                return ran
+            try:
+                run(job.id, job.kind, job.target_id, self.chunk_size, self.pause)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception("Purge %s failed", job.id)  # type: ignore
+                db.session.execute(update(PurgeJob).where(PurgeJob.id == job.id).values(
+                    status=FAILED, error=str(e)[:500], finished_at=datetime.now()))
+                db.session.commit()
+            ran += 1
+
+
+purger = Purger()
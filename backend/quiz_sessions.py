@@ -0,0 +1,389 @@
+import heapq
+import secrets
+import time
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from .models import QuizSession, db
+from .submissions import enqueue_many, submission_queue
+from .pools import draw, session_seed
+
+# Server side deadlines for Quiz.time_limit. A student starts a session, heartbeats save the
+# answers given so far, and a submit within the deadline (plus QUIZ_SESSION_GRACE for the
+# network) grades them. Nothing runs at the deadline itself: a session is found to be overdue
+# when it is next read, or by the sweep, and is then submitted with its last saved answers.
+# Auto-submits go through the submission table, so a sweep grades its whole batch at once.
+#
+# QUIZ_SESSION_STORE=memory keeps sessions in this process, which is right for a single
+# worker. With several worker processes use database, which keeps them in quiz_session.
+# Either way a request touches one session by key and the sweep only reads the overdue ones.
+ACTIVE, SUBMITTED, EXPIRED = "active", "submitted", "expired"
+
+
+class TimedSession():
+    __slots__ = ("id", "student_id", "quiz_id", "status", "answers", "started_at", "expires_at",
+                 "last_seen_at", "finished_at", "attempt_id", "submission_id")
+
+    def __init__(self, id, student_id, quiz_id, status, answers, started_at, expires_at, last_seen_at,
+                 finished_at=None, attempt_id=None, submission_id=None):
+        self.id = id
+        self.student_id = student_id
+        self.quiz_id = quiz_id
+        self.status = status
+        self.answers = answers  # [[question_id, answer], ...] as shown on the paper
+        self.started_at = started_at
+        self.expires_at = expires_at
+        self.last_seen_at = last_seen_at
+        self.finished_at = finished_at
+        self.attempt_id = attempt_id
+        self.submission_id = submission_id
+
+    def copy(self):
+        return TimedSession(*(getattr(self, name) for name in self.__slots__))
+
+    def view(self, now=None):
+        now = now or datetime.now()
+        remaining = max(0, int((self.expires_at - now).total_seconds())) if self.status == ACTIVE else 0
+        view = {
+            "session_id": self.id, "quiz_id": self.quiz_id, "student_id": self.student_id, "status": self.status,
+            "started_at": self.started_at.isoformat(), "expires_at": self.expires_at.isoformat(),
+            "remaining_seconds": remaining, "finished_at": self.finished_at and self.finished_at.isoformat(),
+            "responses": [{"question_id": question_id, "answer": answer} for question_id, answer in self.answers],
+            "attempt_id": self.attempt_id, "submission_id": self.submission_id,
+        }
+        if self.submission_id is not None:
+            view["status_url"] = f"/api/submission/{self.submission_id}"
+        return view
+
+
+# Sessions by id, the open one per (student, quiz), and a heap of deadlines so the sweep
+# pops overdue sessions instead of looking at all of them. Finished sessions stay readable
+# until forget() drops them. Changes take effect at once, there is no transaction to
+# commit, so callers undo a failed finish() with reopen().
+class MemoryStore():
+    name = "memory"
+
+    def __init__(self):
+        self._sessions = {}
+        self._open = {}
+        self._deadlines = []  # (expires_at, session id)
+        self._finished = []  # (expires_at, session id), for forget()
+        self._lock = Lock()
+
+    # Stores a new session unless the student already has one open for the quiz.
+    # Returns the open session, whichever it is.
+    def create(self, session):
+        with self._lock:
+            open_id = self._open.get((session.student_id, session.quiz_id))
+            if open_id is not None:
+                return self._sessions[open_id].copy()
+            self._sessions[session.id] = session.copy()
+            self._open[(session.student_id, session.quiz_id)] = session.id
+            heapq.heappush(self._deadlines, (session.expires_at, session.id))
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session and session.copy()
+
+    def open_session(self, student_id, quiz_id):
+        with self._lock:
+            session_id = self._open.get((student_id, quiz_id))
+            return session_id and self._sessions[session_id].copy()
+
+    def save_answers(self, session_id, answers, now):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.status != ACTIVE:
+                return False
+            if answers is not None:
+                session.answers = answers
+            session.last_seen_at = now
+            return True
+
+    # Moves the sessions that are still active to status, returns those
+    def finish(self, session_ids, status, now):
+        finished = []
+        with self._lock:
+            for session_id in session_ids:
+                session = self._sessions.get(session_id)
+                if session is None or session.status != ACTIVE:
+                    continue
+                session.status = status
+                session.finished_at = now
+                del self._open[(session.student_id, session.quiz_id)]
+                heapq.heappush(self._finished, (session.expires_at, session.id))
+                finished.append(session.copy())
+        return finished
+
+    def reopen(self, sessions):
+        with self._lock:
+            for session in sessions:
+                stored = self._sessions.get(session.id)
+                if stored is None or stored.status == ACTIVE:
+                    continue
+                stored.status, stored.finished_at, stored.attempt_id, stored.submission_id = ACTIVE, None, None, None
+                self._open[(stored.student_id, stored.quiz_id)] = stored.id
+                heapq.heappush(self._deadlines, (stored.expires_at, stored.id))
+
+    # results: {session id: (attempt_id, submission_id)}
+    def record_results(self, results):
+        with self._lock:
+            for session_id, (attempt_id, submission_id) in results.items():
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    session.attempt_id, session.submission_id = attempt_id, submission_id
+
+    # Up to limit active sessions whose deadline is at or before cutoff, oldest first
+    def due(self, cutoff, limit):
+        due = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= cutoff and len(due) < limit:
+                _, session_id = heapq.heappop(self._deadlines)
+                session = self._sessions.get(session_id)
+                if session is not None and session.status == ACTIVE:
+                    due.append(session.copy())
+        return due
+
+    # Drops finished sessions whose deadline is before cutoff
+    def forget(self, cutoff):
+        with self._lock:
+            while self._finished and self._finished[0][0] < cutoff:
+                _, session_id = heapq.heappop(self._finished)
+                session = self._sessions.get(session_id)
+                if session is not None and session.status != ACTIVE:
+                    del self._sessions[session_id]
+
+    def active_count(self):
+        with self._lock:
+            return len(self._open)
+
+
+# The same operations on the quiz_session table, in the caller's transaction. Lookups are by
+# primary key or through the partial unique index on open sessions, the sweep reads
+# ix_quiz_session_deadline.
+class DatabaseStore():
+    name = "database"
+
+    @staticmethod
+    def _session(row):
+        return TimedSession(row.id, row.student_id, row.quiz_id, row.status, row.answers, row.started_at, row.expires_at,
+                            row.last_seen_at, row.finished_at, row.attempt_id, row.submission_id)
+
+    def create(self, session):
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(QuizSession).values(
+                    id=session.id, student_id=session.student_id, quiz_id=session.quiz_id, status=session.status,
+                    answers=session.answers, started_at=session.started_at, expires_at=session.expires_at,
+                    last_seen_at=session.last_seen_at))
+            return session
+        except IntegrityError:
+            # Another request opened one first
+            return self.open_session(session.student_id, session.quiz_id)
+
+    def get(self, session_id):
+        row = db.session.execute(select(QuizSession.__table__).where(QuizSession.id == session_id)).one_or_none()
+        return row and self._session(row)
+
+    def open_session(self, student_id, quiz_id):
+        row = db.session.execute(select(QuizSession.__table__).where(
+            QuizSession.student_id == student_id, QuizSession.quiz_id == quiz_id, QuizSession.status == ACTIVE)).one_or_none()
+        return row and self._session(row)
+
+    def save_answers(self, session_id, answers, now):
+        values = {"last_seen_at": now} if answers is None else {"last_seen_at": now, "answers": answers}
+        return db.session.execute(update(QuizSession).where(QuizSession.id == session_id, QuizSession.status == ACTIVE)
+                                  .values(**values), execution_options={"synchronize_session": False}).rowcount == 1
+
+    def finish(self, session_ids, status, now):
+        rows = db.session.execute(update(QuizSession).where(QuizSession.id.in_(session_ids), QuizSession.status == ACTIVE)
+                                  .values(status=status, finished_at=now).returning(*QuizSession.__table__.columns),
+                                  execution_options={"synchronize_session": False}).all()
+        return [self._session(row) for row in rows]
+
+    def reopen(self, sessions):
+        pass  # the caller's rollback undid finish()
+
+    def record_results(self, results):
+        if results:
+            db.session.execute(update(QuizSession), [{"id": session_id, "attempt_id": attempt_id, "submission_id": submission_id}
+                                                     for session_id, (attempt_id, submission_id) in results.items()])
+
+    def due(self, cutoff, limit):
+        rows = db.session.execute(select(QuizSession.__table__).where(QuizSession.status == ACTIVE, QuizSession.expires_at <= cutoff)
+                                  .order_by(QuizSession.expires_at).limit(limit)).all()
+        return [self._session(row) for row in rows]
+
+    def forget(self, cutoff):
+        db.session.execute(delete(QuizSession).where(QuizSession.status.in_((SUBMITTED, EXPIRED)), QuizSession.expires_at < cutoff),
+                           execution_options={"synchronize_session": False})
+
+    def active_count(self):
+        return db.session.execute(select(func.count()).select_from(QuizSession).where(QuizSession.status == ACTIVE)).scalar()
+
+
+STORES = {"memory": MemoryStore, "database": DatabaseStore}
+
+
+# Session lifecycle and the sweep. The sweep is one thread per process, started by the first
+# session and gone once no session is open. `flask sweep-sessions` runs it from cron, which
+# catches sessions of database stores whose process went away.
+class QuizSessions():
+    def __init__(self):
+        self.app = None
+        self.store = MemoryStore()
+        self.grace = timedelta(seconds=5)
+        self.untimed = timedelta(hours=24)
+        self.retention = timedelta(hours=1)
+        self.sweep_interval = 15
+        self.sweep_batch = 500
+        self._thread = None
+        self._again = False
+        self._lock = Lock()
+        self.metrics = {"started": 0, "resumed": 0, "submitted": 0, "expired": 0, "sweeps": 0}
+
+    def init_app(self, app):
+        self.app = app
+        self.store = STORES[app.config["QUIZ_SESSION_STORE"]]()
+        self.grace = timedelta(seconds=app.config["QUIZ_SESSION_GRACE"])
+        self.untimed = timedelta(seconds=app.config["QUIZ_SESSION_UNTIMED_LIMIT"])
+        self.retention = timedelta(seconds=app.config["QUIZ_SESSION_RETENTION"])
+        self.sweep_interval = app.config["QUIZ_SESSION_SWEEP_INTERVAL"]
+        self.sweep_batch = app.config["QUIZ_SESSION_SWEEP_BATCH"]
+
+    def _count(self, name, count=1):
+        with self._lock:
+            self.metrics[name] += count
+
+    def overdue(self, session, now):
+        return session.status == ACTIVE and now > session.expires_at + self.grace
+
+    # Opens a session for the quiz, or returns the student's open one so a reload resumes it.
+    # Returns (session, resumed). Caller commits.
+    def start(self, student_id, quiz):
+        now = datetime.now()
+        session = self.store.open_session(student_id, quiz.id)
+        if session is not None and self.overdue(session, now):
+            self.expire([session])
+            session = None
+        resumed = session is not None
+        if session is None:
+            limit = timedelta(minutes=quiz.time_limit) if quiz.time_limit else self.untimed
+            created = TimedSession(secrets.token_hex(16), student_id, quiz.id, ACTIVE, [], now, now + limit, now)
+            session = self.store.create(created)
+            resumed = session.id != created.id
+        self._count("resumed" if resumed else "started")
+        self.start_sweeper()
+        return session, resumed
+
+    # The session's question paper, None if the quiz is gone
+    def paper(self, session):
+        return draw(session.quiz_id, session_seed(session.id))
+
+    # The session, submitted first if it is overdue
+    def get(self, session_id):
+        session = self.store.get(session_id)
+        if session is not None and self.overdue(session, datetime.now()):
+            self.expire([session])
+            session = self.store.get(session_id)
+        return session
+
+    # Saves the answers so far (None keeps the saved ones). False if the session is no longer active. Caller commits.
+    def heartbeat(self, session, answers):
+        return self.store.save_answers(session.id, answers, datetime.now())
+
+    # Closes the session for a submit by the student. Returns it, or None if it was already
+    # closed. The caller grades it, then calls record_result and commits, or reopen on failure.
+    def finish(self, session):
+        finished = self.store.finish([session.id], SUBMITTED, datetime.now())
+        if finished:
+            self._count("submitted")
+        return finished[0] if finished else None
+
+    def record_result(self, session, attempt_id=None, submission_id=None):
+        self.store.record_results({session.id: (attempt_id, submission_id)})
+
+    def reopen(self, session):
+        self.store.reopen([session])
+
+    # Submits overdue sessions with their saved answers: one multi-row insert into the
+    # submission table, then the batch is graded here, or by the workers in queue mode.
+    # Commits. Returns how many sessions this call expired.
+    def expire(self, sessions):
+        expired = self.store.finish([session.id for session in sessions], EXPIRED, datetime.now())
+        if not expired:
+            return 0
+        queued = submission_queue.enabled
+        rows = []
+        for session in expired:
+            paper = self.paper(session)
+            answers = paper.canonical(session.answers) if paper else session.answers
+            rows.append((session.student_id, session.quiz_id, answers, paper and paper.seed))
+        try:
+            submission_ids = enqueue_many(rows, claimed=not queued)
+            self.store.record_results({session.id: (None, submission_id) for session, submission_id in zip(expired, submission_ids)})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.store.reopen(expired)
+            raise
+        self._count("expired", len(expired))
+        if queued:
+            submission_queue.notify(len(expired))
+        else:
+            submission_queue.grade_claimed([(submission_id, *row) for row, submission_id in zip(rows, submission_ids)])
+        return len(expired)
+
+    # Expires every overdue session, sweep_batch at a time, and drops old finished ones.
+    # Returns how many were expired. Needs an app context.
+    def sweep(self):
+        now = datetime.now()
+        expired = 0
+        while True:
+            due = self.store.due(now - self.grace, self.sweep_batch)
+            if not due:
+                break
+            expired += self.expire(due)
+            if len(due) < self.sweep_batch:
+                break
+        self.store.forget(now - self.retention)
+        db.session.commit()
+        self._count("sweeps")
+        return expired
+
+    def start_sweeper(self):
+        with self._lock:
+            self._again = True
+            if self._thread is None and self.app is not None:
+                self._thread = Thread(target=self._loop, name="quiz-session-sweeper", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            with self._lock:
+                self._again = False
+            with self.app.app_context():  # type: ignore
+                try:
+                    self.sweep()
+                    active = self.store.active_count()
+                except Exception:
+                    self.app.logger.exception("Quiz session sweep failed")  # type: ignore
+                    db.session.rollback()
+                    active = 1
+            with self._lock:
+                if not active and not self._again:
+                    self._thread = None
+                    return
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            sweeping = self._thread is not None
+        return {"store": self.store.name, "active": self.store.active_count(), "sweeping": sweeping, **metrics}
+
+
+quiz_sessions = QuizSessions()
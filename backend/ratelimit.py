@@ -0,0 +1,227 @@
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import BoundedSemaphore, Lock, local
+from flask import request
+from flask_security.core import current_user
+
+# Admission control for the endpoints that cost the most: sign-in and registration (bcrypt),
+# answer submission and quiz sessions (the SQLite writer) and imports. Two checks, both done
+# before the view runs:
+#   rate    a token bucket per limit and client, RATE_LIMITS["name"] = "requests/seconds",
+#           i.e. bursts of up to `requests`, refilled evenly over `seconds`. Clients are the
+#           signed-in user, otherwise the remote address (behind a proxy, apply ProxyFix).
+#           Over the limit is 429 with Retry-After set to when the next token is due.
+#   writes  at most WRITE_CONCURRENCY write requests run at once in this process; others wait
+#           up to WRITE_ADMISSION_WAIT for a slot and then get 503 with Retry-After.
+# RATE_LIMIT_STORE=memory keeps the buckets in this process, so with N workers a client gets
+# up to N times its limit. database keeps them in a small SQLite file of their own
+# (RATE_LIMIT_DATABASE) that every worker on the host shares, away from the main database's
+# writer. A bucket store that cannot answer in time lets the request through.
+
+# "requests/seconds" -> (tokens per second, burst). Empty or "0" turns the limit off.
+def parse_limit(value):
+    if value in (None, "", "0"):
+        return None
+    try:
+        requests, seconds = str(value).split("/")
+        requests, seconds = int(requests), float(seconds)
+    except ValueError:
+        raise ValueError(f"Invalid rate limit {value!r}, expected requests/seconds") from None
+    if requests < 1 or seconds <= 0:
+        raise ValueError(f"Invalid rate limit {value!r}, expected requests/seconds")
+    return requests / seconds, requests
+
+
+# Buckets in a bounded LRU. An evicted bucket comes back full, which is what an idle client
+# would have found anyway.
+class MemoryStore():
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> (tokens, monotonic time of the last take)
+        self._lock = Lock()
+
+    # Takes a token. Returns 0 if there was one, else the seconds until there is.
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is None:
+                tokens = burst
+            else:
+                tokens = min(burst, entry[0] + (now - entry[1]) * rate)
+                self._buckets.move_to_end(key)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+        return (1 - tokens) / rate
+
+    def size(self):
+        return len(self._buckets)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Buckets shared between processes: one upsert per take, refill and take in the same
+# statement so concurrent workers cannot both spend the last token. Wall clock time, since
+# monotonic clocks are not comparable across processes. Rows of buckets that have refilled
+# completely carry no information and are deleted every CLEANUP_EVERY takes.
+class DatabaseStore():
+    TIMEOUT = 0.05  # seconds to wait for another worker's write before letting the request through
+    CLEANUP_EVERY = 4096
+    _REFILL = "min(:burst, tokens + (:now - stamp) * :rate)"
+    _TAKE = (f"INSERT INTO bucket (key, tokens, stamp, allowed) VALUES (:key, :burst - 1, :now, 1) "
+             f"ON CONFLICT (key) DO UPDATE SET tokens = {_REFILL} - ({_REFILL} >= 1), stamp = :now, allowed = {_REFILL} >= 1 "
+             f"RETURNING tokens, allowed")
+
+    def __init__(self, path, horizon):
+        self.path = path
+        self.horizon = horizon  # longest refill period of any limit
+        self._local = local()
+        self._lock = Lock()
+        self._takes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Workers starting together all set the file up, so that may wait longer than a take
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Losing the buckets to a crash only forgets some recent requests, so skip the fsyncs
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute("CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                               "stamp REAL NOT NULL, allowed INTEGER NOT NULL) WITHOUT ROWID")
+            connection.execute(f"PRAGMA busy_timeout={int(self.TIMEOUT * 1000)}")
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        connection = self._connection()
+        tokens, allowed = connection.execute(self._TAKE, {"key": key, "rate": rate, "burst": burst, "now": now}).fetchone()
+        with self._lock:
+            self._takes += 1
+            cleanup = self._takes % self.CLEANUP_EVERY == 0
+        if cleanup:
+            connection.execute("DELETE FROM bucket WHERE stamp < :cutoff", {"cutoff": now - self.horizon})
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def size(self):
+        return self._connection().execute("SELECT count(*) FROM bucket").fetchone()[0]
+
+    def clear(self):
+        self._connection().execute("DELETE FROM bucket")
+
+
+class RateLimiter():
+    def __init__(self):
+        self.enabled = False
+        self.limits = {}  # name -> (tokens per second, burst)
+        self.store = MemoryStore()
+        self.admission_wait = 0.1
+        self.write_concurrency = 1
+        self._slots = BoundedSemaphore(1)
+        self._lock = Lock()
+        self.metrics = {"allowed": 0, "limited": {}, "store_errors": 0, "writes_rejected": 0, "writes_in_flight": 0}
+
+    def init_app(self, app):
+        self.enabled = app.config["RATE_LIMITING"]
+        self.limits = {name: parse_limit(value) for name, value in app.config["RATE_LIMITS"].items()}
+        self.write_concurrency = app.config["WRITE_CONCURRENCY"]
+        self.admission_wait = app.config["WRITE_ADMISSION_WAIT"]
+        self._slots = BoundedSemaphore(self.write_concurrency)
+        if app.config["RATE_LIMIT_STORE"] == "database":
+            os.makedirs(app.instance_path, exist_ok=True)
+            horizon = max((burst / rate for rate, burst in filter(None, self.limits.values())), default=0)
+            self.store = DatabaseStore(os.path.join(app.instance_path, app.config["RATE_LIMIT_DATABASE"]), horizon)
+        else:
+            self.store = MemoryStore(app.config["RATE_LIMIT_MAX_KEYS"])
+
+    @staticmethod
+    def client():
+        if current_user and current_user.is_authenticated:
+            return f"user:{current_user.id}"
+        return f"ip:{request.remote_addr}"
+
+    # Takes a token from the current client's bucket. Returns 0, or the seconds until the next token.
+    def check(self, name):
+        limit = self.limits.get(name)
+        if limit is None:
+            return 0.0
+        rate, burst = limit
+        try:
+            wait = self.store.take(f"{name}:{self.client()}", rate, burst)
+        except sqlite3.Error:
+            with self._lock:
+                self.metrics["store_errors"] += 1
+            return 0.0
+        with self._lock:
+            if wait:
+                self.metrics["limited"][name] = self.metrics["limited"].get(name, 0) + 1
+            else:
+                self.metrics["allowed"] += 1
+        return wait
+
+    # A write slot, waiting up to WRITE_ADMISSION_WAIT. True if one was taken; release() it.
+    def admit(self):
+        if not self._slots.acquire(timeout=self.admission_wait):
+            with self._lock:
+                self.metrics["writes_rejected"] += 1
+            return False
+        with self._lock:
+            self.metrics["writes_in_flight"] += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.metrics["writes_in_flight"] -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics, limited=dict(self.metrics["limited"]))
+        stats.update(enabled=self.enabled, store=type(self.store).__name__, buckets=self.store.size(),
+                     write_concurrency=self.write_concurrency,
+                     limits={name: limit and {"requests": limit[1], "seconds": round(limit[1] / limit[0], 3)}
+                             for name, limit in self.limits.items()})
+        return stats
+
+
+rate_limiter = RateLimiter()
+
+
+# Refusals are returned rather than raised: under load they are frequent, and flask_restful
+# would log a traceback for every 503.
+def _refused(status, message, retry_after):
+    return {"message": message}, status, {"Retry-After": str(retry_after)}
+
+
+# Applies the named rate limit to a view, and write admission with write=True. Goes above
+# auth_required, so requests without a valid token are limited by address and still counted.
+def limited(name, write=False):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not rate_limiter.enabled:
+                return view(*args, **kwargs)
+            wait = rate_limiter.check(name)
+            if wait:
+                return _refused(429, "Too many requests, please retry later", math.ceil(wait))
+            if not write:
+                return view(*args, **kwargs)
+            if not rate_limiter.admit():
+                return _refused(503, "Server is busy, please retry shortly", 1)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                rate_limiter.release()
+        return wrapper
+    return decorator
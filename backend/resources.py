@@ -1,9 +1,29 @@
-from flask_restful import Api, Resource, fields, marshal_with, abort
-from flask import request
-from .models import Subject, Chapter, Quiz, Question, Attempt, Response, db, subject_chapter_association
+import csv
+import hashlib
+from itertools import chain
+from flask_restful import Api, Resource, fields, abort
+from flask import request, make_response, current_app, stream_with_context
+from werkzeug.http import quote_etag
+from sqlalchemy.orm import selectinload
+from .models import Subject, Chapter, Quiz, Question, Attempt, db, subject_chapter_association
 from flask_security.decorators import auth_required, roles_required, roles_accepted
+from flask_security.core import current_user
+from .packing import attempt_responses
+from .leaderboard import quiz_summary, leaderboard_page
+from .analytics import item_report
+from .export import attempts_query, responses_query, packed_response_rows, stream_rows, csv_chunks, jsonl_chunks
+from .importer import CatalogImporter, csv_rows, jsonl_rows
+from .catalog import subjects_with_tree, subject_with_tree, chapters_with_quizzes, list_quizzes, catalog_cache
+from .serializers import serialize, serialize_with, output_json
+from .search import KINDS, search
+from .submissions import enqueue, grade_now, submission_queue, submission_status
+from .quiz_sessions import ACTIVE, EXPIRED, quiz_sessions
+from .pools import is_pooled, paper_questions, pool_settings
+from .ratelimit import limited
+from . import purge
 
 api = Api(prefix="/api")
+api.representation("application/json")(output_json)
 
 response_fields = {
     "id": fields.Integer,
@@ -38,6 +58,9 @@ quiz_fields_with_questions = {
     "description": fields.String,
     "total_marks": fields.Integer,
     "time_limit": fields.Integer,
+    "pool_size": fields.Integer(default=None),
+    "pool_strata": fields.String,
+    "shuffle_options": fields.Boolean,
     "questions": fields.List(fields.Nested(question_fields))
 }
 quiz_fields = {
@@ -47,6 +70,9 @@ quiz_fields = {
     "description": fields.String,
     "total_marks": fields.Integer,
     "time_limit": fields.Integer,
+    "pool_size": fields.Integer(default=None),
+    "pool_strata": fields.String,
+    "shuffle_options": fields.Boolean,
 }
 
 chapter_fields = {
@@ -70,17 +96,84 @@ def sendResponse(status=200, message="", data=None):
         sendResponse["data"]=data
     return sendResponse, status
 
+# Returns a 304 response if the client already holds this version, else None
+def notModified(etag):
+    if request.if_none_match.contains(etag):
+        return make_response("", 304, {"ETag": quote_etag(etag)})
+    return None
+
+def sendTagged(data, etag, status=200):
+    return data, status, {"ETag": quote_etag(etag)}
+
+# List endpoints: ?cursor=<last key seen>&limit=<n>&depth=<nesting levels>&fields=<a,b,...>
+def pageArgs(schema):
+    max_limit = current_app.config["PAGE_MAX_LIMIT"]
+    limit = request.args.get("limit", max_limit, type=int)
+    if limit < 1:
+        abort(400, message="limit must be a positive integer")
+    cursor = request.args.get("cursor", type=int)
+    depth = request.args.get("depth", type=int)
+    names = request.args.get("fields")
+    if names:
+        names = ",".join(sorted(name for name in set(names.split(",")) if name in schema)) or None
+    return cursor, min(limit, max_limit), depth, names
+
+# DELETE ...?mode=background: chunked delete in the background, poll the returned status_url
+def queuePurge(kind, target_id):
+    job_id = purge.enqueue(kind, target_id)
+    db.session.commit()
+    purge.purger.start()
+    return sendResponse(202, message=f"Deletion of {kind} {target_id} queued", data={"job_id": job_id, "status_url": f"/api/purge/{job_id}"})
+
+# [{"question_id": ..., "answer": ...}, ...] from the request body as [(question_id, answer), ...]
+def parseAnswers(response):
+    answers = []
+    for answer in response:
+        question_id = int(answer["question_id"])
+        answer = (answer.get("answer") if answer.get("answer") != [] else None)
+        answers.append((question_id, answer))
+    return answers
+
+# Grades in the request, or queues the submission with SUBMISSION_MODE=queue. paper is the
+# draw of a pooled quiz, with the answers already mapped back by paper.canonical().
+# Returns (status, message, data). Caller commits, then calls submission_queue.notify() on a 202.
+def recordSubmission(user_id, quiz_id, answers, paper=None):
+    if submission_queue.enabled:
+        submission_id = enqueue(user_id, quiz_id, answers, paper and paper.seed)
+        return 202, "Responses queued for grading.", {"submission_id": submission_id, "status": "queued", "status_url": f"/api/submission/{submission_id}"}
+    return 201, "Responses recorded successfully.", grade_now(user_id, quiz_id, answers, paper)
+
+def sendPage(data, next_cursor, etag=None):
+    headers = {}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    if etag:
+        headers["ETag"] = quote_etag(etag)
+    return data, 200, headers
+
 
 class SubjectAPI(Resource):
     # GET ALL SUBJECTS
-    @marshal_with(subject_fields)
     @auth_required("token")
     @roles_accepted("admin","user")
     def get(self): 
-        subjects = Subject.query.all()
-        if not subjects:
+        page = pageArgs(subject_fields)
+        etag = catalog_cache.etag("subjects", *page)
+        cached = notModified(etag)
+        if cached:
+            return cached
+        subjects, next_cursor = catalog_cache.slice("subjects", page, lambda: self._load(*page))
+        if not subjects and page[0] is None:
             abort(404, message="No subjects found")
-        return subjects
+        return sendPage(subjects, next_cursor, etag)
+
+    @staticmethod
+    def _load(cursor, limit, depth, names):
+        depth = 2 if depth is None else depth
+        if names and "chapters" not in names.split(","):
+            depth = 0
+        subjects, next_cursor = subjects_with_tree(cursor, limit, depth)
+        return serialize(subjects, subject_fields, depth, names), next_cursor
     
     # CREATE NEW SUBJECT
     @auth_required("token")
@@ -99,6 +192,7 @@ class SubjectAPI(Resource):
             try:
                 db.session.add(subject)
                 db.session.commit()
+                catalog_cache.bump()
                 return sendResponse(201, message="Subject created successfully")
                 #return jsonify({"message": "Subject created successfully"}), 201
             except Exception as e:
@@ -110,15 +204,19 @@ class SubjectAPI(Resource):
 
 class SubjectIdAPI(Resource):
     # GET A SUBJECT BY ID
-    @marshal_with(subject_fields)
     @auth_required("token")
     @roles_accepted("admin","user")
     def get(self, subject_id):
-        subject = Subject.query.get(subject_id)
+        subject = catalog_cache.slice("subject", subject_id, lambda: self._load(subject_id))
         if not subject:
             abort(404, message="Subject not found")
             #return jsonify({"message": "Subject not found"}), 404
         return subject
+
+    @staticmethod
+    def _load(subject_id):
+        subject = subject_with_tree(subject_id)
+        return serialize(subject, subject_fields) if subject else None
     
     # DELETE A SUBJECT BY ID
     @auth_required("token")
@@ -128,9 +226,12 @@ class SubjectIdAPI(Resource):
         if not subject:
             abort(404, message="Subject does not exist")
             #return jsonify({"message": "Subject does not exist"}), 404
+        if request.args.get("mode") == "background":
+            return queuePurge("subject", subject_id)
         try:
             db.session.delete(subject)
             db.session.commit()
+            catalog_cache.bump()
             return sendResponse(200, message=f"Subject '{subject.name}' deleted successfully")
             #return jsonify({"message": "Subject deleted successfully"}), 200
         except Exception as e:
@@ -141,15 +242,27 @@ class SubjectIdAPI(Resource):
 
 class ChapterAPI(Resource):
     # GET ALL CHAPTERS (TEMPORARY FOR TESTING)
-    @marshal_with(chapter_fields)
     @auth_required("token")
     @roles_accepted("admin","user")
     def get(self): 
-        chapters = Chapter.query.all()
-        if not chapters:
+        page = pageArgs(chapter_fields)
+        etag = catalog_cache.etag("chapters", *page)
+        cached = notModified(etag)
+        if cached:
+            return cached
+        chapters, next_cursor = catalog_cache.slice("chapters", page, lambda: self._load(*page))
+        if not chapters and page[0] is None:
             abort(404, message="No subjects found")
             #return jsonify({"message": "No subjects found"}), 404
-        return chapters
+        return sendPage(chapters, next_cursor, etag)
+
+    @staticmethod
+    def _load(cursor, limit, depth, names):
+        depth = 1 if depth is None else depth
+        if names and "quizzes" not in names.split(","):
+            depth = 0
+        chapters, next_cursor = chapters_with_quizzes(after=cursor, limit=limit, depth=depth)
+        return serialize(chapters, chapter_fields, depth, names), next_cursor
     
     # CREATE NEW SUBJECT
     @auth_required("token")
@@ -174,6 +287,7 @@ class ChapterAPI(Resource):
                 db.session.add(chapter)
                 subject.chapters.extend([chapter])
                 db.session.commit()
+                catalog_cache.bump()
                 return sendResponse(201, message="Chapter created successfully")
                 #return jsonify({"message": "Chapter created successfully"}), 201
             except Exception as e:
@@ -184,7 +298,7 @@ class ChapterAPI(Resource):
             abort(409, message=f"Chapter with name: '{name}', already exists.")
 
 class ChapterIdAPI(Resource):
-    @marshal_with(chapter_fields)
+    @serialize_with(chapter_fields)
     @auth_required("token")
     def get(self, chapter_id):      
         chapter = Chapter.query.get(chapter_id)
@@ -199,9 +313,12 @@ class ChapterIdAPI(Resource):
         chapter = Chapter().query.get(chapter_id)
         if not chapter:
             abort(404, message="Chapter does not exist")
+        if request.args.get("mode") == "background":
+            return queuePurge("chapter", chapter_id)
         try:
             db.session.delete(chapter)
             db.session.commit()
+            catalog_cache.bump()
             return sendResponse(201, message=f"Chapter '{chapter.id}: {chapter.name}' deleted successfully")
             #return jsonify({"message": "Chapter deleted successfully"}), 201
         except Exception as e:
@@ -211,21 +328,26 @@ class ChapterIdAPI(Resource):
 
 class SubjectChaptersAPI(Resource):
     # GET CHAPTERS FOR A SUBJECT
-    @marshal_with(chapter_fields)
     @auth_required("token")
     @roles_accepted("admin","user")
     def get(self, subject_id):
-        subject = Subject.query.get(subject_id)
-        if not subject:
+        chapters = catalog_cache.slice("subject_chapters", subject_id, lambda: self._load(subject_id))
+        if chapters is None:
             abort(404, message="Subject does not exist")
             #return jsonify({"message": "Subject does not exist"}), 404
         else:
-            chapters = subject.chapters
             return chapters
+
+    @staticmethod
+    def _load(subject_id):
+        if not Subject.query.get(subject_id):
+            return None
+        chapters, _ = chapters_with_quizzes(subject_id)
+        return serialize(chapters, chapter_fields)
     
 class ChapterQuizAPI(Resource):
     # GET QUIZZES FOR A CHAPTER
-    @marshal_with(quiz_fields)
+    @serialize_with(quiz_fields)
     @auth_required("token")
     @roles_accepted("admin","user")
     def get(self, chapter_id):
@@ -241,15 +363,24 @@ class ChapterQuizAPI(Resource):
 
 class QuizAPI(Resource):
     # GET ALL QUIZZES (TEMPORARY FOR TESTING)
-    @marshal_with(quiz_fields)
     @auth_required("token")
     @roles_accepted("admin","user")
     def get(self):
-        quizzes = Quiz.query.all()
-        if not quizzes:
+        page = pageArgs(quiz_fields)
+        etag = catalog_cache.etag("quizzes", *page)
+        cached = notModified(etag)
+        if cached:
+            return cached
+        quizzes, next_cursor = catalog_cache.slice("quizzes", page, lambda: self._load(*page))
+        if not quizzes and page[0] is None:
             abort(404, message="No quizzes created")
             #return jsonify({"message":"No quizzes created"}), 404
-        return quizzes
+        return sendPage(quizzes, next_cursor, etag)
+
+    @staticmethod
+    def _load(cursor, limit, depth, names):
+        quizzes, next_cursor = list_quizzes(cursor, limit)
+        return serialize(quizzes, quiz_fields, depth, names), next_cursor
         
 
     # CREATE NEW QUIZ
@@ -292,6 +423,11 @@ class QuizAPI(Resource):
             abort(404, message="Quiz must have atleast one question.")
             #return jsonify({"message":"Quiz must have atleast one question."}), 400
         
+        try:
+            pool = pool_settings(data.get("pool_size"), data.get("pool_strata"), data.get("shuffle_options", False))
+        except ValueError as e:
+            abort(400, message=str(e))
+        
         try:
             with db.session.begin_nested():
                 quiz = Quiz(
@@ -299,7 +435,8 @@ class QuizAPI(Resource):
                     description = data["description"],
                     chapter_id = data["chapter_id"],
                     total_marks=data["total_marks"],
-                    time_limit=data.get("time_limit")
+                    time_limit=data.get("time_limit"),
+                    **pool
                 )
                 db.session.add(quiz)
                 db.session.flush()
@@ -317,6 +454,7 @@ class QuizAPI(Resource):
                     )
                     db.session.add(question)
                 db.session.commit()
+            catalog_cache.bump()
             return sendResponse(201, message="Quiz created successfully")
             #return jsonify({"message":"Quiz created successfully."}), 201
         except Exception as e:
@@ -324,29 +462,78 @@ class QuizAPI(Resource):
             abort(500, message=f"Error creating quiz {str(e)}")
             #return jsonify({"message":f"Error creating quiz {str(e)}"})
 
+# BULK IMPORT OF SUBJECTS, CHAPTERS, QUIZZES AND QUESTIONS
+# Body is JSON lines (default) or CSV (?format=csv or Content-Type: text/csv), one row per
+# entity with a "type" column, e.g.
+# {"type": "subject", "name": "Maths", "description": "...", "image_url": "..."}
+# {"type": "chapter", "subject": "Maths", "name": "Algebra", "description": "..."}
+# {"type": "quiz", "subject": "Maths", "chapter": "Algebra", "name": "Quiz 1", "description": "...", "total_marks": 10}
+# {"type": "question", "subject": "Maths", "chapter": "Algebra", "quiz": "Quiz 1", "question_statement": "2+2?",
+#  "ans_type": "single", "options": ["3", "4"], "correct_options": [1], "marks": 1}
+# Parents can also be given as subject_id / chapter_id / quiz_id.
+# Quiz rows may set a question pool: pool_size, pool_strata (ans_type or marks), shuffle_options.
+class ImportAPI(Resource):
+    @limited("import", write=True)
+    @auth_required("token")
+    @roles_required("admin")
+    def post(self):
+        fmt = request.args.get("format") or ("csv" if request.mimetype == "text/csv" else "jsonl")
+        if fmt not in ("csv", "jsonl"):
+            abort(400, message="format must be csv or jsonl")
+        rows = csv_rows(request.stream) if fmt == "csv" else jsonl_rows(request.stream)
+        importer = CatalogImporter(current_app.config["IMPORT_CHUNK_SIZE"], on_commit=catalog_cache.bump)
+        try:
+            report = importer.run(rows)
+        except (UnicodeDecodeError, csv.Error) as e:
+            db.session.rollback()
+            abort(400, message=f"Unreadable upload after {importer.rows} rows: {e}")
+        status = 201 if not report["error_count"] else 207
+        return sendResponse(status, message="Import finished", data=report)
+
 class QuizChapterAPI(Resource):
-    @marshal_with(quiz_fields)
     @auth_required("token")
     @roles_accepted("user", "admin")
     def get(self, chapter_id):
-        chapter = Chapter.query.get(chapter_id)
-        if not chapter:
+        etag = catalog_cache.etag("chapter", chapter_id, "quizzes")
+        cached = notModified(etag)
+        if cached:
+            return cached
+        quizzes = catalog_cache.slice("chapter_quizzes", chapter_id, lambda: self._load(chapter_id))
+        if quizzes is None:
             abort(404, message="Chapter does not exist.")
-        quizzes = chapter.quizzes
         if not quizzes:
             abort(404, message="Currently no quiz exists for this chapter.")
-        return quizzes
+        return sendTagged(quizzes, etag)
+
+    @staticmethod
+    def _load(chapter_id):
+        chapter = Chapter.query.get(chapter_id)
+        if not chapter:
+            return None
+        return serialize(chapter.quizzes, quiz_fields)
         
         
 class QuizIdAPI(Resource):
-    @marshal_with(quiz_fields_with_questions)
     @auth_required("token")
     def get(self, quiz_id):
-        quiz = Quiz.query.get(quiz_id)
+        # Students get a pooled quiz without its questions, they are drawn per session
+        view = "full" if current_user.has_role("admin") else "student"
+        etag = catalog_cache.etag("quiz", quiz_id, view)
+        cached = notModified(etag)
+        if cached:
+            return cached
+        quiz = catalog_cache.slice("quiz", quiz_id, lambda: self._load(quiz_id))
         if not quiz:
             abort(404, message="Quiz does not exist")
             #return jsonify({"message": "Quiz does not exist"}),404
-        return quiz
+        if view == "student" and (quiz["pool_size"] or quiz["shuffle_options"]):
+            quiz = {**quiz, "questions": []}
+        return sendTagged(quiz, etag)
+
+    @staticmethod
+    def _load(quiz_id):
+        quiz = Quiz.query.options(selectinload(Quiz.questions)).filter(Quiz.id == quiz_id).first()
+        return serialize(quiz, quiz_fields_with_questions) if quiz else None
     
     @auth_required("token")
     @roles_required("admin")
@@ -355,9 +542,12 @@ class QuizIdAPI(Resource):
         if not quiz:
             abort(404, message="Quiz does not exist")
             #return jsonify({"message": "Quiz does not exist"}), 404
+        if request.args.get("mode") == "background":
+            return queuePurge("quiz", quiz_id)
         try:
             db.session.delete(quiz)
             db.session.commit()
+            catalog_cache.bump()
             return sendResponse(200, message="Quiz deleted successfully")
             #return jsonify({"message": "Quiz deleted successfully"}), 200
         except Exception as e:
@@ -370,7 +560,7 @@ class QuizIdAPI(Resource):
 
 class QuestionsAPI(Resource):
     # GET QUSTIONS FOR A QUIZ
-    @marshal_with(question_fields)
+    @serialize_with(question_fields)
     @auth_required("token")
     @roles_accepted("admin","user")
     def get(self, quiz_id):
@@ -378,6 +568,8 @@ class QuestionsAPI(Resource):
         if not quiz:
             abort(400, message="Chapter does not exist")
             #return jsonify({"message": "Chapter does not exist"}), 400
+        if is_pooled(quiz_id) and not current_user.has_role("admin"):
+            abort(403, message="Questions of this quiz are drawn per attempt, start a quiz session")
         questions = quiz.questions
         return questions
     
@@ -426,6 +618,7 @@ class QuestionIdAPI(Resource):
         try:
             db.session.delete(question)
             db.session.commit()
+            catalog_cache.bump()
             return sendResponse(200, message="Question deleted succeessfully")
             #return jsonify({"message": "Question deleted succeessfully"}), 200
         except Exception as e:
@@ -435,15 +628,21 @@ class QuestionIdAPI(Resource):
 class AttemptsAPI(Resource):
     @auth_required("token")
     @roles_accepted("user", "admin")
-    @marshal_with(attempts_fields)
     def get(self, user_id, quiz_id):
-        attempts = Attempt.query.filter_by(student_id = user_id, quiz_id = quiz_id).order_by(Attempt.attempt_number.desc()).all()
-        if not attempts:
+        # Newest first, so the cursor is the last attempt_number seen and pages walk downwards
+        cursor, limit, _, names = pageArgs(attempts_fields)
+        query = Attempt.query.filter_by(student_id = user_id, quiz_id = quiz_id)
+        if cursor is not None:
+            query = query.filter(Attempt.attempt_number < cursor)
+        attempts = query.order_by(Attempt.attempt_number.desc()).limit(limit + 1).all()
+        if not attempts and cursor is None:
             abort(404, message="User has not attempt this quiz before")
-        return attempts
+        next_cursor = attempts[limit - 1].attempt_number if len(attempts) > limit else None
+        return sendPage(serialize(attempts[:limit], attempts_fields, names=names), next_cursor)
 
 
 class ResponseAPI(Resource):
+    @limited("submit", write=True)
     @auth_required("token")
     @roles_accepted("admin","user")
     def post(self, quiz_id):
@@ -456,26 +655,20 @@ class ResponseAPI(Resource):
         quiz = Quiz.query.get(quiz_id)
         if not quiz:
             abort(404, message="No quiz corresponding to given quiz id")
+        # Timed and pooled quizzes only take answers through a session, which holds the deadline and the paper
+        if quiz.time_limit or is_pooled(quiz_id):
+            abort(409, message=f"Answers to this quiz are submitted through a quiz session: POST /api/quiz/{quiz_id}/session")
         try:
-            prev_attempt = Attempt.query.filter_by(student_id=user_id, quiz_id=quiz_id).order_by(Attempt.attempt_number.desc()).first()
-            new_attempt_number = (prev_attempt.attempt_number+1) if prev_attempt else 1
-            new_attempt = Attempt(student_id=user_id, quiz_id=quiz_id, attempt_number=new_attempt_number)
-            db.session.add(new_attempt)
-            db.session.flush()
-            for answer in response:
-                attempt_id = new_attempt.id
-                question_id = int(answer["question_id"])
-                answer = (answer.get("answer") if answer.get("answer") != [] else None)
-                res = Response(attempt_id=attempt_id, question_id=question_id, answer=answer)
-                db.session.add(res)
+            status, message, result = recordSubmission(user_id, quiz_id, parseAnswers(response))
             db.session.commit()
-            ## Grading process to come later.
-            return sendResponse(201, message="Responses recorded successfully.")
+            if status == 202:
+                submission_queue.notify()
+            return sendResponse(status, message=message, data=result)
         except Exception as e:
             db.session.rollback()
             abort(500, message=f"Error in recording responses: {e}")
     
-    @marshal_with(response_fields)
+    @serialize_with(response_fields)
     @auth_required("token")
     @roles_accepted("admin","user")
     def get(self, quiz_id):
@@ -483,9 +676,227 @@ class ResponseAPI(Resource):
         if not quiz:
             abort(404, message="No quiz corresponding to given quiz id")
         attempt = Attempt.query.filter_by(quiz_id=quiz_id).first()
-        responses = attempt.responses
+        responses = attempt_responses(attempt)
         return responses
 
+class SubmissionAPI(Resource):
+    # GRADING STATUS OF A QUEUED SUBMISSION, POLL UNTIL status IS graded OR failed
+    @auth_required("token")
+    @roles_accepted("admin","user")
+    def get(self, submission_id):
+        status = submission_status(submission_id)
+        if not status:
+            abort(404, message="No submission corresponding to given submission id")
+        if status["student_id"] != current_user.id and not current_user.has_role("admin"):
+            abort(403, message="Not your submission")
+        if status["status"] in ("queued", "grading"):
+            # Rows left queued by a restart are picked up once this process has a worker running
+            submission_queue.start()
+            return status, 200, {"Retry-After": "1"}
+        return status, 200
+
+# TIMED QUIZ SESSIONS: POST /api/quiz/<id>/session starts one (or resumes the open one),
+# heartbeats save the answers so far and submit grades them like ResponseAPI.post.
+# Past its deadline a session is submitted with the answers of its last heartbeat.
+def ownedSession(session_id):
+    session = quiz_sessions.get(session_id)
+    if session is None:
+        abort(404, message="No quiz session corresponding to given session id")
+    if session.student_id != current_user.id and not current_user.has_role("admin"):
+        abort(403, message="Not your quiz session")
+    return session
+
+def sessionClosed(session):
+    # Swept and forgotten while the request was in flight
+    if session is None:
+        abort(410, message="Quiz session no longer exists")
+    if session.status == EXPIRED:
+        abort(409, message="Time limit reached, the answers saved by the last heartbeat were submitted", data=session.view())
+    abort(409, message="Quiz session already submitted", data=session.view())
+
+def sessionAnswers(data):
+    if data.get("responses") is None:
+        return None
+    try:
+        return [list(answer) for answer in parseAnswers(data["responses"])]
+    except (KeyError, TypeError, ValueError):
+        abort(400, message="Invalid responses")
+
+class QuizSessionAPI(Resource):
+    @limited("session", write=True)
+    @auth_required("token")
+    @roles_accepted("admin","user")
+    def post(self, quiz_id):
+        quiz = Quiz.query.get(quiz_id)
+        if not quiz:
+            abort(404, message="No quiz corresponding to given quiz id")
+        try:
+            session, resumed = quiz_sessions.start(current_user.id, quiz)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            abort(500, message=f"Error starting quiz session: {e}")
+        if resumed:
+            return sendResponse(200, message="Quiz session resumed", data=session.view())
+        return sendResponse(201, message="Quiz session started", data=session.view())
+
+class SessionIdAPI(Resource):
+    @auth_required("token")
+    @roles_accepted("admin","user")
+    def get(self, session_id):
+        return ownedSession(session_id).view(), 200
+
+class SessionQuestionsAPI(Resource):
+    # THE SESSION'S QUESTION PAPER, IN THE ORDER AND WITH THE OPTION ORDER THE STUDENT ANSWERS IN
+    @auth_required("token")
+    @roles_accepted("admin","user")
+    def get(self, session_id):
+        paper = quiz_sessions.paper(ownedSession(session_id))
+        if paper is None:
+            abort(404, message="No quiz corresponding to given quiz id")
+        return {"session_id": session_id, "total_marks": paper.total_marks, "questions": paper_questions(paper)}, 200
+
+class SessionHeartbeatAPI(Resource):
+    # {"responses": [...]} optional, without it the deadline is only checked
+    @limited("heartbeat", write=True)
+    @auth_required("token")
+    @roles_accepted("admin","user")
+    def post(self, session_id):
+        session = ownedSession(session_id)
+        if session.status != ACTIVE:
+            sessionClosed(session)
+        answers = sessionAnswers(request.get_json(silent=True) or {})
+        saved = quiz_sessions.heartbeat(session, answers)
+        db.session.commit()
+        if not saved:
+            sessionClosed(quiz_sessions.get(session_id))
+        view = session.view()
+        return {"session_id": session.id, "status": ACTIVE, "expires_at": view["expires_at"], "remaining_seconds": view["remaining_seconds"]}, 200
+
+class SessionSubmitAPI(Resource):
+    # {"responses": [...]} as for ResponseAPI.post, without it the saved answers are submitted
+    @limited("submit", write=True)
+    @auth_required("token")
+    @roles_accepted("admin","user")
+    def post(self, session_id):
+        session = ownedSession(session_id)
+        if session.status != ACTIVE:
+            sessionClosed(session)
+        answers = sessionAnswers(request.get_json(silent=True) or {})
+        finished = quiz_sessions.finish(session)
+        if finished is None:
+            sessionClosed(quiz_sessions.get(session_id))
+        try:
+            # Positions as shown on the paper back to stored option indices
+            paper = quiz_sessions.paper(finished)
+            answers = finished.answers if answers is None else answers
+            answers = paper.canonical(answers) if paper else answers
+            status, message, result = recordSubmission(finished.student_id, finished.quiz_id, answers, paper)
+            quiz_sessions.record_result(finished, result.get("attempt_id"), result.get("submission_id"))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            quiz_sessions.reopen(finished)
+            abort(500, message=f"Error in recording responses: {e}")
+        if status == 202:
+            submission_queue.notify()
+        return sendResponse(status, message=message, data={"session_id": finished.id, **result})
+
+class PurgeAPI(Resource):
+    # PROGRESS OF A BACKGROUND DELETE
+    @auth_required("token")
+    @roles_required("admin")
+    def get(self, job_id):
+        status = purge.job_status(job_id)
+        if not status:
+            abort(404, message="No deletion job corresponding to given job id")
+        return status, 200
+
+# EXPORT ATTEMPTS OR RESPONSES
+# ?kind=attempts|responses&format=csv|jsonl&scope=all|quiz|chapter&id=<quiz or chapter id>
+class ExportAPI(Resource):
+    @auth_required("token")
+    @roles_required("admin")
+    def get(self):
+        kind = request.args.get("kind", "responses")
+        fmt = request.args.get("format", "csv")
+        scope = request.args.get("scope", "all")
+        scope_id = request.args.get("id", type=int)
+        if kind not in ("attempts", "responses") or fmt not in ("csv", "jsonl") or scope not in ("all", "quiz", "chapter"):
+            abort(400, message="Invalid export options")
+        if scope != "all" and scope_id is None:
+            abort(400, message=f"An id is required to export a {scope}")
+        statement, columns = (attempts_query if kind == "attempts" else responses_query)(scope, scope_id)
+        batch_size = current_app.config["EXPORT_BATCH_SIZE"]
+        rows = stream_rows(statement, batch_size)
+        if kind == "responses":
+            rows = chain(rows, packed_response_rows(scope, scope_id, batch_size))
+        chunks = (csv_chunks if fmt == "csv" else jsonl_chunks)(rows, columns, batch_size)
+        filename = f"{kind}_{scope}{'' if scope_id is None else '_' + str(scope_id)}.{fmt}"
+        return current_app.response_class(
+            stream_with_context(chunks),
+            mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+            headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+class LeaderboardAPI(Resource):
+    # BEST SCORE PER STUDENT, HIGHEST FIRST. ?limit=<n>&cursor=<best_score>:<student_id>
+    @auth_required("token")
+    @roles_accepted("admin","user")
+    def get(self, quiz_id):
+        if not Quiz.query.get(quiz_id):
+            abort(404, message="No quiz corresponding to given quiz id")
+        _, limit, _, _ = pageArgs({})
+        after = None
+        if request.args.get("cursor"):
+            try:
+                score, student_id = request.args["cursor"].split(":")
+                after = (int(score), int(student_id))
+            except ValueError:
+                abort(400, message="cursor must be <best_score>:<student_id>")
+        page, next_cursor = leaderboard_page(quiz_id, limit, after)
+        return sendPage(page, next_cursor)
+
+class SearchAPI(Resource):
+    # RANKED SEARCH OVER SUBJECTS, CHAPTERS, QUIZZES AND QUESTIONS
+    # ?q=<text>&kind=<subject,chapter,quiz,question>&limit=<n>&cursor=<offset>
+    @auth_required("token")
+    @roles_accepted("admin","user")
+    def get(self):
+        q = request.args.get("q", "").strip()
+        if not q:
+            abort(400, message="q is required")
+        kinds = tuple(sorted(set(request.args.get("kind", "").split(",")) - {""}))
+        if set(kinds) - set(KINDS):
+            abort(400, message=f"kind must be among {', '.join(KINDS)}")
+        cursor, limit, _, _ = pageArgs({})
+        # Students do not get the questions of pooled quizzes, they are drawn per session
+        hide_pooled = not current_user.has_role("admin")
+        page = (q.lower(), kinds, cursor, limit, hide_pooled)
+        etag = catalog_cache.etag("search", hashlib.sha1(repr(page).encode()).hexdigest()[:16])
+        cached = notModified(etag)
+        if cached:
+            return cached
+        results, next_cursor = catalog_cache.slice("search", page, lambda: search(q, kinds, limit, cursor, hide_pooled))
+        return sendPage(results, next_cursor, etag)
+
+class QuizStatsAPI(Resource):
+    # MEAN, MEDIAN AND ATTEMPT COUNT FOR A QUIZ
+    @auth_required("token")
+    @roles_accepted("admin","user")
+    def get(self, quiz_id):
+        if not Quiz.query.get(quiz_id):
+            abort(404, message="No quiz corresponding to given quiz id")
+        return quiz_summary(quiz_id), 200
+
+class ItemAnalyticsAPI(Resource):
+    # DIFFICULTY, DISCRIMINATION AND ANSWER DISTRIBUTION PER QUESTION
+    @auth_required("token")
+    @roles_required("admin")
+    def get(self, quiz_id):
+        if not Quiz.query.get(quiz_id):
+            abort(404, message="No quiz corresponding to given quiz id")
+        return item_report(quiz_id), 200
+
 api.add_resource(SubjectAPI, "/subject") # Get list of all subjects or create a new subject
 api.add_resource(SubjectIdAPI, "/subject/<int:subject_id>") 
 api.add_resource(ChapterAPI, "/chapter")
@@ -494,8 +905,21 @@ api.add_resource(SubjectChaptersAPI, "/subject/<int:subject_id>/chapter")
 api.add_resource(QuizChapterAPI, "/chapter/<int:chapter_id>/quiz")
 api.add_resource(QuizAPI, "/quiz")
 api.add_resource(QuizIdAPI, "/quiz/<int:quiz_id>")
+api.add_resource(ImportAPI, "/import")
+api.add_resource(ExportAPI, "/export")
 api.add_resource(QuestionsAPI, "/question")
 api.add_resource(QuestionIdAPI, "/question/<int:question_id>")
 api.add_resource(ResponseAPI, "/quiz/<int:quiz_id>/response")
+api.add_resource(SubmissionAPI, "/submission/<int:submission_id>")
+api.add_resource(PurgeAPI, "/purge/<int:job_id>")
+api.add_resource(QuizSessionAPI, "/quiz/<int:quiz_id>/session")
+api.add_resource(SessionIdAPI, "/session/<string:session_id>")
+api.add_resource(SessionQuestionsAPI, "/session/<string:session_id>/questions")
+api.add_resource(SessionHeartbeatAPI, "/session/<string:session_id>/heartbeat")
+api.add_resource(SessionSubmitAPI, "/session/<string:session_id>/submit")
+api.add_resource(LeaderboardAPI, "/quiz/<int:quiz_id>/leaderboard")
+api.add_resource(SearchAPI, "/search")
+api.add_resource(QuizStatsAPI, "/quiz/<int:quiz_id>/stats")
+api.add_resource(ItemAnalyticsAPI, "/quiz/<int:quiz_id>/analytics")
 api.add_resource(AttemptsAPI, "/quiz/<int:user_id>/<int:quiz_id>/attempts")
 
@@ -1,24 +1,37 @@
-from flask import current_app as app
-from flask import render_template, request, jsonify
+from flask import Blueprint, current_app, render_template, request, jsonify
+from werkzeug.local import LocalProxy
 from flask_security.decorators import auth_required, roles_required
-from flask_security.utils import verify_password, hash_password
-from .models import db
+from .models import db, Attempt
+from .leaderboard import rebuild
+from .catalog import catalog_cache
+from .auth import auth_cache
+from .hashing import hasher, HasherSaturated
+from .submissions import submission_queue
+from .quiz_sessions import quiz_sessions
+from .ratelimit import limited, rate_limiter
 from flask_security.datastore import SQLAlchemyUserDatastore
 
 
-datastore : SQLAlchemyUserDatastore = app.security.datastore # type: ignore
+routes = Blueprint("routes", __name__)
+datastore : SQLAlchemyUserDatastore = LocalProxy(lambda: current_app.security.datastore) # type: ignore
 
-@app.route("/")
+@routes.route("/")
 def home():
     return render_template("index.html")
 
-@app.route("/protected")
+@routes.route("/protected")
 @auth_required("token")
 def protected():
     return "<h1>only accessible by user</h1>"
 
 
-@app.route("/api/login", methods=["POST"]) # type: ignore
+@routes.app_errorhandler(HasherSaturated)
+def hasher_saturated(e):
+    return jsonify({"message": "Server is busy, please retry shortly"}), 503, {"Retry-After": "1"}
+
+
+@routes.route("/api/login", methods=["POST"]) # type: ignore
+@limited("login")
 def login():
     data = request.get_json()
     email = data.get("email")
@@ -32,13 +45,14 @@ def login():
         if not user:
             return jsonify({"message": "Invalid Email"}), 400
         else:
-            if verify_password(password=password, password_hash=user.password): # type: ignore
+            if hasher.verify(password, user.password): # type: ignore
                 return jsonify({"token": user.get_auth_token(), "email":user.email, "role":user.roles[0].name, "id":user.id}), 200
             else:
                 return jsonify({"message": "Invalid Password"}), 400
             
             
-@app.route("/api/register", methods=["POST"]) # type: ignore
+@routes.route("/api/register", methods=["POST"]) # type: ignore
+@limited("account", write=True)
 def register():
     data = request.get_json()
     name = data.get("name")
@@ -47,8 +61,9 @@ def register():
     if not email or not name or not password:
         return jsonify({"message": "Invalid inputs"}), 400
     if not datastore.find_user(email=email):
+        password_hash = hasher.hash(password)
         try:
-            datastore.create_user(name=name, email=email, password=hash_password(password), roles = ["user"])
+            datastore.create_user(name=name, email=email, password=password_hash, roles = ["user"])
             db.session.commit()
             return jsonify({"message": "User created successfully"}), 200
         except Exception as e:
@@ -58,7 +73,8 @@ def register():
         return jsonify({"message": "Email already exists"}), 400
         
         
-@app.route("/api/delete_account", methods=["POST"])# type: ignore
+@routes.route("/api/delete_account", methods=["POST"])# type: ignore
+@limited("account", write=True)
 def delete_acc():
     data = request.get_json()
     email = data.get("email")
@@ -70,10 +86,13 @@ def delete_acc():
         if not user:
             return jsonify({"message": "Invalid Email"}), 400
         else:
-            if verify_password(password=password, password_hash=user.password): # type: ignore
+            if hasher.verify(password, user.password): # type: ignore
                 try:
                     user = datastore.find_user(email=email)
+                    quiz_ids = [quiz_id for (quiz_id,) in db.session.query(Attempt.quiz_id).filter(Attempt.student_id == user.id).distinct()] # type: ignore
                     datastore.delete_user(user=user) # type: ignore
+                    db.session.flush()
+                    rebuild(quiz_ids)
                     db.session.commit()
                     return jsonify({"message":"User Deleted Successfully."}), 200
                 except Exception as e:
@@ -82,7 +101,7 @@ def delete_acc():
             else:
                 return jsonify({"message": "Invalid Password"}), 400
         
-@app.route("/api/user_activation", methods=["POST"]) # type: ignore
+@routes.route("/api/user_activation", methods=["POST"]) # type: ignore
 @auth_required("token")
 @roles_required("admin")
 def update_user_status():
@@ -100,4 +119,36 @@ def update_user_status():
             db.session.rollback()
             return jsonify({"message":f"Unable to change user status: {str(e)}"}), 400
 
+@routes.route("/api/cache_stats") # type: ignore
+@auth_required("token")
+@roles_required("admin")
+def cache_stats():
+    return jsonify({"catalog": catalog_cache.stats(), "auth": auth_cache.stats()}), 200
+
 
+@routes.route("/api/hasher_stats") # type: ignore
+@auth_required("token")
+@roles_required("admin")
+def hasher_stats():
+    return jsonify(hasher.stats()), 200
+
+
+@routes.route("/api/submission_stats") # type: ignore
+@auth_required("token")
+@roles_required("admin")
+def submission_stats():
+    return jsonify(submission_queue.stats()), 200
+
+
+@routes.route("/api/quiz_session_stats") # type: ignore
+@auth_required("token")
+@roles_required("admin")
+def quiz_session_stats():
+    return jsonify(quiz_sessions.stats()), 200
+
+
+@routes.route("/api/rate_limit_stats") # type: ignore
+@auth_required("token")
+@roles_required("admin")
+def rate_limit_stats():
+    return jsonify(rate_limiter.stats()), 200
@@ -0,0 +1,134 @@
+import re
+from weakref import WeakKeyDictionary
+from sqlalchemy import String, cast, literal, or_, select, text, union_all
+from .models import Chapter, Question, Quiz, Subject, db
+
+# One FTS5 index over subjects, chapters, quizzes and questions. It is kept in sync by
+# triggers on the four tables, so rows created or deleted by the resource handlers, the
+# bulk importer or cascades land in the same transaction as the change itself. The rowid
+# encodes (kind, id) so a trigger finds its index row without a scan.
+KINDS = {"subject": 0, "chapter": 1, "quiz": 2, "question": 3}
+# (table, title column, body column, parent column) per kind
+SOURCES = {
+    "subject": ("subject", "name", "description", "NULL"),
+    "chapter": ("chapter", "name", "description", "NULL"),
+    "quiz": ("quiz", "name", "description", "chapter_id"),
+    "question": ("question", "question_statement", "options", "quiz_id"),
+}
+# bm25 column weights: matches in the title count ten times as much as in the body
+RANK = "bm25(search_index, 10.0, 1.0)"
+
+
+_fts5 = WeakKeyDictionary()  # engine -> FTS5 compiled in
+
+
+# SQLite with the FTS5 extension compiled in. Checked once per engine; without it migration 2
+# creates no index and search falls back to like_search.
+def available(connection):
+    if connection.dialect.name != "sqlite":
+        return False
+    engine = connection.engine
+    if engine not in _fts5:
+        _fts5[engine] = bool(connection.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+    return _fts5[engine]
+
+
+def _rowid(kind, alias):
+    return f"{alias}.id * {len(KINDS)} + {KINDS[kind]}"
+
+
+def _insert(kind, alias):
+    table, title, body, parent = SOURCES[kind]
+    parent = "NULL" if parent == "NULL" else f"{alias}.{parent}"
+    return (f"INSERT INTO search_index (rowid, title, body, kind, ref_id, parent_id) "
+            f"VALUES ({_rowid(kind, alias)}, {alias}.{title}, {alias}.{body}, '{kind}', {alias}.id, {parent});")
+
+
+def create_index(connection):
+    connection.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "title, body, kind UNINDEXED, ref_id UNINDEXED, parent_id UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+    for kind, (table, title, body, parent) in SOURCES.items():
+        delete = f"DELETE FROM search_index WHERE rowid = {_rowid(kind, 'old')};"
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS search_{table}_insert AFTER INSERT ON {table} BEGIN {_insert(kind, 'new')} END")
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS search_{table}_delete AFTER DELETE ON {table} BEGIN {delete} END")
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS search_{table}_update AFTER UPDATE ON {table} BEGIN {delete} {_insert(kind, 'new')} END")
+
+
+# Repopulates the index from the source tables and merges its b-trees. Returns the row count.
+def rebuild(connection):
+    connection.exec_driver_sql("DELETE FROM search_index")
+    for kind, (table, title, body, parent) in SOURCES.items():
+        parent = "NULL" if parent == "NULL" else f"source.{parent}"
+        connection.exec_driver_sql(
+            f"INSERT INTO search_index (rowid, title, body, kind, ref_id, parent_id) "
+            f"SELECT {_rowid(kind, 'source')}, source.{title}, source.{body}, '{kind}', source.id, {parent} FROM {table} AS source")
+    connection.exec_driver_sql("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    return connection.exec_driver_sql("SELECT count(*) FROM search_index").scalar()
+
+
+# Free text to an FTS5 query: every word must match, the last one as a prefix so results
+# show up while typing. Quoting each term keeps FTS5 operators in user input inert.
+def match_query(q):
+    terms = re.findall(r"\w+", q or "")
+    if not terms:
+        return None
+    return " ".join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+
+
+# Quizzes whose questions students only see through a drawn paper, see backend/pools.py
+POOLED_QUIZZES = "SELECT id FROM quiz WHERE pool_size IS NOT NULL OR shuffle_options"
+
+
+# One page of ranked results, best first. cursor is the offset of the page. hide_pooled
+# leaves out the questions of pooled quizzes, for students.
+def search(q, kinds=None, limit=20, cursor=None, hide_pooled=False):
+    query = match_query(q)
+    if query is None:
+        return [], None
+    offset = cursor or 0
+    if not available(db.session.connection()):
+        return like_search(q, kinds, limit, offset, hide_pooled)
+    kind_filter = ""
+    params = {"query": query, "limit": limit + 1, "offset": offset}
+    if kinds:
+        kind_filter = " AND kind IN (" + ", ".join(f":kind{index}" for index in range(len(kinds))) + ")"
+        params.update({f"kind{index}": kind for index, kind in enumerate(kinds)})
+    if hide_pooled:
+        kind_filter += f" AND NOT (kind = 'question' AND parent_id IN ({POOLED_QUIZZES}))"
+    rows = db.session.execute(text(
+        f"SELECT kind, ref_id, parent_id, title, snippet(search_index, -1, '[', ']', '...', 12) AS snippet, {RANK} AS score "
+        f"FROM search_index WHERE search_index MATCH :query{kind_filter} "
+        f"ORDER BY score, rowid LIMIT :limit OFFSET :offset"), params).all()
+    next_cursor = offset + limit if len(rows) > limit else None
+    return [{"kind": kind, "id": ref_id, "parent_id": parent_id, "title": title, "snippet": snippet, "score": round(-score, 4)}
+            for kind, ref_id, parent_id, title, snippet, score in rows[:limit]], next_cursor
+
+
+# The LIKE '%term%' scan over the four tables that the index replaces. Kept as the
+# benchmark baseline and as the fallback on databases without FTS5.
+def like_search(q, kinds=None, limit=20, offset=0, hide_pooled=False):
+    terms = re.findall(r"\w+", q or "")
+    sources = {
+        "subject": (Subject, Subject.name, Subject.description, literal(None)),
+        "chapter": (Chapter, Chapter.name, Chapter.description, literal(None)),
+        "quiz": (Quiz, Quiz.name, Quiz.description, Quiz.chapter_id),
+        "question": (Question, Question.question_statement, cast(Question.options, String), Question.quiz_id),
+    }
+    selects = []
+    for kind, (model, title, body, parent) in sources.items():
+        if kinds and kind not in kinds:
+            continue
+        conditions = [or_(title.ilike(f"%{term}%"), body.ilike(f"%{term}%")) for term in terms]
+        if hide_pooled and kind == "question":
+            conditions.append(Question.quiz_id.not_in(select(Quiz.id).where(or_(Quiz.pool_size.isnot(None), Quiz.shuffle_options))))
+        selects.append(select(literal(kind).label("kind"), model.id.label("id"), parent.label("parent_id"), title.label("title"))
+                       .where(*conditions))
+    if not selects or not terms:
+        return [], None
+    combined = union_all(*selects).subquery()
+    rows = db.session.execute(select(combined).order_by(combined.c.kind, combined.c.id).limit(limit + 1).offset(offset)).all()
+    next_cursor = offset + limit if len(rows) > limit else None
+    return [{"kind": kind, "id": ref_id, "parent_id": parent_id, "title": title, "snippet": None, "score": None}
+            for kind, ref_id, parent_id, title in rows[:limit]], next_cursor
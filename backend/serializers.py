@@ -0,0 +1,153 @@
+import json
+import time
+from functools import wraps
+from operator import attrgetter
+from flask import current_app, make_response
+from flask_restful import fields, unpack
+from .profiling import record
+
+try:
+    import orjson
+except ImportError:  # declared in pyproject.toml; the stdlib encoder covers installs without it
+    orjson = None
+
+# Precompiled replacements for flask_restful.marshal. A schema (the same fields dicts the
+# resources already declare) is compiled once into a converter that pulls every column with
+# a single attrgetter call and formats it with a plain function, producing exactly what
+# marshal() would for the field types used here. Converters take ORM objects, Row tuples
+# or dicts. Field types without a fast path fall back to field.output().
+
+_converters = {}
+
+
+def _formatter(field):
+    kind = type(field)
+    if kind is fields.Integer:
+        default = field.default
+        return lambda value: default if value is None else int(value)
+    if kind is fields.String:
+        return lambda value: None if value is None else str(value)
+    if kind is fields.Boolean:
+        return lambda value: None if value is None else bool(value)
+    if kind is fields.DateTime:
+        return lambda value: None if value is None else field.format(value)
+    if kind is fields.List and type(field.container) in (fields.String, fields.Integer):
+        item = _formatter(field.container)
+        return lambda value: None if value is None else [item(element) for element in value]
+    return None
+
+
+def _compile(schema, depth, names):
+    keys, attributes, formatters, slow = [], [], [], {}
+    for key, field in schema.items():
+        if names and key not in names:
+            continue
+        if isinstance(field, type):
+            field = field()
+        if isinstance(field, fields.List) and isinstance(field.container, fields.Nested):
+            # Nested lists below the requested depth are dropped, like projected schemas
+            if depth is not None and depth < 1:
+                continue
+            nested = compiled(field.container.nested, None if depth is None else depth - 1)
+            formatter = lambda value, nested=nested: None if value is None else [nested(item) for item in value]
+        else:
+            formatter = _formatter(field)
+        attribute = field.attribute or key
+        if formatter is None or not isinstance(attribute, str) or "." in attribute:
+            slow[key] = field
+            continue
+        keys.append(key)
+        attributes.append(attribute)
+        formatters.append(formatter)
+
+    getter = attrgetter(*attributes) if attributes else lambda obj: ()
+    single = len(attributes) == 1
+    order = list(schema) if slow else None
+
+    def values(obj):
+        if obj is None:
+            return (None,) * len(attributes)
+        if isinstance(obj, dict):
+            return tuple(obj.get(attribute) for attribute in attributes)
+        try:
+            found = getter(obj)
+        except AttributeError:
+            found = tuple(getattr(obj, attribute, None) for attribute in attributes)
+        return (found,) if single else found
+
+    def convert(obj):
+        data = {key: formatter(value) for key, formatter, value in zip(keys, formatters, values(obj))}
+        if slow:
+            data.update((key, field.output(key, obj)) for key, field in slow.items())
+            data = {key: data[key] for key in order if key in data}
+        return data
+
+    return convert
+
+
+def compiled(schema, depth=None, names=None):
+    if isinstance(names, str):
+        names = frozenset(names.split(","))
+    cache_key = (id(schema), depth, names)
+    converter = _converters.get(cache_key)
+    if converter is None:
+        if len(_converters) >= 1024:
+            # depth comes from the query string, keep the cache bounded
+            _converters.clear()
+        converter = _converters[cache_key] = _compile(schema, depth, names)
+    return converter
+
+
+# Drop-in for marshal(data, schema), with the depth / fields projection of list endpoints
+def serialize(data, schema, depth=None, names=None):
+    started = time.perf_counter()
+    convert = compiled(schema, depth, names)
+    if isinstance(data, (list, tuple)):
+        data = [convert(item) for item in data]
+    else:
+        data = convert(data)
+    record("serialize", time.perf_counter() - started)
+    return data
+
+
+# Drop-in for flask_restful's marshal_with
+def serialize_with(schema):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            response = fn(*args, **kwargs)
+            if isinstance(response, tuple):
+                data, code, headers = unpack(response)
+                return serialize(data, schema), code, headers
+            return serialize(response, schema)
+        return wrapper
+    return decorator
+
+
+def dumps(data):
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass
+    return json.dumps(data, separators=(",", ":")) + "\n"
+
+
+# JSON representation for the Api. Same contract as flask_restful's output_json, but
+# compact and encoded with orjson when it is installed. RESTFUL_JSON settings or debug
+# mode switch back to the standard encoder so indentation still works there.
+def output_json(data, code, headers=None):
+    started = time.perf_counter()
+    settings = current_app.config.get("RESTFUL_JSON")
+    if settings or current_app.debug:
+        settings = dict(settings or {})
+        if current_app.debug:
+            settings.setdefault("indent", 4)
+        body = json.dumps(data, **settings) + "\n"
+    else:
+        body = dumps(data)
+    record("serialize", time.perf_counter() - started)
+    response = make_response(body, code)
+    response.headers.extend(headers or {})
+    return response
+
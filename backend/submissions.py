@@ -0,0 +1,243 @@
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from sqlalchemy import and_, func, insert, or_, select, update
+from .models import Attempt, Response, Submission, db
+from .attempts import allocate_attempts
+from .grading import load_answer_key, load_answer_keys
+from .leaderboard import record_attempt, record_attempts
+from .analytics import ItemCounters, record_responses
+from .packing import encode, packed_storage, response_rows, save_attempt
+from .pools import draw
+
+# With SUBMISSION_MODE=queue a submission is one INSERT into the submission table and the
+# request returns its id straight away. Workers claim the oldest queued rows in batches and
+# grade each batch in one transaction: one query for the answer keys, one bulk insert of
+# the responses and one write of the item counters however many attempts it holds.
+# A claim that is not finished within SUBMISSION_CLAIM_TIMEOUT (the worker died) is
+# claimed again, so nothing submitted is lost as long as the row was committed.
+QUEUED, GRADING, GRADED, FAILED = "queued", "grading", "graded", "failed"
+
+
+# Stores a parsed submission, [(question_id, answer), ...]. Caller commits.
+def enqueue(student_id, quiz_id, answers, paper_seed=None):
+    return db.session.execute(insert(Submission).values(
+        student_id=student_id, quiz_id=quiz_id, answers=[list(answer) for answer in answers],
+        paper_seed=paper_seed, status=QUEUED, submitted_at=datetime.now()
+    ).returning(Submission.id)).scalar_one()
+
+
+# enqueue for many submissions with one INSERT, rows is [(student_id, quiz_id, answers, paper_seed), ...].
+# With claimed=True they are inserted as already claimed, for a caller that grades them
+# itself with SubmissionQueue.grade_claimed. Returns the ids in row order. Caller commits.
+def enqueue_many(rows, claimed=False):
+    now = datetime.now()
+    return db.session.execute(insert(Submission).returning(Submission.id, sort_by_parameter_order=True), [
+        {"student_id": student_id, "quiz_id": quiz_id, "answers": [list(answer) for answer in answers], "paper_seed": paper_seed,
+         "status": GRADING if claimed else QUEUED, "submitted_at": now, "claimed_at": now if claimed else None}
+        for student_id, quiz_id, answers, paper_seed in rows]).scalars().all()
+
+
+# Grades one submission in the request, [(question_id, answer), ...]. For a pooled quiz, paper
+# is the attempt's draw and the answers are already mapped back with paper.canonical().
+# Caller commits.
+def grade_now(student_id, quiz_id, answers, paper=None):
+    # Grade in memory against the precompiled key, then write everything in bulk
+    key = load_answer_key(quiz_id)
+    answers = key.known(answers)
+    results, score = key.grade(answers)
+    paper_seed = paper and paper.seed
+    attempt_id, attempt_number = save_attempt(student_id, quiz_id, answers, results, score, paper_seed)
+    record_attempt(quiz_id, student_id, score)
+    record_responses(key, answers, results, score)
+    total_marks = paper.total_marks if paper_seed is not None else key.total_marks  # type: ignore
+    return {"attempt_id": attempt_id, "attempt_number": attempt_number, "score": score, "total_marks": total_marks}
+
+
+# Marks up to batch_size of the oldest claimable submissions as grading and commits, so
+# concurrent workers (threads or processes) never get the same row.
+def claim(batch_size, claim_timeout):
+    now = datetime.now()
+    claimable = select(Submission.id).where(or_(
+        Submission.status == QUEUED,
+        and_(Submission.status == GRADING, Submission.claimed_at < now - timedelta(seconds=claim_timeout)),
+    )).order_by(Submission.id).limit(batch_size).with_for_update(skip_locked=True)
+    rows = db.session.execute(update(Submission).where(Submission.id.in_(claimable)).values(status=GRADING, claimed_at=now)
+                              .returning(Submission.id, Submission.student_id, Submission.quiz_id, Submission.answers, Submission.paper_seed)).all()
+    db.session.commit()
+    return sorted(rows)
+
+
+# Grades claimed submissions the way ResponseAPI.post does, but for the whole batch at once:
+# attempts, responses, leaderboard aggregates and item counters are each written with one
+# multi-row statement. Caller commits.
+def grade_batch(claimed):
+    keys = load_answer_keys({row[2] for row in claimed})
+    packed = packed_storage()
+    graded = []
+    for submission_id, student_id, quiz_id, answers, paper_seed in claimed:
+        key = keys[quiz_id]
+        answers = key.known([(question_id, answer) for question_id, answer in answers])
+        results, score = key.grade(answers)
+        blob = encode((question_id, answer, is_correct) for (question_id, answer), is_correct in zip(answers, results)) if packed else None
+        paper = None if paper_seed is None else draw(quiz_id, paper_seed)
+        total_marks = paper.total_marks if paper else key.total_marks
+        graded.append((submission_id, student_id, key, answers, results, score, blob, paper_seed, total_marks))
+    attempts = allocate_attempts([(student_id, key.quiz_id, score, blob, paper_seed)
+                                  for _, student_id, key, _, _, score, blob, paper_seed, _ in graded])
+    record_attempts([(key.quiz_id, student_id, score) for _, student_id, key, _, _, score, _, _, _ in graded])
+
+    counters = ItemCounters()
+    rows, finished = [], []
+    now = datetime.now()
+    for (submission_id, _, key, answers, results, score, blob, _, total_marks), (attempt_id, _) in zip(graded, attempts):
+        if blob is None:
+            rows.extend(response_rows(attempt_id, answers, results))
+        for (question_id, answer), is_correct in zip(answers, results):
+            counters.add(key, question_id, answer, is_correct, score)
+        finished.append({"id": submission_id, "status": GRADED, "attempt_id": attempt_id,
+                         "total_marks": total_marks, "graded_at": now})
+    if rows:
+        db.session.execute(insert(Response), rows)
+    counters.write()
+    db.session.execute(update(Submission), finished)
+    return len(finished)
+
+
+def submission_status(submission_id):
+    row = db.session.execute(
+        select(Submission.id, Submission.student_id, Submission.quiz_id, Submission.status, Submission.error,
+               Submission.submitted_at, Submission.graded_at, Submission.attempt_id, Submission.total_marks,
+               Attempt.attempt_number, Attempt.score)
+        .outerjoin(Attempt, Attempt.id == Submission.attempt_id).where(Submission.id == submission_id)
+    ).one_or_none()
+    if row is None:
+        return None
+    status = row._asdict()
+    status = {"submission_id": status.pop("id"), **status}
+    for name in ("submitted_at", "graded_at"):
+        status[name] = status[name] and status[name].isoformat()
+    return status
+
+
+def queue_depth():
+    return dict(db.session.execute(select(Submission.status, func.count()).group_by(Submission.status)).all())
+
+
+# Local grading workers. They are threads of the web process, started by the first
+# submission this process queues rather than by createApp, so CLI commands and processes
+# that never take a submission do not run them. A worker drains the queue every
+# SUBMISSION_POLL_INTERVAL, or as soon as a full batch is waiting: waking it for every
+# submission would add a claim and a grading commit per request, which is what the queue
+# is meant to amortize. SQLite has a single writer, so one worker per process is usually
+# right; `flask grade-submissions` runs the same loop outside the web server.
+class SubmissionQueue():
+    def __init__(self):
+        self.app = None
+        self.mode = "sync"
+        self.workers = 0
+        self.batch_size = 200
+        self.poll_interval = 0.25
+        self.claim_timeout = 300
+        self._threads = []
+        self._pending = 0  # submitted since the last claim
+        self._lock = Lock()
+        self._wake = Event()
+        self._stopping = Event()
+        self.metrics = {"enqueued": 0, "graded": 0, "failed": 0, "batches": 0}
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = app.config["SUBMISSION_MODE"]
+        self.workers = app.config["SUBMISSION_WORKERS"]
+        self.batch_size = app.config["SUBMISSION_BATCH_SIZE"]
+        self.poll_interval = app.config["SUBMISSION_POLL_INTERVAL"]
+        self.claim_timeout = app.config["SUBMISSION_CLAIM_TIMEOUT"]
+
+    @property
+    def enabled(self):
+        return self.mode == "queue"
+
+    # Called after submissions are committed
+    def notify(self, count=1):
+        with self._lock:
+            self.metrics["enqueued"] += count
+            self._pending += count
+            full = self._pending >= self.batch_size
+        self.start()
+        if full:
+            self._wake.set()
+
+    def start(self):
+        with self._lock:
+            if self._threads or not self.workers:
+                return
+            self._stopping.clear()
+            self._threads = [Thread(target=self._loop, name=f"submission-worker-{number}", daemon=True)
+                             for number in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stopping.set()
+        self._wake.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            with self.app.app_context():  # type: ignore
+                try:
+                    done = self.drain_once()
+                except Exception:
+                    self.app.logger.exception("Submission worker failed")  # type: ignore
+                    db.session.rollback()
+                    done = 0
+            if done < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    # Claims and grades one batch, returns how many submissions it took. Needs an app context.
+    def drain_once(self, batch_size=None):
+        with self._lock:
+            self._pending = 0
+        claimed = claim(batch_size or self.batch_size, self.claim_timeout)
+        if claimed:
+            self.grade_claimed(claimed)
+        return len(claimed)
+
+    # Grades claimed rows (submission_id, student_id, quiz_id, answers, paper_seed) and commits.
+    # Returns (graded, failed).
+    def grade_claimed(self, claimed):
+        try:
+            graded = grade_batch(claimed)
+            db.session.commit()
+            failed = 0
+        except Exception:
+            db.session.rollback()
+            # One bad submission must not hold back the others: retry them one at a time
+            graded = failed = 0
+            for row in claimed:
+                try:
+                    graded += grade_batch([row])
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    db.session.execute(update(Submission).where(Submission.id == row[0]).values(
+                        status=FAILED, error=str(e)[:500], graded_at=datetime.now()))
+                    db.session.commit()
+                    failed += 1
+        with self._lock:
+            self.metrics["batches"] += 1
+            self.metrics["graded"] += graded
+            self.metrics["failed"] += failed
+        return graded, failed
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+        return {"mode": self.mode, "workers": len(self._threads), "depth": queue_depth(), **metrics}
+
+
+submission_queue = SubmissionQueue()
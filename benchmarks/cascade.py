@@ -0,0 +1,153 @@
+# Deleting a quiz with a large attempt history, three ways, each in a fresh process on a copy
+# of the same seeded SQLite file:
+#   orm       children loaded into the session and deleted row by row, which is what the
+#             relationship cascades did before passive_deletes (eager loaded here, so this is
+#             a lower bound for the old lazy loading)
+#   database  one DELETE of the quiz, the rest cascades in SQLite
+#   purge     the chunked background purge
+# While it runs, a second connection inserts a row every few milliseconds, like submissions
+# arriving during the delete, and the worst wait for the write lock is reported.
+# Run from the repository root:
+#   python -m benchmarks.cascade --attempts 10000 --questions 10
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from .load_test import create_app, percentile
+
+STRATEGIES = ("orm", "database", "purge")
+QUIZ_ID = 1
+
+
+def seed(attempts, questions, users):
+    from datetime import datetime
+    from sqlalchemy import insert
+    from backend.models import Attempt, Chapter, Question, Quiz, Response, User, db
+    db.session.execute(insert(Chapter).values(id=1, name="Bench chapter", description="Cascade benchmark"))
+    db.session.execute(insert(Quiz), [{"id": quiz_id, "chapter_id": 1, "name": f"Quiz {quiz_id}", "total_marks": questions}
+                                      for quiz_id in (QUIZ_ID, QUIZ_ID + 1)])
+    db.session.execute(insert(User), [{"id": user_id, "name": f"User {user_id}", "email": f"user{user_id}@bench.local",
+                                       "password": "x", "fs_uniquifier": f"bench-{user_id}", "active": True}
+                                      for user_id in range(1, users + 1)])
+    db.session.execute(insert(Question), [{"id": quiz_id * questions + number, "quiz_id": quiz_id, "question_statement": f"Question {number}",
+                                           "ans_type": "single", "options": ["a", "b", "c", "d"], "correct_options": [0], "marks": 1}
+                                          for quiz_id in (QUIZ_ID, QUIZ_ID + 1) for number in range(questions)])
+    now = datetime.now()
+    for start in range(0, attempts, 2000):
+        batch = range(start, min(start + 2000, attempts))
+        db.session.execute(insert(Attempt), [{"id": index + 1, "student_id": index % users + 1, "quiz_id": QUIZ_ID,
+                                              "attempt_number": index // users + 1, "attempt_date": now, "score": 0}
+                                             for index in batch])
+        db.session.execute(insert(Response), [{"attempt_id": index + 1, "question_id": QUIZ_ID * questions + number,
+                                               "answer": [number % 4], "is_correct": number % 4 == 0}
+                                              for index in batch for number in range(questions)])
+    db.session.commit()
+
+
+def writer(engine, stop, waits):
+    from sqlalchemy import text
+    while not stop.is_set():
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO bench_ping (at) VALUES (:at)"), {"at": started})
+        waits.append(time.perf_counter() - started)
+        time.sleep(0.005)
+
+
+def child(strategy, database_path):
+    app = create_app(database_path)
+    from sqlalchemy import text
+    from sqlalchemy.orm import selectinload
+    from backend.models import Attempt, Question, Quiz, db
+    from backend import purge
+    with app.app_context():
+        engine = db.engine
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE IF NOT EXISTS bench_ping (id INTEGER PRIMARY KEY, at FLOAT)"))
+        stop, waits = threading.Event(), []
+        thread = threading.Thread(target=writer, args=(engine, stop, waits))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        thread.start()
+        started = time.perf_counter()
+        if strategy == "orm":
+            quiz = Quiz.query.options(selectinload(Quiz.attempt).selectinload(Attempt.responses),
+                                      selectinload(Quiz.questions).selectinload(Question.responses)).get(QUIZ_ID)
+            db.session.delete(quiz)
+            db.session.commit()
+        elif strategy == "database":
+            db.session.delete(db.session.get(Quiz, QUIZ_ID))
+            db.session.commit()
+        else:
+            job_id = purge.enqueue("quiz", QUIZ_ID)
+            db.session.commit()
+            purge.run(job_id, "quiz", QUIZ_ID, app.config["PURGE_CHUNK_SIZE"], app.config["PURGE_PAUSE"])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        thread.join()
+        remaining = db.session.execute(text("SELECT count(*) FROM response")).scalar()
+    waits.sort()
+    return {
+        "strategy": strategy,
+        "seconds": round(elapsed, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_growth_mb": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, 1),
+        "writer_inserts": len(waits),
+        "writer_p99_ms": round(percentile(waits, 99) * 1000, 2) if waits else None,
+        "writer_max_ms": round(waits[-1] * 1000, 2) if waits else None,
+        "responses_left": remaining,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete a quiz with a large history: ORM cascades vs database cascades vs chunked purge")
+    parser.add_argument("--attempts", type=int, default=10000)
+    parser.add_argument("--questions", type=int, default=10, help="Questions per quiz, so responses = attempts x questions")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    parser.add_argument("--child", nargs=2, metavar=("STRATEGY", "DATABASE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(child(*args.child)))
+        return
+
+    directory = tempfile.mkdtemp(prefix="quiz_cascade_")
+    seeded = os.path.join(directory, "seeded.sqlite3")
+    app = create_app(seeded)
+    from backend.models import db
+    with app.app_context():
+        started = time.perf_counter()
+        seed(args.attempts, args.questions, args.users)
+        db.engine.dispose()
+    seeding = time.perf_counter() - started
+
+    results = []
+    for strategy in args.strategies.split(","):
+        copy = os.path.join(directory, f"{strategy}.sqlite3")
+        shutil.copy(seeded, copy)
+        output = subprocess.run([sys.executable, "-m", "benchmarks.cascade", "--child", strategy, copy],
+                                capture_output=True, text=True, env=dict(os.environ, PASSWORD_HASH_WORKERS="0"))
+        if output.returncode != 0:
+            raise SystemExit(output.stderr)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        os.remove(copy)
+
+    report = {"attempts": args.attempts, "responses": args.attempts * args.questions, "seed_seconds": round(seeding, 2), "results": results}
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"quiz with {args.attempts} attempts and {report['responses']} responses, seeded in {report['seed_seconds']}s")
+    for result in results:
+        print(f"{result['strategy']:>9}: {result['seconds']:>8}s  peak RSS +{result['peak_rss_growth_mb']} MB"
+              f"  concurrent writer p99 {result['writer_p99_ms']} ms  max {result['writer_max_ms']} ms"
+              f"  ({result['writer_inserts']} inserts, {result['responses_left']} responses left)")
+
+
+if __name__ == "__main__":
+    main()
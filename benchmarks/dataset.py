@@ -0,0 +1,123 @@
+# Synthetic catalog, users and graded attempts at a configurable scale, written with bulk
+# inserts into whatever database the app is bound to. Deterministic for a given seed.
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from uuid import UUID
+from sqlalchemy import insert, select
+
+
+@dataclass
+class Scale:
+    subjects: int = 5
+    chapters: int = 4  # per subject
+    quizzes: int = 5  # per chapter
+    questions: int = 10  # per quiz
+    users: int = 200
+    attempts: int = 5  # per user
+    seed: int = 42
+
+
+@dataclass
+class Dataset:
+    quiz_questions: dict = field(default_factory=dict)  # quiz id -> [(question id, ans_type, options count)]
+    users: list = field(default_factory=list)  # [(user id, email, password)]
+    password: str = "bench-password"
+
+    @property
+    def quiz_ids(self):
+        return list(self.quiz_questions)
+
+
+def random_answer(rng, ans_type, options):
+    if ans_type == "numeric":
+        return round(rng.uniform(0, 10), 1)
+    if ans_type == "multiple":
+        return sorted(rng.sample(range(options), 2))
+    return [rng.randrange(options)]
+
+
+def _question(rng, quiz_id, number):
+    ans_type = rng.choice(("single", "single", "multiple", "numeric"))
+    row = {"quiz_id": quiz_id, "question_statement": f"Question {number} of quiz {quiz_id}",
+           "ans_type": ans_type, "marks": rng.randint(1, 4), "options": None, "correct_options": None,
+           "correct_min": None, "correct_max": None}
+    if ans_type == "numeric":
+        low = rng.randint(0, 8)
+        row.update(correct_min=low, correct_max=low + 1.5)
+    else:
+        row["options"] = [f"Option {letter}" for letter in "ABCD"]
+        row["correct_options"] = sorted(rng.sample(range(4), 2 if ans_type == "multiple" else 1))
+    return row
+
+
+def seed(scale, password_hash):
+    from backend.analytics import rebuild as rebuild_analytics
+    from backend.grading import load_answer_keys
+    from backend.leaderboard import rebuild as rebuild_leaderboards
+    from backend.models import (Attempt, Chapter, Question, Quiz, Response, Role, Subject, User, UserRoles,
+                                db, subject_chapter_association)
+
+    rng = random.Random(scale.seed)
+    dataset = Dataset()
+    session = db.session
+    offset = session.scalar(select(Subject.id).order_by(Subject.id.desc()).limit(1)) or 0
+
+    session.execute(insert(Subject), [{"id": offset + s, "name": f"Subject {offset + s}", "description": "Synthetic subject",
+                                       "image_url": f"/static/subject_{s}.png"} for s in range(1, scale.subjects + 1)])
+    chapter_base = session.scalar(select(Chapter.id).order_by(Chapter.id.desc()).limit(1)) or 0
+    chapters = []
+    for s in range(1, scale.subjects + 1):
+        for c in range(scale.chapters):
+            chapters.append((offset + s, chapter_base + len(chapters) + 1))
+    session.execute(insert(Chapter), [{"id": chapter_id, "name": f"Chapter {chapter_id}", "description": "Synthetic chapter"}
+                                      for _, chapter_id in chapters])
+    session.execute(insert(subject_chapter_association), [{"subject_id": subject_id, "chapter_id": chapter_id}
+                                                          for subject_id, chapter_id in chapters])
+    quiz_base = session.scalar(select(Quiz.id).order_by(Quiz.id.desc()).limit(1)) or 0
+    # Untimed, so submissions can be posted straight to /api/quiz/<id>/response
+    quizzes = [{"id": quiz_base + index + 1, "chapter_id": chapter_id, "name": f"Quiz {quiz_base + index + 1}",
+                "description": "Synthetic quiz", "total_marks": 0, "time_limit": None}
+               for index, (_, chapter_id) in enumerate((item for item in chapters for _ in range(scale.quizzes)))]
+    questions = [_question(rng, quiz["id"], number) for quiz in quizzes for number in range(1, scale.questions + 1)]
+    for quiz in quizzes:
+        quiz["total_marks"] = sum(question["marks"] for question in questions if question["quiz_id"] == quiz["id"])
+    session.execute(insert(Quiz.__table__), quizzes)  # the ORM bulk insert would turn None into the default
+    session.execute(insert(Question), questions)
+    for quiz_id, question_id, ans_type, options in session.execute(
+            select(Question.quiz_id, Question.id, Question.ans_type, Question.options)
+            .where(Question.quiz_id.in_([quiz["id"] for quiz in quizzes])).order_by(Question.id)):
+        dataset.quiz_questions.setdefault(quiz_id, []).append((question_id, ans_type, len(options or ())))
+
+    user_base = session.scalar(select(User.id).order_by(User.id.desc()).limit(1)) or 0
+    role_id = session.scalar(select(Role.id).where(Role.name == "user"))
+    users = [{"id": user_base + u, "name": f"Student {user_base + u}", "email": f"student{user_base + u}@bench.local",
+              "password": password_hash, "fs_uniquifier": UUID(int=rng.getrandbits(128)).hex, "active": True}
+             for u in range(1, scale.users + 1)]
+    session.execute(insert(User), users)
+    session.execute(insert(UserRoles), [{"user_id": user["id"], "role_id": role_id} for user in users])
+    dataset.users = [(user["id"], user["email"], dataset.password) for user in users]
+
+    keys = load_answer_keys(dataset.quiz_ids)
+    attempt_id = session.scalar(select(Attempt.id).order_by(Attempt.id.desc()).limit(1)) or 0
+    attempts, responses, numbers = [], [], {}
+    started = datetime.now() - timedelta(days=30)
+    for user in users:
+        for _ in range(scale.attempts):
+            quiz_id = rng.choice(dataset.quiz_ids)
+            answers = [(question_id, random_answer(rng, ans_type, options))
+                       for question_id, ans_type, options in dataset.quiz_questions[quiz_id]]
+            results, score = keys[quiz_id].grade(answers)
+            attempt_id += 1
+            numbers[(user["id"], quiz_id)] = number = numbers.get((user["id"], quiz_id), 0) + 1
+            attempts.append({"id": attempt_id, "student_id": user["id"], "quiz_id": quiz_id, "attempt_number": number,
+                             "attempt_date": started + timedelta(minutes=attempt_id), "score": score})
+            responses.extend({"attempt_id": attempt_id, "question_id": question_id, "answer": answer, "is_correct": correct}
+                             for (question_id, answer), correct in zip(answers, results))
+    if attempts:
+        session.execute(insert(Attempt), attempts)
+        session.execute(insert(Response), responses)
+    rebuild_leaderboards(dataset.quiz_ids)
+    rebuild_analytics(dataset.quiz_ids)
+    session.commit()
+    return dataset
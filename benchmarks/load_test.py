@@ -0,0 +1,274 @@
+# Load test of the quiz API against a synthetic dataset in a temporary SQLite file.
+# Drives the real app either in process through the Flask test client or over HTTP through
+# a local threaded server, and reports latency percentiles and throughput per scenario.
+# Run from the repository root:
+#   python -m benchmarks.load_test --driver http --concurrency 8 --seconds 10 --users 500
+#   python -m benchmarks.load_test --json --output results.json
+#   python -m benchmarks.load_test --scenarios submit --submission-mode queue
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from .dataset import Scale, random_answer, seed
+
+SCENARIOS = ("login", "catalog", "quiz", "submit", "attempts")
+
+
+# Both drivers expose request(method, path, body, token) -> (status, parsed json or None)
+class TestClientDriver():
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers={"Token": token} if token else {})
+        return response.status_code, response.get_json(silent=True)
+
+    def close(self):
+        pass
+
+
+class HTTPDriver():
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class KeepAliveHandler(WSGIRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=KeepAliveHandler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Token"] = token
+        payload = None if body is None else json.dumps(body)
+        for retry in range(2):
+            connection = getattr(self.local, "connection", None)
+            if connection is None:
+                connection = self.local.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                self.local.connection = None
+                if retry:
+                    raise
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+    def close(self):
+        self.server.shutdown()
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(name, latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    milliseconds = lambda value: None if value is None else round(value * 1000, 2)
+    return {
+        "scenario": name,
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "mean_ms": milliseconds(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": milliseconds(percentile(ordered, 50)),
+        "p95_ms": milliseconds(percentile(ordered, 95)),
+        "p99_ms": milliseconds(percentile(ordered, 99)),
+        "max_ms": milliseconds(ordered[-1]) if ordered else None,
+    }
+
+
+class Workload():
+    def __init__(self, driver, dataset, tokens, seed):
+        self.driver = driver
+        self.dataset = dataset
+        self.tokens = tokens
+        self.seed = seed
+
+    # Each call issues one request of the scenario and returns its status code
+    def login(self, rng):
+        _, email, password = rng.choice(self.dataset.users)
+        return self.driver.request("POST", "/api/login", {"email": email, "password": password})[0]
+
+    def catalog(self, rng):
+        user_id = rng.choice(self.dataset.users)[0]
+        path = rng.choice(("/api/subject?limit=50&depth=1", "/api/chapter?limit=50", "/api/quiz?limit=100"))
+        return self.driver.request("GET", path, token=self.tokens[user_id])[0]
+
+    def quiz(self, rng):
+        user_id = rng.choice(self.dataset.users)[0]
+        return self.driver.request("GET", f"/api/quiz/{rng.choice(self.dataset.quiz_ids)}", token=self.tokens[user_id])[0]
+
+    def submit(self, rng):
+        user_id = rng.choice(self.dataset.users)[0]
+        quiz_id = rng.choice(self.dataset.quiz_ids)
+        responses = [{"question_id": question_id, "answer": random_answer(rng, ans_type, options)}
+                     for question_id, ans_type, options in self.dataset.quiz_questions[quiz_id]]
+        return self.driver.request("POST", f"/api/quiz/{quiz_id}/response",
+                                   {"user_id": user_id, "responses": responses}, token=self.tokens[user_id])[0]
+
+    def attempts(self, rng):
+        user_id = rng.choice(self.dataset.users)[0]
+        quiz_id = rng.choice(self.dataset.quiz_ids)
+        status = self.driver.request("GET", f"/api/quiz/{user_id}/{quiz_id}/attempts?limit=20", token=self.tokens[user_id])[0]
+        return 200 if status == 404 else status  # no attempts yet is a valid answer
+
+    def run(self, name, concurrency, seconds, requests):
+        step = getattr(self, name)
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        issued = [0]
+        stop = time.perf_counter() + seconds
+
+        def worker(number):
+            rng = random.Random(f"{self.seed}-{name}-{number}")
+            mine = []
+            while time.perf_counter() < stop:
+                if requests:
+                    with lock:
+                        if issued[0] >= requests:
+                            break
+                        issued[0] += 1
+                started = time.perf_counter()
+                try:
+                    ok = step(rng) < 400
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                if ok:
+                    mine.append(elapsed)
+                else:
+                    with lock:
+                        errors[0] += 1
+            with lock:
+                latencies.extend(mine)
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(name, latencies, errors[0], time.perf_counter() - started)
+
+
+# Seconds until the background workers have graded everything the run queued
+def wait_for_queue(app, timeout=300):
+    from backend.submissions import GRADING, QUEUED, queue_depth
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        with app.app_context():
+            depth = queue_depth()
+        if not depth.get(QUEUED) and not depth.get(GRADING):
+            break
+        time.sleep(0.05)
+    return round(time.perf_counter() - started, 2)
+
+
+def create_app(database_path):
+    # The configuration is read when backend.config is first imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    from app import createApp
+    from backend.bootstrap import init_db
+    app = createApp()
+    with app.app_context():
+        init_db()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the quiz API against a synthetic dataset")
+    parser.add_argument("--driver", choices=("client", "http"), default="client",
+                        help="Flask test client in process, or a local threaded HTTP server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=8, help="Client threads per scenario")
+    parser.add_argument("--seconds", type=float, default=5, help="Duration of each scenario")
+    parser.add_argument("--requests", type=int, default=0, help="Stop a scenario after this many requests (0: no limit)")
+    parser.add_argument("--submission-mode", choices=("sync", "queue"), default="sync",
+                        help="Grade submissions in the request, or queue them for the background workers")
+    for name, default in vars(Scale()).items():
+        parser.add_argument(f"--{name}", type=int, default=default)
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    os.environ["SUBMISSION_MODE"] = args.submission_mode
+    directory = tempfile.mkdtemp(prefix="quiz_load_")
+    app = create_app(os.path.join(directory, "bench.sqlite3"))
+    from backend.hashing import hasher
+    scale = Scale(**{name: getattr(args, name) for name in vars(Scale())})
+    seeding = time.perf_counter()
+    with app.app_context():
+        dataset = seed(scale, hasher.hash("bench-password"))
+    seeding = time.perf_counter() - seeding
+
+    driver = (HTTPDriver if args.driver == "http" else TestClientDriver)(app)
+    try:
+        # One login per user up front, the other scenarios reuse the tokens
+        tokens = {}
+        for user_id, email, password in dataset.users:
+            status, body = driver.request("POST", "/api/login", {"email": email, "password": password})
+            if status != 200:
+                raise SystemExit(f"login of {email} failed with {status}: {body}")
+            tokens[user_id] = body["token"]
+        workload = Workload(driver, dataset, tokens, scale.seed)
+        results = [workload.run(name, args.concurrency, args.seconds, args.requests) for name in scenarios]
+        drain = wait_for_queue(app) if args.submission_mode == "queue" else None
+    finally:
+        driver.close()
+
+    report = {
+        "driver": args.driver,
+        "concurrency": args.concurrency,
+        "seconds": args.seconds,
+        "scale": vars(scale),
+        "seed_seconds": round(seeding, 2),
+        "submission_mode": args.submission_mode,
+        "queue_drain_seconds": drain,
+        "database": app.config["SQLALCHEMY_DATABASE_URI"],
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"driver={args.driver} concurrency={args.concurrency} seeded in {report['seed_seconds']}s")
+    for result in results:
+        print(f"{result['scenario']:>9}: {result['rps']:>8} req/s  p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms"
+              f"  p99 {result['p99_ms']} ms  errors {result['errors']}")
+    if drain is not None:
+        print(f"submission queue drained {drain}s after the last scenario")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Drawing a paper from a large question pool: from the cached pool index (one primary key
+# lookup for the drawn questions) vs loading every question of the quiz and sampling in
+# Python, which is what serving a random subset off QuizIdAPI.get's payload would cost.
+# Run from the repository root:
+#   python -m benchmarks.question_pools --pool 10000 --draw 50 --papers 200
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from .load_test import create_app, percentile
+
+
+def seed(pool):
+    from sqlalchemy import insert
+    from backend.models import Chapter, Question, Quiz, db
+    db.session.execute(insert(Chapter).values(id=1, name="Bench chapter", description="Pool benchmark"))
+    db.session.execute(insert(Quiz).values(id=1, chapter_id=1, name="Pooled quiz", total_marks=0, pool_strata="ans_type", shuffle_options=True))
+    rows = []
+    for number in range(pool):
+        kind = ("single", "multiple", "numeric")[number % 3]
+        rows.append({"id": number + 1, "quiz_id": 1, "question_statement": f"Question {number} " + "lorem ipsum " * 10, "ans_type": kind,
+                     "options": None if kind == "numeric" else [f"Option {k}" for k in range(4)],
+                     "correct_options": None if kind == "numeric" else [0], "marks": 1 + number % 2})
+    db.session.execute(insert(Question), rows)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question pools: draw from the pool index vs load the whole pool")
+    parser.add_argument("--pool", type=int, default=10000, help="Questions in the quiz")
+    parser.add_argument("--draw", type=int, default=50, help="Questions per paper")
+    parser.add_argument("--papers", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    args = parser.parse_args()
+
+    app = create_app(os.path.join(tempfile.mkdtemp(prefix="quiz_pools_"), "pools.sqlite3"))
+    from sqlalchemy import update
+    from backend.models import Question, Quiz, db
+    from backend import pools
+    report = {"pool": args.pool, "draw": args.draw, "papers": args.papers}
+    with app.app_context():
+        seed(args.pool)
+        db.session.execute(update(Quiz).where(Quiz.id == 1).values(pool_size=args.draw))
+        db.session.commit()
+
+        started = time.perf_counter()
+        pools.load_pool(1)
+        report["index_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        timings = []
+        for paper_seed in range(args.papers):
+            started = time.perf_counter()
+            pools.paper_questions(pools.draw(1, paper_seed))
+            db.session.expire_all()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        report["index_p50_ms"] = round(percentile(timings, 50) * 1000, 2)
+        report["index_p99_ms"] = round(percentile(timings, 99) * 1000, 2)
+
+        rng = random.Random(0)
+        timings = []
+        for _ in range(args.papers):
+            started = time.perf_counter()
+            questions = Question.query.filter(Question.quiz_id == 1).all()
+            for question in rng.sample(questions, args.draw):
+                if question.options:
+                    rng.sample(question.options, len(question.options))
+            db.session.expire_all()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        report["full_load_p50_ms"] = round(percentile(timings, 50) * 1000, 2)
+        report["full_load_p99_ms"] = round(percentile(timings, 99) * 1000, 2)
+
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{args.papers} papers of {args.draw} from a pool of {args.pool} (index built in {report['index_build_ms']} ms)")
+    print(f"   pool index: p50 {report['index_p50_ms']} ms  p99 {report['index_p99_ms']} ms")
+    print(f"    full load: p50 {report['full_load_p50_ms']} ms  p99 {report['full_load_p99_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
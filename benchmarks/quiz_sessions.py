@@ -0,0 +1,115 @@
+# Timed quiz sessions with many students in the middle of a quiz, for each session store
+# (QUIZ_SESSION_STORE=memory|database), each in a fresh process on its own SQLite file:
+#   start      sessions opened, one per student
+#   heartbeat  what SessionHeartbeatAPI does per request (look up, deadline check, save the
+#              answers, commit) against random open sessions, while all of them are open
+#   sweep      every session made overdue at once and auto-submitted by one sweep, graded in
+#              batches of QUIZ_SESSION_SWEEP_BATCH
+# Run from the repository root:
+#   python -m benchmarks.quiz_sessions --sessions 5000 --heartbeats 20000
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from .load_test import create_app, percentile
+
+STORES = ("memory", "database")
+QUESTIONS = 20
+
+
+def seed(users):
+    from sqlalchemy import insert
+    from backend.models import Chapter, Question, Quiz, User, db
+    db.session.execute(insert(Chapter).values(id=1, name="Bench chapter", description="Session benchmark"))
+    db.session.execute(insert(Quiz).values(id=1, chapter_id=1, name="Timed quiz", total_marks=QUESTIONS, time_limit=30))
+    db.session.execute(insert(User), [{"id": user_id, "name": f"User {user_id}", "email": f"user{user_id}@bench.local",
+                                       "password": "x", "fs_uniquifier": f"bench-{user_id}", "active": True}
+                                      for user_id in range(1, users + 1)])
+    db.session.execute(insert(Question), [{"id": number + 1, "quiz_id": 1, "question_statement": f"Question {number}", "ans_type": "single",
+                                           "options": ["a", "b", "c", "d"], "correct_options": [0], "marks": 1} for number in range(QUESTIONS)])
+    db.session.commit()
+
+
+def child(store, database_path, sessions, heartbeats, seed_value):
+    app = create_app(database_path)
+    from backend.models import Attempt, Quiz, db
+    from backend.quiz_sessions import quiz_sessions
+    rng = random.Random(seed_value)
+    report = {"store": store}
+    with app.app_context():
+        seed(sessions)
+        quiz = db.session.get(Quiz, 1)
+        started = time.perf_counter()
+        session_ids = []
+        for student_id in range(1, sessions + 1):
+            session, _ = quiz_sessions.start(student_id, quiz)
+            db.session.commit()
+            session_ids.append(session.id)
+        report["start_per_s"] = round(sessions / (time.perf_counter() - started), 1)
+
+        latencies = []
+        for _ in range(heartbeats):
+            answers = [[number + 1, [rng.randrange(4)]] for number in range(rng.randint(1, QUESTIONS))]
+            started = time.perf_counter()
+            session = quiz_sessions.get(rng.choice(session_ids))
+            quiz_sessions.heartbeat(session, answers)
+            db.session.commit()
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        report["heartbeat_p50_us"] = round(percentile(latencies, 50) * 1e6)
+        report["heartbeat_p99_us"] = round(percentile(latencies, 99) * 1e6)
+        report["active"] = quiz_sessions.store.active_count()
+
+        # A grace of minus the time limit puts every deadline in the past
+        quiz_sessions.grace = -timedelta(minutes=quiz.time_limit + 1)
+        started = time.perf_counter()
+        expired = quiz_sessions.sweep()
+        report["sweep_s"] = round(time.perf_counter() - started, 2)
+        report["expired"] = expired
+        report["attempts"] = db.session.query(Attempt).count()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Timed quiz sessions: start, heartbeat and sweep cost per session store")
+    parser.add_argument("--sessions", type=int, default=5000, help="Students with a session open at the same time")
+    parser.add_argument("--heartbeats", type=int, default=20000)
+    parser.add_argument("--stores", default=",".join(STORES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    parser.add_argument("--child", nargs=2, metavar=("STORE", "DATABASE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        store, database_path = args.child
+        print(json.dumps(child(store, database_path, args.sessions, args.heartbeats, args.seed)))
+        return
+
+    directory = tempfile.mkdtemp(prefix="quiz_sessions_")
+    results = []
+    for store in args.stores.split(","):
+        command = [sys.executable, "-m", "benchmarks.quiz_sessions", "--child", store, os.path.join(directory, f"{store}.sqlite3"),
+                   "--sessions", str(args.sessions), "--heartbeats", str(args.heartbeats), "--seed", str(args.seed)]
+        output = subprocess.run(command, capture_output=True, text=True,
+                                env=dict(os.environ, QUIZ_SESSION_STORE=store, SUBMISSION_MODE="sync", PASSWORD_HASH_WORKERS="0"))
+        if output.returncode != 0:
+            raise SystemExit(output.stderr)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    report = {"sessions": args.sessions, "heartbeats": args.heartbeats, "results": results}
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{args.sessions} open sessions, {args.heartbeats} heartbeats")
+    for result in results:
+        print(f"{result['store']:>9}: start {result['start_per_s']}/s  heartbeat p50 {result['heartbeat_p50_us']} us"
+              f"  p99 {result['heartbeat_p99_us']} us ({result['active']} active)"
+              f"  sweep {result['sweep_s']}s for {result['expired']} sessions ({result['attempts']} attempts)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Cost of the rate limiter per request, and whether a limit holds across worker processes.
+#   take     one token taken from a random client's bucket, straight on the store
+#   check    what @limited adds to a request: client key, take and counters, inside a request
+#            context. The user is resolved first, as auth_required does that anyway
+#   shared   --workers processes hammer one client's bucket for --seconds; the database store
+#            should admit about burst + rate * seconds in total, the memory store that many
+#            per process
+# Run from the repository root:
+#   python -m benchmarks.rate_limit --clients 10000 --takes 100000 --workers 4
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from .load_test import create_app, percentile
+
+STORES = ("memory", "database")
+LIMIT = "20/2"
+
+
+def make_store(store, database_path, horizon=60):
+    from backend.ratelimit import DatabaseStore, MemoryStore
+    return DatabaseStore(database_path, horizon) if store == "database" else MemoryStore()
+
+
+def take_latencies(store, clients, takes, seed_value):
+    from backend.ratelimit import parse_limit
+    rate, burst = parse_limit(LIMIT)
+    rng = random.Random(seed_value)
+    keys = [f"submit:user:{client}" for client in range(clients)]
+    latencies = []
+    for _ in range(takes):
+        key = rng.choice(keys)
+        started = time.perf_counter()
+        store.take(key, rate, burst)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return round(percentile(latencies, 50) * 1e6, 2), round(percentile(latencies, 99) * 1e6, 2)
+
+
+def check_latencies(app, store, clients, takes, seed_value):
+    from flask_security.core import current_user
+    from backend.ratelimit import parse_limit, rate_limiter
+    rate_limiter.store = store
+    rate_limiter.limits = {"submit": parse_limit(LIMIT)}
+    rng = random.Random(seed_value)
+    addresses = [f"10.{client >> 16 & 255}.{client >> 8 & 255}.{client & 255}" for client in range(clients)]
+    latencies = []
+    for _ in range(min(takes, 5000)):
+        with app.test_request_context("/api/quiz/1/response", method="POST", environ_base={"REMOTE_ADDR": rng.choice(addresses)}):
+            current_user.is_authenticated
+            started = time.perf_counter()
+            rate_limiter.check("submit")
+            latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return round(percentile(latencies, 50) * 1e6, 2), round(percentile(latencies, 99) * 1e6, 2)
+
+
+def hammer(store, database_path, seconds):
+    from backend.ratelimit import parse_limit
+    rate, burst = parse_limit(LIMIT)
+    store = make_store(store, database_path)
+    allowed = attempts = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        attempts += 1
+        try:
+            allowed += not store.take("submit:user:1", rate, burst)
+        except sqlite3.Error:
+            # The limiter lets these through
+            errors += 1
+    return {"allowed": allowed + errors, "attempts": attempts, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limiter: per request overhead per store, and limits shared across processes")
+    parser.add_argument("--clients", type=int, default=10000, help="Distinct clients with a bucket")
+    parser.add_argument("--takes", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=4, help="Processes sharing one client's bucket")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    parser.add_argument("--child", nargs=2, metavar=("STORE", "DATABASE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        store, database_path = args.child
+        print(json.dumps(hammer(store, database_path, args.seconds)))
+        return
+
+    from backend.ratelimit import parse_limit
+    directory = tempfile.mkdtemp(prefix="quiz_ratelimit_")
+    rate, burst = parse_limit(LIMIT)
+    app = create_app(os.path.join(directory, "app.sqlite3"))
+    results = []
+    for store in STORES:
+        database_path = os.path.join(directory, f"{store}.sqlite3")
+        result = {"store": store}
+        result["take_p50_us"], result["take_p99_us"] = take_latencies(make_store(store, database_path), args.clients, args.takes, args.seed)
+        result["check_p50_us"], result["check_p99_us"] = check_latencies(app, make_store(store, database_path), args.clients, args.takes, args.seed)
+
+        shared_path = os.path.join(directory, f"{store}-shared.sqlite3")
+        command = [sys.executable, "-m", "benchmarks.rate_limit", "--child", store, shared_path, "--seconds", str(args.seconds)]
+        children = [subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) for _ in range(args.workers)]
+        allowed = attempts = errors = 0
+        for child in children:
+            stdout, stderr = child.communicate()
+            if child.returncode != 0:
+                raise SystemExit(stderr)
+            counts = json.loads(stdout.strip().splitlines()[-1])
+            allowed += counts["allowed"]
+            attempts += counts["attempts"]
+            errors += counts["errors"]
+        result.update(shared_allowed=allowed, shared_attempts=attempts, shared_store_errors=errors)
+        results.append(result)
+
+    report = {"clients": args.clients, "takes": args.takes, "limit": LIMIT, "workers": args.workers, "seconds": args.seconds,
+              "expected_allowed": round(burst + rate * args.seconds), "results": results}
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{args.takes} takes over {args.clients} clients, limit {LIMIT}")
+    for result in results:
+        print(f"{result['store']:>9}: take p50 {result['take_p50_us']} us  p99 {result['take_p99_us']} us"
+              f"  check p50 {result['check_p50_us']} us  p99 {result['check_p99_us']} us")
+    print(f"{args.workers} processes on one client for {args.seconds}s, about {report['expected_allowed']} should get through")
+    for result in results:
+        print(f"{result['store']:>9}: {result['shared_allowed']} allowed of {result['shared_attempts']}"
+              f" ({result['shared_store_errors']} let through on store errors)")
+
+
+if __name__ == "__main__":
+    main()
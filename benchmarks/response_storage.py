@@ -0,0 +1,160 @@
+# Row-per-answer responses vs one packed blob per attempt (RESPONSE_STORAGE=rows|packed).
+# Each layout runs in a fresh process on its own SQLite file: the same attempts are written
+# through the request path (one transaction per attempt), then the database size, reads of
+# whole attempts as ResponseAPI.get serves them and an analytics rebuild are measured.
+# The rows database is finally compacted with `flask compact-responses` to time the migration.
+# Run from the repository root:
+#   python -m benchmarks.response_storage --attempts 5000 --questions 50
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from .load_test import create_app
+
+LAYOUTS = ("rows", "packed")
+
+
+def seed(questions, users):
+    from sqlalchemy import insert
+    from backend.models import Chapter, Question, Quiz, User, db
+    db.session.execute(insert(Chapter).values(id=1, name="Bench chapter", description="Storage benchmark"))
+    db.session.execute(insert(Quiz).values(id=1, chapter_id=1, name="Bench quiz", total_marks=questions))
+    db.session.execute(insert(User), [{"id": user_id, "name": f"User {user_id}", "email": f"user{user_id}@bench.local",
+                                       "password": "x", "fs_uniquifier": f"bench-{user_id}", "active": True}
+                                      for user_id in range(1, users + 1)])
+    rows = []
+    for number in range(questions):
+        kind = ("single", "multiple", "numeric")[number % 3]
+        rows.append({"id": number + 1, "quiz_id": 1, "question_statement": f"Question {number}", "ans_type": kind, "marks": 1,
+                     "options": None if kind == "numeric" else ["a", "b", "c", "d"],
+                     "correct_options": {"single": [1], "multiple": [0, 2], "numeric": None}[kind],
+                     "correct_min": 1.0 if kind == "numeric" else None, "correct_max": 2.0 if kind == "numeric" else None})
+    db.session.execute(insert(Question), rows)
+    db.session.commit()
+
+
+def submission(rng, questions):
+    answers = []
+    for number in range(questions):
+        kind = number % 3
+        if rng.random() < 0.05:
+            answer = None
+        elif kind == 0:
+            answer = [rng.randrange(4)]
+        elif kind == 1:
+            answer = sorted(rng.sample(range(4), rng.randint(1, 3)))
+        else:
+            answer = round(rng.uniform(0, 3), 2)
+        answers.append((number + 1, answer))
+    return answers
+
+
+def size_report(connection):
+    connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    page_size = connection.exec_driver_sql("PRAGMA page_size").scalar()
+    used = (connection.exec_driver_sql("PRAGMA page_count").scalar() - connection.exec_driver_sql("PRAGMA freelist_count").scalar()) * page_size
+    tables = {}
+    try:
+        for name, size in connection.exec_driver_sql("SELECT name, sum(pgsize) FROM dbstat GROUP BY name"):
+            tables[name] = size
+    except Exception:
+        pass  # dbstat is an optional SQLite build feature
+    response = sum(size for name, size in tables.items() if name == "response" or name.startswith("ix_response"))
+    return {"database_mb": round(used / 2**20, 2), "response_table_mb": round(response / 2**20, 2) if tables else None,
+            "attempt_table_mb": round(tables["attempt"] / 2**20, 2) if "attempt" in tables else None}
+
+
+def child(layout, database_path, attempts, questions, users, reads, seed_value):
+    app = create_app(database_path)
+    from backend import analytics, packing
+    from backend.grading import load_answer_key
+    from backend.models import Attempt, db
+    from backend.resources import response_fields
+    from backend.serializers import serialize
+    rng = random.Random(seed_value)
+    report = {"layout": layout}
+    with app.app_context():
+        seed(questions, users)
+        key = load_answer_key(1)
+        started = time.perf_counter()
+        for index in range(attempts):
+            answers = submission(rng, questions)
+            results, score = key.grade(answers)
+            packing.save_attempt(index % users + 1, 1, answers, results, score)
+            db.session.commit()
+        elapsed = time.perf_counter() - started
+        report["write_attempts_per_s"] = round(attempts / elapsed, 1)
+        with db.engine.connect() as connection:
+            report.update(size_report(connection))
+        report["bytes_per_attempt"] = round(report["database_mb"] * 2**20 / attempts)
+
+        attempt_ids = rng.sample(range(1, attempts + 1), min(reads, attempts))
+        db.session.expire_all()
+        started = time.perf_counter()
+        for attempt_id in attempt_ids:
+            serialize(packing.attempt_responses(db.session.get(Attempt, attempt_id)), response_fields)
+            db.session.expire_all()
+        report["read_attempts_per_s"] = round(len(attempt_ids) / (time.perf_counter() - started), 1)
+
+        started = time.perf_counter()
+        analytics.rebuild([1])
+        db.session.commit()
+        report["analytics_rebuild_s"] = round(time.perf_counter() - started, 2)
+
+        if layout == "rows":
+            started = time.perf_counter()
+            packing.compact()
+            report["compact_s"] = round(time.perf_counter() - started, 2)
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql("VACUUM")
+                report["compacted_database_mb"] = size_report(connection)["database_mb"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response storage: one row per answer vs one packed blob per attempt")
+    parser.add_argument("--attempts", type=int, default=5000)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--reads", type=int, default=1000, help="Attempts read back through ResponseAPI.get's path")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    parser.add_argument("--child", nargs=2, metavar=("LAYOUT", "DATABASE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        layout, database_path = args.child
+        print(json.dumps(child(layout, database_path, args.attempts, args.questions, args.users, args.reads, args.seed)))
+        return
+
+    directory = tempfile.mkdtemp(prefix="quiz_storage_")
+    results = []
+    for layout in LAYOUTS:
+        command = [sys.executable, "-m", "benchmarks.response_storage", "--child", layout, os.path.join(directory, f"{layout}.sqlite3"),
+                   "--attempts", str(args.attempts), "--questions", str(args.questions), "--users", str(args.users),
+                   "--reads", str(args.reads), "--seed", str(args.seed)]
+        output = subprocess.run(command, capture_output=True, text=True,
+                                env=dict(os.environ, RESPONSE_STORAGE=layout, PASSWORD_HASH_WORKERS="0"))
+        if output.returncode != 0:
+            raise SystemExit(output.stderr)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    report = {"attempts": args.attempts, "questions": args.questions, "results": results}
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{args.attempts} attempts of {args.questions} answers")
+    for result in results:
+        print(f"{result['layout']:>7}: {result['database_mb']:>8} MB ({result['bytes_per_attempt']} B/attempt,"
+              f" responses {result['response_table_mb']} MB, attempts {result['attempt_table_mb']} MB)"
+              f"  write {result['write_attempts_per_s']} attempts/s  read {result['read_attempts_per_s']} attempts/s"
+              f"  analytics rebuild {result['analytics_rebuild_s']}s")
+        if "compact_s" in result:
+            print(f"{'':>9}compact-responses: {result['compact_s']}s, {result['compacted_database_mb']} MB after VACUUM")
+
+
+if __name__ == "__main__":
+    main()
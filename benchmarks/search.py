@@ -0,0 +1,96 @@
+# Ranked FTS5 search vs the LIKE '%term%' scan it replaces, on a synthetic question bank
+# in a temporary SQLite file. Run from the repository root:
+#   python -m benchmarks.search --questions 100000 --queries 200
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from .load_test import create_app, percentile
+
+WORDS = ("algebra", "polynomial", "equation", "matrix", "vector", "integral", "derivative", "limit", "series",
+         "probability", "variance", "theorem", "triangle", "circle", "angle", "prime", "factor", "fraction",
+         "decimal", "graph", "function", "domain", "range", "slope", "parabola", "logarithm", "exponent", "sequence",
+         "velocity", "acceleration", "momentum", "energy", "force", "friction", "circuit", "voltage", "current",
+         "resistance", "molecule", "atom", "electron", "reaction", "acid", "base", "enzyme", "protein", "cell",
+         "genome", "photosynthesis", "ecosystem", "climate", "continent", "empire", "revolution", "treaty", "economy")
+
+
+def seed_questions(count, seed):
+    from sqlalchemy import insert
+    from backend.models import Chapter, Question, Quiz, Subject, db, subject_chapter_association
+    rng = random.Random(seed)
+    db.session.execute(insert(Subject).values(id=1, name="Bench", description="Search benchmark", image_url="/bench.png"))
+    db.session.execute(insert(Chapter).values(id=1, name="Bench chapter", description="Search benchmark"))
+    db.session.execute(insert(subject_chapter_association).values(subject_id=1, chapter_id=1))
+    quizzes = max(count // 50, 1)
+    db.session.execute(insert(Quiz), [{"id": quiz_id, "chapter_id": 1, "name": f"{rng.choice(WORDS)} quiz {quiz_id}",
+                                       "description": " ".join(rng.sample(WORDS, 4)), "total_marks": 50}
+                                      for quiz_id in range(1, quizzes + 1)])
+    for start in range(0, count, 10000):
+        db.session.execute(insert(Question), [{
+            "quiz_id": rng.randint(1, quizzes),
+            "question_statement": f"Question {number}: " + " ".join(rng.choices(WORDS, k=rng.randint(6, 14))) + "?",
+            "ans_type": "single", "options": [" ".join(rng.sample(WORDS, 2)) for _ in range(4)],
+            "correct_options": [0], "marks": 1,
+        } for number in range(start, min(start + 10000, count))])
+    db.session.commit()
+
+
+def timed(fn, queries):
+    latencies, hits = [], 0
+    for query in queries:
+        started = time.perf_counter()
+        results, _ = fn(query)
+        latencies.append(time.perf_counter() - started)
+        hits += bool(results)
+    latencies.sort()
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "queries_with_results": hits,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FTS5 search vs LIKE scans on a large question bank")
+    parser.add_argument("--questions", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20, help="Results per page")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    args = parser.parse_args()
+
+    app = create_app(os.path.join(tempfile.mkdtemp(prefix="quiz_search_"), "search.sqlite3"))
+    from backend.search import like_search, search
+    rng = random.Random(args.seed)
+    # One or two words, the last one sometimes cut short like a query typed so far
+    queries = [" ".join(rng.sample(WORDS, rng.randint(1, 2)))[:rng.choice((None, -2))] for _ in range(args.queries)]
+    with app.app_context():
+        started = time.perf_counter()
+        seed_questions(args.questions, args.seed)
+        seed_seconds = time.perf_counter() - started
+        results = {
+            "questions": args.questions,
+            "queries": args.queries,
+            "seed_and_index_seconds": round(seed_seconds, 2),
+            "fts": timed(lambda q: search(q, limit=args.limit), queries),
+            "like": timed(lambda q: like_search(q, limit=args.limit), queries),
+        }
+    results["speedup_p50"] = round(results["like"]["p50_ms"] / results["fts"]["p50_ms"], 1)
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{args.questions} questions, {args.queries} queries, seeded and indexed in {results['seed_and_index_seconds']}s")
+    for name in ("fts", "like"):
+        stats = results[name]
+        print(f"{name:>5}: p50 {stats['p50_ms']:>9} ms  p95 {stats['p95_ms']:>9} ms  mean {stats['mean_ms']:>9} ms"
+              f"  {stats['queries_with_results']} queries with results")
+    print(f"p50 speedup: {results['speedup_p50']}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# flask_restful marshal + json vs the precompiled converters and encoder from
+# backend/serializers.py, on synthetic payloads shaped like the catalog endpoints.
+# Run from the repository root:
+#   python -m benchmarks.serialization --objects 10000 --repeat 5
+import argparse
+import json
+import time
+from types import SimpleNamespace
+from flask_restful import marshal
+from backend.serializers import dumps, orjson, serialize
+
+
+def fixtures(objects):
+    # Import here so the schemas come from the module the API actually serves
+    from backend.resources import question_fields, quiz_fields, quiz_fields_with_questions, subject_fields
+    questions = [SimpleNamespace(id=i, quiz_id=1, question_statement=f"What is {i} + {i}?", ans_type="single",
+                                 options=[str(i), str(2 * i), str(3 * i), "None of these"], marks=2)
+                 for i in range(objects)]
+    quizzes = [SimpleNamespace(id=i, chapter_id=i // 10, name=f"Quiz {i}", description="Weekly practice quiz",
+                               total_marks=20, time_limit=30, questions=[]) for i in range(objects)]
+    chapters = [SimpleNamespace(id=i, name=f"Chapter {i}", description="Chapter description",
+                                quizzes=quizzes[i * 10:(i + 1) * 10]) for i in range(objects // 10)]
+    subjects = [SimpleNamespace(id=i, name=f"Subject {i}", description="Subject description", image_url=f"/img/{i}.png",
+                                chapters=chapters[i * 10:(i + 1) * 10]) for i in range(objects // 100)]
+    quiz = SimpleNamespace(id=1, chapter_id=1, name="Big quiz", description=None, total_marks=2 * objects,
+                           time_limit=None, questions=questions)
+    return [
+        ("questions", questions, question_fields),
+        ("quizzes", quizzes, quiz_fields),
+        ("subject tree", subjects, subject_fields),
+        ("quiz with questions", quiz, quiz_fields_with_questions),
+    ]
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(objects, repeat):
+    results = []
+    for name, data, schema in fixtures(objects):
+        baseline = json.dumps(marshal(data, schema))
+        fast = dumps(serialize(data, schema))
+        if json.loads(baseline) != json.loads(fast):
+            raise SystemExit(f"{name}: serialized payload differs from marshal()")
+        marshal_seconds = timed(lambda: json.dumps(marshal(data, schema)), repeat)
+        convert_seconds = timed(lambda: serialize(data, schema), repeat)
+        fast_seconds = timed(lambda: dumps(serialize(data, schema)), repeat)
+        results.append({
+            "payload": name,
+            "bytes": len(fast),
+            "marshal_ms": round(marshal_seconds * 1000, 2),
+            "convert_ms": round(convert_seconds * 1000, 2),
+            "fast_ms": round(fast_seconds * 1000, 2),
+            "speedup": round(marshal_seconds / fast_seconds, 1),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="marshal_with vs precompiled serializers")
+    parser.add_argument("--objects", type=int, default=10000, help="Objects in each payload")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case, the best one is reported")
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    args = parser.parse_args()
+    results = run(args.objects, args.repeat)
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"encoder: {'orjson' if orjson else 'json'}")
+    for result in results:
+        print(f"{result['payload']:>20}: marshal+json {result['marshal_ms']:>8} ms  converters {result['convert_ms']:>8} ms"
+              f"  converters+encode {result['fast_ms']:>8} ms  {result['speedup']:>5}x")
+
+
+if __name__ == "__main__":
+    main()
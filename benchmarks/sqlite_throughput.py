@@ -0,0 +1,95 @@
+# Mixed read/write throughput of a SQLite file with default settings vs the pragmas from
+# backend/database.py. Run from the repository root:
+#   python -m benchmarks.sqlite_throughput --seconds 5 --writers 4 --readers 8
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from backend.database import apply_sqlite_pragmas, engine_options, sqlite_pragmas
+
+
+def make_engine(path, tuned):
+    uri = f"sqlite:///{path}"
+    if not tuned:
+        return create_engine(uri, connect_args={"check_same_thread": False}, pool_size=32)
+    options = engine_options(uri)
+    options["pool_size"] = 32
+    engine = create_engine(uri, **options)
+    pragmas = sqlite_pragmas()
+    event.listen(engine, "connect", lambda dbapi_connection, _: apply_sqlite_pragmas(dbapi_connection, pragmas))
+    return engine
+
+
+def run(tuned, seconds, writers, readers, rows_per_write):
+    directory = tempfile.mkdtemp(prefix="quiz_bench_")
+    path = os.path.join(directory, "bench.sqlite3")
+    engine = make_engine(path, tuned)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE response (id INTEGER PRIMARY KEY, attempt_id INTEGER, question_id INTEGER, answer TEXT, is_correct BOOLEAN)"))
+        conn.execute(text("CREATE INDEX ix_response_attempt ON response (attempt_id)"))
+    counts = {"writes": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def writer(worker):
+        attempt_id = worker * 1_000_000
+        while time.perf_counter() < stop:
+            attempt_id += 1
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("INSERT INTO response (attempt_id, question_id, answer, is_correct) VALUES (:a, :q, '[1]', 1)"),
+                                 [{"a": attempt_id, "q": q} for q in range(rows_per_write)])
+                with lock:
+                    counts["writes"] += 1
+            except OperationalError:
+                with lock:
+                    counts["errors"] += 1
+
+    def reader(worker):
+        while time.perf_counter() < stop:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT count(*), sum(is_correct) FROM response WHERE attempt_id = :a"), {"a": worker}).all()
+                with lock:
+                    counts["reads"] += 1
+            except OperationalError:
+                with lock:
+                    counts["errors"] += 1
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return {
+        "mode": "tuned" if tuned else "default",
+        "writes_per_second": round(counts["writes"] / seconds, 1),
+        "reads_per_second": round(counts["reads"] / seconds, 1),
+        "errors": counts["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite throughput, default settings vs tuned pragmas")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--rows-per-write", type=int, default=20, help="Response rows per write transaction")
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    args = parser.parse_args()
+    results = [run(tuned, args.seconds, args.writers, args.readers, args.rows_per_write) for tuned in (False, True)]
+    if args.json:
+        print(json.dumps(results))
+        return
+    for result in results:
+        print(f"{result['mode']:>8}: {result['writes_per_second']:>9} writes/s {result['reads_per_second']:>9} reads/s {result['errors']:>5} lock errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Cold start of a worker: interpreter start, `import app`, building the app and serving
+# the first request, each measured in a fresh process against an initialized database.
+# Run from the repository root:
+#   python -m benchmarks.startup --runs 10 --path /
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Runs in the child. It touches the app the way a WSGI server does (module.app) so it
+# times whatever startup work the app module does, lazily or at import.
+WORKER = """
+import json, time
+started = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+application = module.app
+built = time.perf_counter()
+response = application.test_client().get({path!r})
+served = time.perf_counter()
+print(json.dumps({{"status": response.status_code, "import_ms": (imported - started) * 1000,
+                  "create_ms": (built - imported) * 1000, "first_request_ms": (served - built) * 1000}}))
+"""
+
+SETUP = """
+from app import createApp
+from backend.bootstrap import init_db, seed_users
+app = createApp()
+with app.app_context():
+    init_db()
+    seed_users()
+"""
+
+
+def run_worker(path, env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", WORKER.format(path=path)], env=env, capture_output=True, text=True)
+    wall = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = wall
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import-to-first-request latency of a worker process")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--path", default="/", help="Path of the first request")
+    parser.add_argument("--json", action="store_true", help="Print machine readable results")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="quiz_startup_")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'startup.sqlite3')}")
+    subprocess.run([sys.executable, "-c", SETUP], env=env, check=True, capture_output=True)
+    runs = [run_worker(args.path, env) for _ in range(args.runs)]
+
+    summary = {"runs": args.runs, "path": args.path, "status": runs[-1]["status"]}
+    for phase in ("import_ms", "create_ms", "first_request_ms", "process_ms"):
+        values = sorted(run[phase] for run in runs)
+        summary[phase] = {"median": round(statistics.median(values), 1), "min": round(values[0], 1), "max": round(values[-1], 1)}
+    if args.json:
+        print(json.dumps(summary))
+        return
+    print(f"{args.runs} cold starts, first request GET {args.path} -> {summary['status']}")
+    for phase, label in (("import_ms", "import app"), ("create_ms", "build app"),
+                         ("first_request_ms", "first request"), ("process_ms", "whole process")):
+        stats = summary[phase]
+        print(f"{label:>14}: median {stats['median']:>7} ms  min {stats['min']:>7} ms  max {stats['max']:>7} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+-- The schema as the original tree's db.create_all() made it, before any migration
+CREATE TABLE user (
+	id INTEGER NOT NULL,
+	name VARCHAR(255) NOT NULL,
+	email VARCHAR(255) NOT NULL,
+	password VARCHAR NOT NULL,
+	fs_uniquifier VARCHAR NOT NULL,
+	active BOOLEAN,
+	PRIMARY KEY (id),
+	UNIQUE (fs_uniquifier)
+);
+
+CREATE UNIQUE INDEX ix_user_email ON user (email);
+
+CREATE TABLE role (
+	id INTEGER NOT NULL,
+	name VARCHAR NOT NULL,
+	description TEXT,
+	PRIMARY KEY (id)
+);
+
+CREATE TABLE subject (
+	id INTEGER NOT NULL,
+	name VARCHAR NOT NULL,
+	description TEXT,
+	image_url VARCHAR NOT NULL,
+	PRIMARY KEY (id),
+	UNIQUE (name)
+);
+
+CREATE TABLE chapter (
+	id INTEGER NOT NULL,
+	name VARCHAR NOT NULL,
+	description TEXT,
+	PRIMARY KEY (id)
+);
+
+CREATE TABLE user_roles (
+	id INTEGER NOT NULL,
+	user_id INTEGER,
+	role_id INTEGER,
+	PRIMARY KEY (id),
+	FOREIGN KEY(user_id) REFERENCES user (id) ON DELETE CASCADE,
+	FOREIGN KEY(role_id) REFERENCES role (id) ON DELETE CASCADE
+);
+
+CREATE TABLE subject_chapter_association (
+	subject_id INTEGER NOT NULL,
+	chapter_id INTEGER NOT NULL,
+	PRIMARY KEY (subject_id, chapter_id),
+	FOREIGN KEY(subject_id) REFERENCES subject (id) ON DELETE CASCADE,
+	FOREIGN KEY(chapter_id) REFERENCES chapter (id) ON DELETE CASCADE
+);
+
+CREATE TABLE quiz (
+	id INTEGER NOT NULL,
+	chapter_id INTEGER,
+	name VARCHAR NOT NULL,
+	description TEXT,
+	total_marks INTEGER NOT NULL,
+	time_limit INTEGER,
+	PRIMARY KEY (id),
+	FOREIGN KEY(chapter_id) REFERENCES chapter (id) ON DELETE CASCADE
+);
+
+CREATE TABLE question (
+	id INTEGER NOT NULL,
+	quiz_id INTEGER,
+	question_statement TEXT NOT NULL,
+	ans_type VARCHAR NOT NULL,
+	options JSON,
+	correct_options JSON,
+	correct_min FLOAT,
+	correct_max FLOAT,
+	marks INTEGER NOT NULL,
+	PRIMARY KEY (id),
+	FOREIGN KEY(quiz_id) REFERENCES quiz (id) ON DELETE CASCADE
+);
+
+CREATE TABLE attempt (
+	id INTEGER NOT NULL,
+	student_id INTEGER,
+	quiz_id INTEGER,
+	attempt_number INTEGER NOT NULL,
+	attempt_date DATETIME,
+	score INTEGER,
+	PRIMARY KEY (id),
+	FOREIGN KEY(student_id) REFERENCES user (id) ON DELETE CASCADE,
+	FOREIGN KEY(quiz_id) REFERENCES quiz (id) ON DELETE CASCADE
+);
+
+CREATE TABLE response (
+	id INTEGER NOT NULL,
+	attempt_id INTEGER NOT NULL,
+	question_id INTEGER NOT NULL,
+	answer JSON,
+	is_correct BOOLEAN,
+	PRIMARY KEY (id),
+	FOREIGN KEY(attempt_id) REFERENCES attempt (id) ON DELETE CASCADE,
+	FOREIGN KEY(question_id) REFERENCES question (id) ON DELETE CASCADE
+);
@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import insert
+from app import createApp
+from backend.bootstrap import init_db
+from backend.database import engine_options
+from backend.hashing import hasher
+from backend.models import Chapter, Question, Quiz, db
+
+
+# Settings a test module overrides for its apps, e.g. by redefining this fixture
+@pytest.fixture
+def app_config():
+    return {}
+
+
+# An app on the SQLite file at path. Grading runs in the request, bcrypt inline and cheap,
+# and the rate limits are off.
+def make_app(path, **config):
+    uri = f"sqlite:///{path}"
+    return createApp({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": uri,
+        "SQLALCHEMY_ENGINE_OPTIONS": engine_options(uri),
+        "PASSWORD_HASH_WORKERS": 0,
+        "BCRYPT_ROUNDS": 4,
+        "SUBMISSION_MODE": "sync",
+        "RATE_LIMITING": False,
+        **config,
+    })
+
+
+# A fresh app on its own SQLite file per test, with the schema migrated
+@pytest.fixture
+def app(tmp_path, app_config):
+    app = make_app(tmp_path / "test.sqlite3", **app_config)
+    with app.app_context():
+        init_db()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# Seeds `quizzes` quizzes of `questions` single choice questions each (option 0 is correct)
+# into chapter 1, inside the caller's app context. Untimed unless time_limit (minutes) is given.
+@pytest.fixture
+def seed_catalog():
+    def seed(quizzes=1, questions=3, time_limit=None):
+        db.session.execute(insert(Chapter).values(id=1, name="Chapter", description="Test chapter"))
+        db.session.execute(insert(Quiz.__table__), [{"id": quiz_id, "chapter_id": 1, "name": f"Quiz {quiz_id}", "total_marks": questions,
+                                           "time_limit": time_limit}
+                                          for quiz_id in range(1, quizzes + 1)])
+        db.session.execute(insert(Question), [{"quiz_id": quiz_id, "question_statement": f"Question {number}", "ans_type": "single",
+                                               "options": ["a", "b", "c"], "correct_options": [0], "marks": 1}
+                                              for quiz_id in range(1, quizzes + 1) for number in range(questions)])
+        db.session.commit()
+    return seed
+
+
+def sign_in(app, client, email, role):
+    with app.app_context():
+        user = app.security.datastore.create_user(name=email.split("@")[0], email=email, password=hasher.hash("secret"), roles=[role])
+        db.session.commit()
+        user_id = user.id
+    token = client.post("/api/login", json={"email": email, "password": "secret"}).json["token"]
+    return user_id, {"Token": token}
+
+
+# A signed-in student: (user id, auth token header)
+@pytest.fixture
+def student(app, client):
+    return sign_in(app, client, "student@test.local", "user")
+
+
+@pytest.fixture
+def admin(app, client):
+    return sign_in(app, client, "admin@test.local", "admin")
@@ -0,0 +1,97 @@
+import random
+import pytest
+from sqlalchemy import insert, select
+from backend import analytics
+from backend.analytics import _bucket
+from backend.models import Question, QuestionAnswerCount, QuestionStats, db
+from backend.submissions import claim, enqueue, grade_batch
+
+INF = float("inf")
+# Questions 1 and 2 are single choice (option 0 correct), 3 and 4 numeric with a narrow range far
+# from zero and a finely spaced one
+NUMERIC = [(3, 1234567.0, 1234568.0), (4, 0.1234561, 0.1234562)]
+
+
+def seed_quiz(seed_catalog):
+    seed_catalog(questions=2)
+    db.session.execute(insert(Question), [{"id": question_id, "quiz_id": 1, "question_statement": f"Question {question_id}",
+                                           "ans_type": "numeric", "correct_min": low, "correct_max": high, "marks": 1}
+                                          for question_id, low, high in NUMERIC])
+    db.session.commit()
+
+
+def counters():
+    return {model.__name__: db.session.execute(select(*model.__table__.columns).order_by(*model.__table__.primary_key.columns)).all()
+            for model in (QuestionStats, QuestionAnswerCount)}
+
+
+@pytest.mark.parametrize("value, low, high, key", [
+    (3.2, 2.5, 3.5, "2.5"), (3.6, 2.5, 3.5, "3.5"), (2, 2.5, 3.5, "1.5"), (5, 0, INF, "5"), (-0.5, -INF, INF, "-1"),
+    (1234567.5, 1234567, 1234568, "1234567"), (1234568.5, 1234567, 1234568, "1234568"), (2e6, 0, 1, "2000000"),
+    (0.12345615, 0.1234561, 0.1234562, "0.1234561"), (0.12345625, 0.1234561, 0.1234562, "0.1234562"), (1e20, -INF, INF, "1e+20"),
+])
+def test_bucket_keys_are_exact(value, low, high, key):
+    assert _bucket(value, low, high) == key
+
+
+# Keys made with format(start, "g") collapsed buckets past six significant digits
+def test_neighbouring_buckets_get_distinct_keys():
+    for low, high in [(1234567.0, 1234568.0), (0.1234561, 0.1234562), (1e9, 1e9 + 0.5)]:
+        width = high - low
+        keys = [_bucket(low + (step + 0.5) * width, low, high) for step in range(-3, 4)]
+        assert len(set(keys)) == 7
+        assert [float(key) for key in keys] == sorted(float(key) for key in keys)
+
+
+def test_counters_through_the_api(app, client, seed_catalog, student, admin):
+    with app.app_context():
+        seed_quiz(seed_catalog)
+    user_id, headers = student
+    for answers in [{1: [0], 2: [1], 3: 1234567.5, 4: 0.12345615}, {1: [2], 3: 1234568.5, 4: "0.12345625"},
+                    {1: [0], 2: [0], 3: [1234567.25], 4: None}]:
+        response = client.post("/api/quiz/1/response", headers=headers, json={
+            "user_id": user_id, "responses": [{"question_id": question_id, "answer": answer} for question_id, answer in answers.items()]})
+        assert response.status_code == 201
+
+    report = {row["question_id"]: row for row in client.get("/api/quiz/1/analytics", headers=admin[1]).json}
+    assert [(value["value"], value["option"], value["count"]) for value in report[1]["distribution"]] == [("0", "a", 2), ("2", "c", 1)]
+    assert [(value["value"], value["count"]) for value in report[3]["distribution"]] == [("1234567", 2), ("1234568", 1)]
+    assert [(value["value"], value["count"]) for value in report[4]["distribution"]] == [("0.1234561", 1), ("0.1234562", 1)]
+    assert (report[3]["response_count"], report[3]["percent_correct"]) == (3, 66.67)
+    assert (report[4]["response_count"], report[4]["blank_count"], report[4]["percent_correct"]) == (3, 1, 33.33)
+    assert (report[2]["response_count"], report[2]["blank_count"]) == (2, 0)
+
+
+# Counters kept at grading time, for answers stored as rows or packed, in the request or in a
+# queued batch, are what rebuild() recomputes from the stored answers
+def test_incremental_counters_match_rebuild(app, client, seed_catalog, student):
+    rng = random.Random(9)
+    with app.app_context():
+        seed_quiz(seed_catalog)
+    user_id, headers = student
+
+    def answers():
+        return [(1, rng.choice([[0], [1], [2], None])), (2, rng.choice([[0], [1], []])),
+                (3, rng.choice([None, rng.uniform(1234560, 1234575)])), (4, rng.uniform(0.123455, 0.123458))]
+
+    for storage in ("rows", "packed"):
+        app.config["RESPONSE_STORAGE"] = storage
+        for _ in range(8):
+            response = client.post("/api/quiz/1/response", headers=headers, json={
+                "user_id": user_id, "responses": [{"question_id": question_id, "answer": answer} for question_id, answer in answers()]})
+            assert response.status_code == 201
+        with app.app_context():
+            for _ in range(8):
+                enqueue(user_id, 1, answers())
+            db.session.commit()
+            grade_batch(claim(5, 300))
+            grade_batch(claim(5, 300))
+            db.session.commit()
+
+    with app.app_context():
+        incremental = counters()
+        analytics.rebuild(batch_size=7)
+        db.session.commit()
+        assert counters() == incremental
+        assert sum(row.response_count for row in incremental["QuestionStats"]) == 4 * 32
+        assert len({value for question_id, value, _ in incremental["QuestionAnswerCount"] if question_id == 4}) > 10
@@ -0,0 +1,126 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from sqlalchemy import event, insert, select
+from backend.attempts import allocate_attempt, allocate_attempts
+from backend.models import Attempt, Question, db
+
+SUBMISSIONS = 20
+
+
+# Submissions racing for the same (student, quiz) must each get their own number, with no gaps
+def test_parallel_submissions_get_consecutive_attempt_numbers(app, seed_catalog, student):
+    with app.app_context():
+        seed_catalog(questions=3)
+        question_ids = db.session.execute(select(Question.id).where(Question.quiz_id == 1)).scalars().all()
+    user_id, headers = student
+    start = Barrier(SUBMISSIONS)
+
+    def submit(_):
+        client = app.test_client()
+        start.wait()
+        return client.post("/api/quiz/1/response", headers=headers,
+                           json={"user_id": user_id, "responses": [{"question_id": question_id, "answer": [0]} for question_id in question_ids]})
+
+    with ThreadPoolExecutor(SUBMISSIONS) as pool:
+        responses = list(pool.map(submit, range(SUBMISSIONS)))
+
+    assert [response.status_code for response in responses] == [201] * SUBMISSIONS
+    numbers = sorted(response.json["data"]["attempt_number"] for response in responses)
+    assert numbers == list(range(1, SUBMISSIONS + 1))
+    with app.app_context():
+        stored = db.session.execute(select(Attempt.attempt_number, Attempt.score)
+                                    .where(Attempt.student_id == user_id, Attempt.quiz_id == 1).order_by(Attempt.attempt_number)).all()
+        assert stored == [(number, 3) for number in range(1, SUBMISSIONS + 1)]
+
+
+# Newest first; the cursor is the last attempt_number seen
+def test_attempt_history_pages_by_attempt_number(app, client, seed_catalog, student):
+    user_id, headers = student
+    with app.app_context():
+        seed_catalog(questions=1)
+        db.session.execute(insert(Attempt), [{"student_id": user_id, "quiz_id": 1, "attempt_number": number, "score": number % 2}
+                                             for number in range(1, 6)])
+        db.session.commit()
+    pages, cursor = [], None
+    while True:
+        response = client.get(f"/api/quiz/{user_id}/1/attempts", headers=headers,
+                              query_string={"limit": 2, "fields": "attempt_number,score", **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append(response.json)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert pages == [[{"attempt_number": 5, "score": 1}, {"attempt_number": 4, "score": 0}],
+                     [{"attempt_number": 3, "score": 1}, {"attempt_number": 2, "score": 0}], [{"attempt_number": 1, "score": 1}]]
+    assert client.get(f"/api/quiz/{user_id}/2/attempts", headers=headers).status_code == 404
+
+
+THREADS = 16
+
+
+# allocate_attempt and allocate_attempts racing from their own sessions, for two quizzes at once
+def test_parallel_allocations_number_without_gaps(app, seed_catalog, student):
+    user_id, _ = student
+    with app.app_context():
+        seed_catalog(quizzes=2, questions=1)
+    start = Barrier(THREADS)
+
+    def allocate(index):
+        quiz_id = 1 + index % 2
+        with app.app_context():
+            start.wait()
+            if index % 4 == 3:
+                allocated = allocate_attempts([(user_id, quiz_id, index * 10 + offset, None, None) for offset in range(3)])
+            else:
+                allocated = [allocate_attempt(user_id, quiz_id, score=index * 10)]
+            db.session.commit()
+        return quiz_id, allocated
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        results = list(pool.map(allocate, range(THREADS)))
+
+    with app.app_context():
+        stored = {(attempt_id, quiz_id, number): score for attempt_id, quiz_id, number, score in db.session.execute(
+            select(Attempt.id, Attempt.quiz_id, Attempt.attempt_number, Attempt.score).where(Attempt.student_id == user_id))}
+    returned = [(attempt_id, quiz_id, number) for quiz_id, allocated in results for attempt_id, number in allocated]
+    assert sorted(returned) == sorted(stored)
+    for quiz_id in (1, 2):
+        numbers = sorted(number for _, quiz, number in stored if quiz == quiz_id)
+        assert numbers == list(range(1, len(numbers) + 1))
+        # Quiz 1 gets the 8 single allocations, quiz 2 four more and four batches of 3
+        assert len(numbers) == (8 if quiz_id == 1 else 4 + 4 * 3)
+    # A batch keeps its rows in order: consecutive numbers, scores as passed
+    for quiz_id, allocated in results:
+        if len(allocated) == 3:
+            assert [number for _, number in allocated] == list(range(allocated[0][1], allocated[0][1] + 3))
+            assert [stored[(attempt_id, quiz_id, number)] % 10 for attempt_id, number in allocated] == [0, 1, 2]
+
+
+# A batch computes its numbers before inserting; when another writer takes one of them in
+# between, the unique constraint fails the insert and the batch is allocated row by row
+def test_batch_falls_back_when_a_number_is_taken(app, seed_catalog, student):
+    user_id, _ = student
+    with app.app_context():
+        seed_catalog(questions=1)
+        allocate_attempt(user_id, 1)
+        db.session.commit()
+        path = db.engine.url.database
+        taken = []
+
+        def take_next(conn, cursor, statement, *args):
+            if statement.startswith("INSERT INTO attempt") and not taken:
+                with sqlite3.connect(path) as other:
+                    other.execute("INSERT INTO attempt (student_id, quiz_id, attempt_number, score) VALUES (?, 1, 2, 99)", (user_id,))
+                taken.append(True)
+
+        event.listen(db.engine, "before_cursor_execute", take_next)
+        try:
+            allocated = allocate_attempts([(user_id, 1, 5, None, None), (user_id, 1, 6, None, None)])
+            db.session.commit()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", take_next)
+        assert [number for _, number in allocated] == [3, 4]
+        stored = db.session.execute(select(Attempt.attempt_number, Attempt.score).where(Attempt.student_id == user_id)
+                                    .order_by(Attempt.attempt_number)).all()
+        assert stored == [(1, 0), (2, 99), (3, 5), (4, 6)]
@@ -0,0 +1,150 @@
+from contextlib import contextmanager
+from sqlalchemy import event, insert, update
+from backend.models import CatalogVersion, Chapter, Question, Quiz, Subject, db, subject_chapter_association
+from backend.resources import QuizIdAPI, SubjectAPI
+
+
+@contextmanager
+def count_statements():
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+
+# Adds `subjects` subjects, each with `chapters` chapters of `quizzes` quizzes of `questions` questions
+def grow_catalog(subjects, chapters, quizzes, questions):
+    start = db.session.query(db.func.count(Subject.id)).scalar()
+    for subject_id in range(start + 1, start + subjects + 1):
+        db.session.execute(insert(Subject).values(id=subject_id, name=f"Subject {subject_id}", description="Test subject", image_url="x.png"))
+        for chapter_number in range(chapters):
+            chapter_id = db.session.execute(insert(Chapter).values(name=f"Chapter {chapter_number}", description="Test chapter")).inserted_primary_key[0]
+            db.session.execute(insert(subject_chapter_association).values(subject_id=subject_id, chapter_id=chapter_id))
+            for quiz_number in range(quizzes):
+                quiz_id = db.session.execute(insert(Quiz).values(chapter_id=chapter_id, name=f"Quiz {quiz_number}", total_marks=questions)).inserted_primary_key[0]
+                db.session.execute(insert(Question), [{"quiz_id": quiz_id, "question_statement": f"Question {number}", "ans_type": "single",
+                                                       "options": ["a", "b"], "correct_options": [0], "marks": 1} for number in range(questions)])
+    db.session.commit()
+    db.session.remove()
+
+
+# Subjects -> chapters -> quizzes is a fixed number of queries whatever the catalog's size,
+# and each quiz with its questions is another fixed number
+def test_catalog_reads_use_a_constant_number_of_queries(app):
+    counts = []
+    with app.app_context():
+        for size in (1, 4):
+            grow_catalog(subjects=size, chapters=size, quizzes=2, questions=size * 5)
+            with count_statements() as tree:
+                subjects, _ = SubjectAPI._load(None, None, 2, None)
+            quiz_ids = [quiz["id"] for subject in subjects for chapter in subject["chapters"] for quiz in chapter["quizzes"]]
+            db.session.remove()
+            with count_statements() as quiz:
+                loaded = QuizIdAPI._load(quiz_ids[-1])
+            db.session.remove()
+            assert len(loaded["questions"]) == size * 5
+            counts.append((len(tree), len(quiz)))
+    assert counts[0] == counts[1]
+    assert counts[0][0] <= 3 and counts[0][1] <= 2
+
+
+# Another worker's write commits and bumps the shared version row; this worker's cache and
+# ETags must follow on its next request
+def test_catalog_cache_follows_writes_from_other_workers(app, client, student):
+    _, headers = student
+    with app.app_context():
+        grow_catalog(subjects=1, chapters=1, quizzes=1, questions=1)
+    first = client.get("/api/subject", headers=headers)
+    assert [subject["name"] for subject in first.json] == ["Subject 1"]
+    assert client.get("/api/subject", headers={**headers, "If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    with app.app_context():
+        db.session.execute(insert(Subject).values(id=2, name="Subject 2", description="Added elsewhere", image_url="x.png"))
+        db.session.execute(update(CatalogVersion).values(version=CatalogVersion.version + 1))
+        db.session.commit()
+
+    second = client.get("/api/subject", headers={**headers, "If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert [subject["name"] for subject in second.json] == ["Subject 1", "Subject 2"]
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+
+def test_admin_writes_bump_the_shared_version(app, client, admin):
+    _, headers = admin
+    with app.app_context():
+        before = db.session.get(CatalogVersion, 1).version
+    response = client.post("/api/subject", headers=headers, json={"name": "New", "description": "Subject", "image_url": "x.png"})
+    assert response.status_code == 201
+    with app.app_context():
+        assert db.session.get(CatalogVersion, 1).version == before + 1
+
+
+# A quiz without a pool serves every question: pool_size is null, not a pool of 0
+def test_unpooled_quiz_has_no_pool_size(app, client, seed_catalog, admin):
+    _, headers = admin
+    with app.app_context():
+        seed_catalog(questions=2)
+        db.session.execute(insert(Quiz).values(id=2, chapter_id=1, name="Pooled", total_marks=1, pool_size=1))
+        db.session.commit()
+    assert client.get("/api/quiz/1", headers=headers).json["pool_size"] is None
+    assert client.get("/api/quiz/2", headers=headers).json["pool_size"] == 1
+    assert [quiz["pool_size"] for quiz in client.get("/api/chapter/1/quiz", headers=headers).json] == [None, 1]
+
+
+# Every page of a list endpoint: (ids, next cursor) until the last one, which has no cursor
+def walk(client, headers, path, **args):
+    pages, cursor = [], None
+    while True:
+        response = client.get(path, headers=headers, query_string={**args, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        cursor = response.headers.get("X-Next-Cursor")
+        pages.append(([row["id"] for row in response.json], cursor and int(cursor)))
+        if not cursor:
+            return pages
+
+
+def test_list_endpoints_page_by_keyset(app, client, admin):
+    _, headers = admin
+    with app.app_context():
+        grow_catalog(subjects=5, chapters=1, quizzes=2, questions=1)
+    assert walk(client, headers, "/api/subject", limit=2) == [([1, 2], 2), ([3, 4], 4), ([5], None)]
+    assert walk(client, headers, "/api/chapter", limit=3) == [([1, 2, 3], 3), ([4, 5], None)]
+    assert walk(client, headers, "/api/quiz", limit=5) == [([1, 2, 3, 4, 5], 5), ([6, 7, 8, 9, 10], None)]
+
+    # The cursor is the last id seen, not an offset: rows deleted before it shift nothing
+    assert client.delete("/api/subject/1", headers=headers).status_code == 200
+    assert walk(client, headers, "/api/subject", limit=2, cursor=2) == [([3, 4], 4), ([5], None)]
+    assert client.get("/api/subject", headers=headers, query_string={"cursor": 5}).json == []
+
+    app.config["PAGE_MAX_LIMIT"] = 3
+    assert walk(client, headers, "/api/quiz", limit=100)[0] == ([1, 2, 3], 3)
+    assert client.get("/api/quiz", headers=headers, query_string={"limit": 0}).status_code == 400
+
+
+def test_depth_and_fields_trim_the_tree(app, client, admin):
+    _, headers = admin
+    with app.app_context():
+        grow_catalog(subjects=2, chapters=2, quizzes=1, questions=1)
+
+    def get(path, **args):
+        return client.get(path, headers=headers, query_string=args).json
+
+    assert all(len(subject["chapters"][0]["quizzes"]) == 1 for subject in get("/api/subject"))
+    assert [sorted(subject) for subject in get("/api/subject", depth=0)] == [["description", "id", "image_url", "name"]] * 2
+    assert ["quizzes" in chapter for subject in get("/api/subject", depth=1) for chapter in subject["chapters"]] == [False] * 4
+    assert get("/api/subject", fields="name,id,bogus") == [{"id": 1, "name": "Subject 1"}, {"id": 2, "name": "Subject 2"}]
+    assert [sorted(subject) for subject in get("/api/subject", fields="chapters,id")] == [["chapters", "id"]] * 2
+    assert get("/api/chapter", fields="id", limit=2) == [{"id": 1}, {"id": 2}]
+    assert [sorted(quiz) for quiz in get("/api/quiz", fields="name,time_limit")] == [["name", "time_limit"]] * 4
+
+    # Children that are not marshalled are not loaded either
+    with app.app_context():
+        with count_statements() as shallow:
+            SubjectAPI._load(None, 10, None, "id,name")
+        db.session.remove()
+        with count_statements() as deep:
+            SubjectAPI._load(None, 10, None, None)
+    assert len(shallow) == 1 and len(deep) == 3
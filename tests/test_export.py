@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+import pytest
+from sqlalchemy import insert
+from backend.models import Chapter, Question, Quiz, db
+
+
+@pytest.fixture
+def app_config():
+    return {"EXPORT_BATCH_SIZE": 2}
+
+
+# Quizzes 1 and 2 in chapter 1 and quiz 3 in chapter 2, each with questions 3q-2..3q. Quiz 2 is
+# answered with packed storage, so its responses have no rows of their own.
+@pytest.fixture
+def answered(app, client, seed_catalog, student):
+    user_id, headers = student
+    with app.app_context():
+        seed_catalog(quizzes=2, questions=3)
+        db.session.execute(insert(Chapter).values(id=2, name="Other", description="Second chapter"))
+        db.session.execute(insert(Quiz.__table__).values(id=3, chapter_id=2, name="Quiz 3", total_marks=3, time_limit=None))
+        db.session.execute(insert(Question), [{"quiz_id": 3, "question_statement": f"Question {number}", "ans_type": "single",
+                                               "options": ["a", "b", "c"], "correct_options": [0], "marks": 1} for number in range(3)])
+        db.session.commit()
+    for quiz_id, storage, answers in [(1, "rows", [(1, [0]), (2, [1]), (3, None)]), (2, "packed", [(4, [0]), (5, "text")]),
+                                      (1, "rows", [(1, [2])]), (3, "rows", [(7, [0]), (8, [0])])]:
+        app.config["RESPONSE_STORAGE"] = storage
+        response = client.post(f"/api/quiz/{quiz_id}/response", headers=headers, json={
+            "user_id": user_id, "responses": [{"question_id": question_id, "answer": answer} for question_id, answer in answers]})
+        assert response.status_code == 201
+    return user_id
+
+
+def export(client, headers, **args):
+    response = client.get("/api/export", headers=headers, query_string=args)
+    assert response.status_code == 200
+    return response
+
+
+def test_attempts_csv(client, admin, answered):
+    response = export(client, admin[1], kind="attempts", format="csv")
+    assert response.mimetype == "text/csv"
+    assert response.headers["Content-Disposition"] == "attachment; filename=attempts_all.csv"
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ["attempt_id", "student_id", "student_email", "quiz_id", "attempt_number", "attempt_date", "score"]
+    assert [row[:5] + row[6:] for row in rows[1:]] == [
+        ["1", str(answered), "student@test.local", "1", "1", "1"], ["2", str(answered), "student@test.local", "2", "1", "1"],
+        ["3", str(answered), "student@test.local", "1", "2", "0"], ["4", str(answered), "student@test.local", "3", "1", "2"],
+    ]
+    assert all("T" in row[5] for row in rows[1:])
+
+
+# Row-stored responses first, then the packed ones, which have no response id
+def test_responses_jsonl_includes_packed_attempts(client, admin, answered):
+    response = export(client, admin[1], kind="responses", format="jsonl")
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(line["response_id"], line["attempt_id"], line["quiz_id"], line["attempt_number"], line["question_id"], line["answer"],
+             line["is_correct"]) for line in lines] == [
+        (1, 1, 1, 1, 1, [0], True), (2, 1, 1, 1, 2, [1], False), (3, 1, 1, 1, 3, None, False), (4, 3, 1, 2, 1, [2], False),
+        (5, 4, 3, 1, 7, [0], True), (6, 4, 3, 1, 8, [0], True),
+        (None, 2, 2, 1, 4, [0], True), (None, 2, 2, 1, 5, "text", False),
+    ]
+    assert {line["student_id"] for line in lines} == {answered}
+
+
+@pytest.mark.parametrize("scope, scope_id, attempt_ids", [("quiz", 1, [1, 1, 1, 3]), ("quiz", 2, [2, 2]), ("chapter", 1, [1, 1, 1, 3, 2, 2]),
+                                                          ("chapter", 2, [4, 4]), ("quiz", 9, [])])
+def test_responses_csv_by_scope(client, admin, answered, scope, scope_id, attempt_ids):
+    response = export(client, admin[1], kind="responses", format="csv", scope=scope, id=scope_id)
+    assert response.headers["Content-Disposition"] == f"attachment; filename=responses_{scope}_{scope_id}.csv"
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [int(row["attempt_id"]) for row in rows] == attempt_ids
+    # Lists and dicts are written as JSON, None as an empty cell
+    assert all(row["answer"] in ("", "[0]", "[1]", "[2]", "text") for row in rows)
+
+
+# The body is streamed in chunks of EXPORT_BATCH_SIZE rows
+def test_export_streams_in_batches(client, admin, answered):
+    response = client.get("/api/export", headers=admin[1], query_string={"kind": "attempts", "format": "jsonl"}, buffered=False)
+    chunks = [chunk.decode() for chunk in response.response]
+    response.close()
+    assert [chunk.count("\n") for chunk in chunks] == [2, 2]
+
+
+@pytest.mark.parametrize("args", [{"kind": "users"}, {"format": "xlsx"}, {"scope": "subject", "id": 1}, {"scope": "quiz"}])
+def test_invalid_export_options(client, admin, args):
+    assert client.get("/api/export", headers=admin[1], query_string=args).status_code == 400
@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import insert, select
+from backend.grading import AnswerKey, grade_attempts, load_answer_key
+from backend.models import Attempt, Response, db
+
+# (question_id, ans_type, correct_options, correct_min, correct_max, marks)
+KEY = AnswerKey(1, [
+    (10, "single", [1], None, None, 1),
+    (11, "multiple_choice", [0, 2], None, None, 2),
+    (12, "numeric", None, 2.5, 3.5, 3),
+    (13, None, None, 7, None, 4),  # no ans_type and no options: numeric, open above
+])
+
+
+@pytest.mark.parametrize("question_id, answer, correct", [
+    (10, 1, True), (10, "1", True), (10, [1], True), (10, 1.0, True), (10, " 1 ", True),
+    (10, 0, False), (10, [1, 2], False), (10, "b", False),
+    (11, [2, 0], True), (11, ["0", 2], True), (11, [0], False), (11, [0, 1, 2], False), (11, 0, False),
+    (12, 2.5, True), (12, "3.5", True), (12, [3], True), (12, 3.6, False), (12, [3, 3], False), (12, "three", False),
+    (13, 7, True), (13, 1e9, True), (13, 6.9, False),
+    (10, None, False), (10, "", False), (10, [], False), (11, [], False), (12, None, False), (12, "", False),
+])
+def test_answer_key_checks_each_answer_type(question_id, answer, correct):
+    assert KEY.is_correct(KEY.position[question_id], answer) is correct
+
+
+def test_grade_scores_marks_of_correct_answers():
+    results, score = KEY.grade([(10, 1), (11, [0, 2]), (12, 9), (13, None), (99, 1)])
+    assert results == [True, True, False, False, False]
+    assert score == 3
+    assert KEY.total_marks == 10
+
+
+# da17721: a question answered twice scored twice, so a submission could beat total_marks
+@pytest.mark.parametrize("answers, score", [
+    ([(10, 1), (10, 1), (10, 1)], 1),
+    ([(10, 0), (10, 1)], 1),
+    ([(10, 1), (10, 0)], 0),
+])
+def test_repeated_question_scores_once_by_its_last_answer(answers, score):
+    assert KEY.grade(answers)[1] == score
+    assert KEY.grade(KEY.known(answers))[1] == score
+
+
+def test_known_drops_other_questions_and_keeps_first_positions():
+    assert KEY.known([(11, [0]), (99, 1), (10, 0), (11, [0, 2]), (10, 1)]) == [(11, [0, 2]), (10, 1)]
+
+
+def test_submission_with_a_repeated_question(app, client, seed_catalog, student):
+    with app.app_context():
+        seed_catalog(questions=3)
+    user_id, headers = student
+    answers = [{"question_id": 1, "answer": [0]}] * 3 + [{"question_id": 2, "answer": [1]}, {"question_id": 2, "answer": [0]}]
+    response = client.post("/api/quiz/1/response", headers=headers, json={"user_id": user_id, "responses": answers})
+    assert response.status_code == 201
+    with app.app_context():
+        assert db.session.execute(select(Attempt.score)).scalar_one() == 2
+        stored = db.session.execute(select(Response.question_id, Response.is_correct).order_by(Response.id)).all()
+        assert stored == [(1, True), (2, True)]
+
+
+# Rows stored before the fix may repeat a question; a regrade counts it once, by the last row
+def test_regrade_counts_a_repeated_question_once(app, seed_catalog, student):
+    with app.app_context():
+        seed_catalog(questions=3)
+        attempt_id = db.session.execute(insert(Attempt).values(student_id=student[0], quiz_id=1, attempt_number=1, score=0)).inserted_primary_key[0]
+        db.session.execute(insert(Response), [{"attempt_id": attempt_id, "question_id": question_id, "answer": answer}
+                                              for question_id, answer in [(1, [0]), (1, [0]), (2, [0]), (2, [1]), (3, None)]])
+        assert grade_attempts([attempt_id]) == {attempt_id: 1}
+        db.session.commit()
+        assert db.session.get(Attempt, attempt_id).score == 1
+        assert db.session.execute(select(Response.is_correct).order_by(Response.id)).scalars().all() == [True, True, True, False, False]
+        assert load_answer_key(1).total_marks == 3
@@ -0,0 +1,59 @@
+import os
+import time
+from multiprocessing import parent_process
+import pytest
+from flask_security.utils import hash_password, verify_password
+from backend.hashing import HasherSaturated, _hash, hasher
+from conftest import make_app
+
+
+# Kills the pool worker it runs on; returns normally when served inline
+def _die():
+    if parent_process() is not None:
+        os._exit(1)
+    now = time.time()
+    return "inline", now, now
+
+
+@pytest.fixture
+def pooled(tmp_path):
+    app = make_app(tmp_path / "test.sqlite3", PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=1, PASSWORD_HASH_TIMEOUT=0.01)
+    yield app
+    hasher.shutdown()
+
+
+def test_building_the_app_starts_no_workers(pooled):
+    assert hasher.workers == 1 and hasher._executor is None
+
+
+def test_flask_security_hashes_with_the_configured_rounds(tmp_path):
+    app = make_app(tmp_path / "test.sqlite3", BCRYPT_ROUNDS=5)
+    with app.app_context():
+        password_hash = hash_password("secret")
+        assert password_hash.startswith("$2b$05$")
+        assert verify_password("secret", password_hash)
+        assert hasher.verify("secret", password_hash)
+        assert hasher.hash("secret").startswith("$2b$05$")
+
+
+# A job that outlives the caller's timeout keeps its queue slot until the worker is done with it
+def test_timed_out_job_holds_its_slot(pooled):
+    with pytest.raises(HasherSaturated):
+        hasher._run("hashes", _hash, b"secret", 13)
+    rejected = hasher.metrics["rejected"]
+    with pytest.raises(HasherSaturated):
+        hasher._run("hashes", _hash, b"secret", 4)
+    assert hasher.metrics["rejected"] == rejected + 1
+    assert hasher._slots.acquire(timeout=30)
+    hasher._slots.release()
+
+
+def test_dead_worker_is_replaced(pooled):
+    hasher.timeout = 30
+    hasher._run("hashes", _hash, b"warm-up", 4)
+    broken = hasher._executor
+    assert hasher._run("hashes", _die) == "inline"
+    assert hasher._executor is None and broken._shutdown_thread
+    assert hasher._run("hashes", _hash, b"secret", 4).startswith("$2b$04$")
+    assert hasher._executor._mp_context.get_start_method() == "spawn"
+    assert hasher._slots.acquire(blocking=False)
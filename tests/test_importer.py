@@ -0,0 +1,142 @@
+import io
+import json
+import pytest
+from sqlalchemy import select, text
+from backend.models import Chapter, Question, Quiz, Subject, db
+
+
+@pytest.fixture
+def app_config():
+    return {"IMPORT_CHUNK_SIZE": 3}
+
+
+def upload(client, headers, lines, fmt="jsonl", **kwargs):
+    body = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines).encode()
+    return client.post("/api/import", headers=headers, query_string={"format": fmt} if fmt else {}, data=body, **kwargs)
+
+
+def catalog():
+    return {
+        "subjects": db.session.execute(select(Subject.name).order_by(Subject.id)).scalars().all(),
+        "chapters": db.session.execute(select(Chapter.name).order_by(Chapter.id)).scalars().all(),
+        "quizzes": db.session.execute(select(Quiz.name, Quiz.chapter_id, Quiz.total_marks, Quiz.time_limit).order_by(Quiz.id)).all(),
+        "questions": db.session.execute(select(Question.quiz_id, Question.question_statement, Question.ans_type, Question.options,
+                                               Question.correct_options, Question.correct_min, Question.correct_max).order_by(Question.id)).all(),
+    }
+
+
+SUBJECT = {"type": "subject", "name": "Maths", "description": "Numbers", "image_url": "m.png"}
+CHAPTER = {"type": "chapter", "subject": "Maths", "name": "Algebra", "description": "Letters"}
+QUIZ = {"type": "quiz", "subject": "Maths", "chapter": "Algebra", "name": "Week 1", "description": "First", "total_marks": 3}
+PLACE = {"subject": "Maths", "chapter": "Algebra", "quiz": "Week 1"}
+
+
+def question(statement, **row):
+    return {"type": "question", **PLACE, "question_statement": statement, "ans_type": "single", "options": ["a", "b"],
+            "correct_options": [0], "marks": 1, **row}
+
+
+# Bad lines are reported by line number and skipped, the rest of the upload goes in
+def test_jsonl_import_reports_each_bad_line(app, client, admin):
+    _, headers = admin
+    response = upload(client, headers, [
+        SUBJECT, CHAPTER, QUIZ,
+        question("Pick a"),
+        "{not json",
+        "[1, 2]",
+        "",
+        {"type": "answer"},
+        question("Both", ans_type="multiple", correct_options=[0, 1]),
+        question("Two right", correct_options=[0, 1]),
+        question("No options", options=None),
+        question("Lost", quiz="Week 9"),
+        {"type": "quiz", "subject": "Maths", "chapter": "Algebra", "name": "No marks", "description": "x"},
+        question("Range", ans_type="numeric", options=None, correct_options=None, correct_min="2.5", correct_max=3.5),
+        question("Open", ans_type="numeric", options=None, correct_options=None),
+        question("Marks", marks="one"),
+    ])
+    assert response.status_code == 207
+    report = response.json["data"]
+    assert report["rows"] == 15
+    assert report["created"] == {"subject": 1, "chapter": 1, "quiz": 1, "question": 3}
+    assert report["error_count"] == 9
+    assert [(error["line"], error["error"].split(":")[0]) for error in report["errors"]] == [
+        (5, "Invalid JSON"), (6, "Each line must be a JSON object"), (8, "'type' must be one of subject, chapter, quiz, question"),
+        (10, "Single choice questions need exactly one correct option"), (11, "Missing required fields"),
+        (12, "Unknown quiz 'Week 9'"), (13, "Missing required fields"),
+        (15, "Numeric questions need 'correct_min' and/or 'correct_max'"), (16, "'marks' must be an integer"),
+    ]
+    with app.app_context():
+        assert catalog() == {
+            "subjects": ["Maths"], "chapters": ["Algebra"], "quizzes": [("Week 1", 1, 3, 30)],
+            "questions": [(1, "Pick a", "single", ["a", "b"], [0], None, None), (1, "Both", "multiple", ["a", "b"], [0, 1], None, None),
+                          (1, "Range", "numeric", None, None, 2.5, 3.5)],
+        }
+
+    # A second upload reuses the parents it names instead of duplicating them
+    response = upload(client, headers, [SUBJECT, CHAPTER, QUIZ, question("Again")])
+    assert response.status_code == 201
+    assert response.json["data"]["created"] == {"subject": 0, "chapter": 0, "quiz": 0, "question": 1}
+
+
+def test_csv_import(app, client, admin):
+    _, headers = admin
+    lines = [
+        "type,name,description,image_url,subject,chapter,quiz,question_statement,ans_type,options,correct_options,marks,correct_min,total_marks",
+        "subject,Maths,Numbers,m.png,,,,,,,,,,",
+        "chapter,Algebra,Letters,,Maths,,,,,,,,,",
+        "quiz,Week 1,First,,Maths,Algebra,,,,,,,,2",
+        'question,,,,Maths,Algebra,Week 1,"Pick, one",single,a|b|c,2,1,,',
+        'question,,,,Maths,Algebra,Week 1,Pick two,multiple,"[""x"", ""y""]","[0, 1]",1,,',
+        "question,,,,Maths,Algebra,Week 1,Above,numeric,,,1,7,",
+        'question,,,,Maths,Algebra,Week 1,Broken,multiple,"[""x""",[0],1,,',
+    ]
+    response = upload(client, headers, lines, fmt=None, content_type="text/csv")
+    assert response.status_code == 207
+    report = response.json["data"]
+    assert report["created"] == {"subject": 1, "chapter": 1, "quiz": 1, "question": 3}
+    assert [(error["line"], error["error"].split(":")[0]) for error in report["errors"]] == [(8, "Invalid JSON in 'options'")]
+    with app.app_context():
+        assert catalog()["questions"] == [(1, "Pick, one", "single", ["a", "b", "c"], ["2"], None, None),
+                                          (1, "Pick two", "multiple", ["x", "y"], [0, 1], None, None),
+                                          (1, "Above", "numeric", None, None, 7.0, None)]
+
+
+# A database error rolls back only the chunk it happened in: earlier chunks stay committed,
+# later ones go in, and rows that named a parent from the lost chunk are reported
+def test_database_error_rolls_back_one_chunk(app, client, admin):
+    _, headers = admin
+    with app.app_context():
+        db.session.execute(text("CREATE TRIGGER refuse BEFORE INSERT ON question WHEN NEW.question_statement = 'Refused' "
+                                "BEGIN SELECT RAISE(ABORT, 'refused by trigger'); END"))
+        db.session.commit()
+    physics = {"type": "subject", "name": "Physics", "description": "Forces", "image_url": "p.png"}
+    response = upload(client, headers, [
+        SUBJECT, CHAPTER, QUIZ,                                 # chunk 1, committed
+        question("Kept 1"), physics, question("Refused"),       # chunk 2, rolled back
+        question("Kept 2"), {**CHAPTER, "subject": "Physics"}, question("Kept 3"), question("Kept 4"),  # chunk 3
+    ])
+    assert response.status_code == 207
+    report = response.json["data"]
+    assert report["created"] == {"subject": 1, "chapter": 1, "quiz": 1, "question": 3}
+    assert report["error_count"] == 2
+    (rollback, unknown) = report["errors"]
+    assert rollback["line"] == 6 and rollback["error"].startswith("Database error, 3 uncommitted rows rolled back")
+    assert "refused by trigger" in rollback["error"]
+    assert unknown == {"line": 8, "error": "Unknown subject 'Physics'"}
+    with app.app_context():
+        assert catalog()["subjects"] == ["Maths"]
+        assert [row[1] for row in catalog()["questions"]] == ["Kept 2", "Kept 3", "Kept 4"]
+
+    # The same failure in the last, partial chunk is reported without a line
+    report = upload(client, headers, [question("Kept 5"), question("Refused")]).json["data"]
+    assert report["errors"][0]["line"] is None
+    assert report["created"]["question"] == 0
+
+
+def test_unreadable_upload_is_rejected(client, admin):
+    _, headers = admin
+    response = client.post("/api/import", headers=headers, query_string={"format": "jsonl"},
+                           data=io.BytesIO(json.dumps(SUBJECT).encode() + b"\n\xff\xfe\n"))
+    assert response.status_code == 400
+    assert client.post("/api/import", headers=headers, query_string={"format": "xml"}, data=b"").status_code == 400
@@ -0,0 +1,75 @@
+import random
+from sqlalchemy import insert, select
+from backend.leaderboard import rebuild, record_attempt, record_attempts
+from backend.models import Attempt, QuizBestScore, QuizScoreCount, QuizStats, User, db
+
+
+def add_students(count):
+    start = db.session.execute(select(db.func.max(User.id))).scalar() or 0
+    ids = list(range(start + 1, start + count + 1))
+    db.session.execute(insert(User), [{"id": user_id, "name": f"Student {user_id}", "email": f"s{user_id}@test.local",
+                                       "password": "x", "fs_uniquifier": f"u{user_id}"} for user_id in ids])
+    return ids
+
+
+# Attempts stored and folded into the aggregates one at a time, or in batches like the queue workers do
+def grade(attempts, batch=None):
+    for quiz_id, student_id, score in attempts:
+        number = select(db.func.count() + 1).where(Attempt.quiz_id == quiz_id, Attempt.student_id == student_id).scalar_subquery()
+        db.session.execute(insert(Attempt).values(quiz_id=quiz_id, student_id=student_id, attempt_number=number, score=score))
+    if batch:
+        for start in range(0, len(attempts), batch):
+            record_attempts(attempts[start:start + batch])
+    else:
+        for attempt in attempts:
+            record_attempt(*attempt)
+    db.session.commit()
+
+
+def aggregates():
+    return {model.__name__: db.session.execute(select(*model.__table__.columns).order_by(*model.__table__.primary_key.columns)).all()
+            for model in (QuizBestScore, QuizScoreCount, QuizStats)}
+
+
+# Ties span pages: the second page starts inside the 5s and the third inside the 3s. Ranks are
+# competition ranks over all students, not over the page.
+def test_ranks_and_percentiles_across_pages(app, client, seed_catalog, student):
+    _, headers = student
+    with app.app_context():
+        seed_catalog(questions=5)
+        students = add_students(6)
+        # The last student improves from 1 to 3, the second one repeats a 5
+        grade([(1, students[0], 5), (1, students[1], 5), (1, students[1], 5), (1, students[2], 5),
+               (1, students[3], 3), (1, students[4], 3), (1, students[5], 1), (1, students[5], 3), (1, students[3], 0)])
+    # 7 students take part: six here and the signed in one, who scores nothing
+    with app.app_context():
+        grade([(1, student[0], 0)])
+
+    rows, cursor = [], None
+    while True:
+        response = client.get("/api/quiz/1/leaderboard", headers=headers, query_string={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        assert len(response.json) <= 2
+        rows += response.json
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [(row["rank"], row["best_score"]) for row in rows] == [(1, 5), (1, 5), (1, 5), (4, 3), (4, 3), (4, 3), (7, 0)]
+    assert [row["student_id"] for row in rows] == students + [student[0]]
+    assert [row["percentile"] for row in rows] == [100.0] * 3 + [57.14] * 3 + [14.29]
+    assert rows[1]["attempt_count"] == 2
+
+
+def test_incremental_aggregates_match_rebuild(app, seed_catalog):
+    rng = random.Random(8)
+    with app.app_context():
+        seed_catalog(quizzes=2, questions=6)
+        students = add_students(12)
+        attempts = [(rng.choice((1, 2)), rng.choice(students), rng.randint(0, 6)) for _ in range(150)]
+        grade(attempts[:60])
+        grade(attempts[60:], batch=17)
+        incremental = aggregates()
+        rebuild()
+        db.session.commit()
+        assert aggregates() == incremental
+        assert any(count for _, _, _, count in incremental["QuizScoreCount"])
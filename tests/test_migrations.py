@@ -0,0 +1,91 @@
+import sqlite3
+from pathlib import Path
+import pytest
+from sqlalchemy import delete, inspect, select
+from backend.migrations import MIGRATIONS, explain_hot_queries, hot_queries, schema_migration, upgrade
+from backend.models import Attempt, db
+from conftest import make_app
+
+QUERIES = [name for name, _ in hot_queries()]
+BASELINE = Path(__file__).with_name("baseline_schema.sql")
+
+
+# Tables as create_all made them before the migrations existed: no secondary indexes
+def strip_indexes():
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(connection, checkfirst=True)
+        connection.execute(delete(schema_migration))
+
+
+# A database made by the original tree, with two attempts its racy allocation numbered alike
+@pytest.fixture
+def baseline_app(tmp_path):
+    path = tmp_path / "baseline.sqlite3"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(BASELINE.read_text())
+        connection.executescript("""
+            INSERT INTO user (id, name, email, password, fs_uniquifier, active) VALUES (1, 'Student', 's@test.local', 'x', 'u1', 1);
+            INSERT INTO chapter (id, name) VALUES (1, 'Chapter');
+            INSERT INTO quiz (id, chapter_id, name, total_marks, time_limit) VALUES (1, 1, 'Quiz', 1, 30);
+            INSERT INTO attempt (id, student_id, quiz_id, attempt_number, score) VALUES (1, 1, 1, 1, 0), (2, 1, 1, 1, 1);
+        """)
+    app = make_app(path)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.mark.parametrize("schema", ["fresh", "upgraded"])
+def test_hot_queries_use_indexes(app, schema):
+    with app.app_context():
+        if schema == "upgraded":
+            strip_indexes()
+            assert upgrade()
+        with db.engine.connect() as connection:
+            report = {entry["query"]: entry for entry in explain_hot_queries(connection)}
+    assert sorted(report) == sorted(QUERIES)
+    scans = {name: entry["plan"] for name, entry in report.items() if not entry["indexed"]}
+    assert not scans
+
+
+def test_upgrade_is_idempotent(app):
+    with app.app_context():
+        assert upgrade() == []
+
+
+# `flask db-upgrade` on its own, without init-db's create_all, brings an old database to the current schema
+def test_upgrades_a_baseline_database(baseline_app):
+    with baseline_app.app_context():
+        assert len(upgrade()) == len(MIGRATIONS)
+        inspector = inspect(db.engine)
+        for table in db.metadata.sorted_tables:
+            assert {column["name"] for column in inspector.get_columns(table.name)} == set(table.columns.keys()), table.name
+            assert {index["name"] for index in inspector.get_indexes(table.name)} >= {index.name for index in table.indexes}, table.name
+        numbers = db.session.execute(select(Attempt.id, Attempt.attempt_number).order_by(Attempt.id)).all()
+        assert numbers == [(1, 1), (2, 2)]
+        with db.engine.connect() as connection:
+            assert all(entry["indexed"] for entry in explain_hot_queries(connection))
+        assert upgrade() == []
+
+
+# The baseline never enforced foreign keys, so rows outlived their parents; migration 3 deletes
+# them as ON DELETE CASCADE would have, down the chain, before foreign keys are switched on
+def test_upgrade_removes_orphans_of_a_baseline_database(tmp_path, baseline_app):
+    with sqlite3.connect(tmp_path / "baseline.sqlite3") as connection:
+        connection.executescript("""
+            INSERT INTO question (id, quiz_id, question_statement, ans_type, marks) VALUES (1, 1, 'Kept', 'single', 1), (2, 9, 'Orphan', 'single', 1);
+            INSERT INTO attempt (id, student_id, quiz_id, attempt_number, score) VALUES (3, 9, 1, 1, 0), (4, 1, 9, 1, 0);
+            INSERT INTO response (id, attempt_id, question_id, answer) VALUES (1, 1, 1, '0'), (2, 1, 2, '0'), (3, 3, 1, '0'), (4, 9, 1, '0');
+            INSERT INTO user_roles (id, user_id, role_id) VALUES (1, 1, 9);
+            INSERT INTO subject_chapter_association (subject_id, chapter_id) VALUES (9, 1);
+        """)
+    with baseline_app.app_context():
+        assert upgrade()
+        with db.engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA foreign_key_check").all() == []
+            ids = {table: connection.exec_driver_sql(f'SELECT id FROM "{table}" ORDER BY id').scalars().all()
+                   for table in ("question", "attempt", "response", "user_roles")}
+            assert connection.exec_driver_sql("SELECT * FROM subject_chapter_association").all() == []
+    assert ids == {"question": [1], "attempt": [1, 2], "response": [1], "user_roles": []}
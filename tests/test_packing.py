@@ -0,0 +1,103 @@
+import pytest
+from sqlalchemy import delete, select, update
+from backend.grading import grade_attempts
+from backend.models import Attempt, Question, Response, db
+from backend.packing import PackedAnswers, attempt_responses, compact, encode, expand, with_results
+from backend.submissions import claim, enqueue, grade_batch
+
+# One of each answer tag, out of question order and past a byte of bitmap
+ENTRIES = [
+    (7, None, False), (3, [0, 2], True), (300, [], False), (-4, 5, True), (12, -70000, False), (13, 0, True),
+    (9, 2.5, True), (10, -1e-9, False), (11, 3.0, True), (20, "Paris", True), (21, True, False),
+    (22, ["a", 1], False), (23, {"low": 1, "high": [2, None]}, True), (2 ** 40, [2 ** 35, 1], True),
+]
+
+
+@pytest.fixture
+def app_config():
+    return {"RESPONSE_STORAGE": "packed"}
+
+
+def test_round_trip_keeps_every_answer():
+    expected = sorted(ENTRIES, key=lambda entry: entry[0])
+    packed = list(PackedAnswers(encode(ENTRIES)))
+    assert packed == expected
+    assert [type(answer) for _, answer, _ in packed] == [type(answer) for _, answer, _ in expected]
+    assert list(PackedAnswers(encode([]))) == []
+
+
+def test_with_results_rewrites_only_the_bitmap():
+    blob = encode(ENTRIES)
+    results = [index % 3 == 0 for index in range(len(ENTRIES))]
+    packed = PackedAnswers(with_results(blob, results))
+    assert [is_correct for _, _, is_correct in packed] == results
+    assert packed.answers == PackedAnswers(blob).answers
+    with pytest.raises(ValueError):
+        with_results(blob, results[1:])
+
+
+def stored(attempt_id):
+    return sorted((response.question_id, response.answer, bool(response.is_correct))
+                  for response in attempt_responses(db.session.get(Attempt, attempt_id)))
+
+
+def submit(client, student, answers):
+    user_id, headers = student
+    response = client.post("/api/quiz/1/response", headers=headers,
+                           json={"user_id": user_id, "responses": [{"question_id": question_id, "answer": answer} for question_id, answer in answers]})
+    assert response.status_code == 201
+    return response.json["data"]["attempt_id"]
+
+
+# Answers to questions of other quizzes are dropped before grading, in the request and in a queued batch
+def test_packed_attempts_hold_only_the_quizs_questions(app, client, seed_catalog, student):
+    with app.app_context():
+        seed_catalog(quizzes=2, questions=2)
+    attempt_id = submit(client, student, [(1, [0]), (3, [0]), (999, [0]), (2, [1])])
+    with app.app_context():
+        assert stored(attempt_id) == [(1, [0], True), (2, [1], False)]
+        enqueue(student[0], 1, [(4, [0]), (2, [0]), (999, 5)])
+        db.session.commit()
+        grade_batch(claim(10, 300))
+        db.session.commit()
+        attempt = db.session.execute(select(Attempt).order_by(Attempt.id.desc()).limit(1)).scalar_one()
+        assert attempt.score == 1
+        assert stored(attempt.id) == [(2, [0], True)]
+
+
+def test_compact_and_expand_round_trip_and_skip_deleted_questions(app, client, seed_catalog, student):
+    with app.app_context():
+        seed_catalog(questions=3)
+    app.config["RESPONSE_STORAGE"] = "rows"
+    attempt_id = submit(client, student, [(1, [0]), (2, "two"), (3, 1.5)])
+    with app.app_context():
+        rows = stored(attempt_id)
+        assert compact() == 1
+        assert db.session.execute(select(Response.id)).first() is None
+        assert stored(attempt_id) == rows
+
+        # Deleting a question removes its rows, but not its place in the blob
+        db.session.execute(delete(Question).where(Question.id == 2))
+        db.session.commit()
+        assert stored(attempt_id) == [rows[0], rows[2]]
+        assert expand() == 1
+        assert db.session.get(Attempt, attempt_id).packed_answers is None
+        assert stored(attempt_id) == [rows[0], rows[2]]
+
+
+# A changed answer key regrades packed attempts in place: new bitmap and score, same answers
+def test_regrade_packed_attempts(app, client, seed_catalog, student):
+    with app.app_context():
+        seed_catalog(questions=3)
+    first = submit(client, student, [(1, [0]), (2, [1]), (3, [1])])
+    second = submit(client, student, [(1, [1]), (1, [0]), (2, [0])])
+    with app.app_context():
+        assert [db.session.get(Attempt, attempt_id).score for attempt_id in (first, second)] == [1, 2]
+        db.session.execute(update(Question).where(Question.id.in_([2, 3])).values(correct_options=[1]))
+        db.session.commit()
+        assert grade_attempts([first, second]) == {first: 3, second: 1}
+        db.session.commit()
+        db.session.expire_all()
+        assert stored(first) == [(1, [0], True), (2, [1], True), (3, [1], True)]
+        assert stored(second) == [(1, [0], True), (2, [0], False)]
+        assert db.session.get(Attempt, second).score == 1
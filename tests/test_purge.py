@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import func, insert, select
+from backend import purge
+from backend.models import Attempt, Chapter, Question, Quiz, QuizStats, Response, Subject, db, subject_chapter_association
+
+
+@pytest.fixture
+def app_config():
+    return {"PURGE_CHUNK_SIZE": 2, "PURGE_PAUSE": 0}
+
+
+def counts():
+    return {model.__name__: db.session.execute(select(func.count()).select_from(model)).scalar()
+            for model in (Subject, Chapter, Quiz, Question, Attempt, Response, QuizStats)}
+
+
+# Queues a background delete through the API, waits for the worker and returns the job's status
+def purge_through_api(client, headers, path):
+    response = client.delete(path, headers=headers, query_string={"mode": "background"})
+    assert response.status_code == 202
+    thread = purge.purger._thread
+    if thread:
+        thread.join(10)
+        assert not thread.is_alive()
+    status = client.get(response.json["data"]["status_url"], headers=headers)
+    assert status.status_code == 200
+    return status.json
+
+
+# A subject purge leaves its chapters to the other subjects; a chapter purge takes every child
+# row in chunks, and the cascades of its final DELETE clear the aggregates
+def test_background_purges_through_the_api(app, client, seed_catalog, student, admin):
+    _, headers = admin
+    with app.app_context():
+        seed_catalog(quizzes=2, questions=3)
+        db.session.execute(insert(Subject), [{"id": 1, "name": "Maths", "image_url": "m.png"}, {"id": 2, "name": "Physics", "image_url": "p.png"}])
+        db.session.execute(insert(subject_chapter_association), [{"subject_id": 1, "chapter_id": 1}, {"subject_id": 2, "chapter_id": 1}])
+        db.session.commit()
+    user_id, student_headers = student
+    for quiz_id in (1, 2, 1):
+        response = client.post(f"/api/quiz/{quiz_id}/response", headers=student_headers, json={
+            "user_id": user_id, "responses": [{"question_id": question_id, "answer": [0]} for question_id in range(3 * quiz_id - 2, 3 * quiz_id + 1)]})
+        assert response.status_code == 201
+
+    status = purge_through_api(client, headers, "/api/subject/1")
+    assert (status["kind"], status["target_id"], status["status"], status["deleted_rows"]) == ("subject", 1, "done", 1)
+    with app.app_context():
+        assert counts() == {"Subject": 1, "Chapter": 1, "Quiz": 2, "Question": 6, "Attempt": 3, "Response": 9, "QuizStats": 2}
+        assert db.session.execute(select(subject_chapter_association)).all() == [(2, 1)]
+
+    status = purge_through_api(client, headers, "/api/chapter/1")
+    assert (status["status"], status["deleted_rows"], status["error"]) == ("done", 9 + 3 + 6 + 2 + 1, None)
+    with app.app_context():
+        assert counts() == {"Subject": 1, "Chapter": 0, "Quiz": 0, "Question": 0, "Attempt": 0, "Response": 0, "QuizStats": 0}
+        assert db.session.execute(select(subject_chapter_association)).all() == []
+    assert client.get("/api/purge/99", headers=headers).status_code == 404
+    assert client.delete("/api/subject/1", headers=headers, query_string={"mode": "background"}).status_code == 404
+
+
+# An error claiming a job must not kill the worker: it logs, backs off and claims again
+def test_worker_survives_a_failed_claim(app, monkeypatch):
+    claims = []
+
+    def claim():
+        claims.append(1)
+        if len(claims) == 1:
+            raise RuntimeError("database is locked")
+        return None
+
+    monkeypatch.setattr(purge, "claim", claim)
+    monkeypatch.setattr(purge, "RETRY_AFTER", 0.01)
+    purge.purger.start()
+    thread = purge.purger._thread
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(claims) == 2
+    assert purge.purger._thread is None
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select
+from backend import quiz_sessions as sessions_module
+from backend.models import Attempt, Question, db
+from backend.quiz_sessions import quiz_sessions
+
+# The time limit of the seeded quizzes, in minutes, and the default grace in seconds
+LIMIT, GRACE = 1, 5
+
+
+@pytest.fixture(params=["memory", "database"])
+def app_config(request):
+    return {"QUIZ_SESSION_STORE": request.param, "QUIZ_SESSION_GRACE": GRACE}
+
+
+# The sessions' clock; clock(seconds) moves it forward. The sweeper thread is kept out of
+# the way; the tests call sweep() themselves.
+@pytest.fixture
+def clock(monkeypatch):
+    offset = []
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + timedelta(seconds=sum(offset))
+
+    monkeypatch.setattr(sessions_module, "datetime", Clock)
+    monkeypatch.setattr(quiz_sessions, "start_sweeper", lambda: None)
+    return offset.append
+
+
+@pytest.fixture
+def timed_quiz(app, client, seed_catalog, student):
+    with app.app_context():
+        seed_catalog(quizzes=3, questions=2, time_limit=LIMIT)
+        questions = db.session.execute(select(Question.quiz_id, Question.id).order_by(Question.id)).all()
+    _, headers = student
+
+    # Starts a session on the quiz and saves correct answers to its questions by heartbeat
+    def start(quiz_id=1):
+        response = client.post(f"/api/quiz/{quiz_id}/session", headers=headers)
+        assert response.status_code == 201
+        session_id = response.json["data"]["session_id"]
+        answers = [{"question_id": question_id, "answer": [0]} for quiz, question_id in questions if quiz == quiz_id]
+        assert client.post(f"/api/session/{session_id}/heartbeat", headers=headers, json={"responses": answers}).status_code == 200
+        return session_id
+    return start
+
+
+def scores(app, student):
+    with app.app_context():
+        return db.session.execute(select(Attempt.quiz_id, Attempt.score).where(Attempt.student_id == student[0])
+                                  .order_by(Attempt.quiz_id)).all()
+
+
+def test_timed_quiz_rejects_direct_submissions(app, client, timed_quiz, student):
+    user_id, headers = student
+    response = client.post("/api/quiz/1/response", headers=headers, json={"user_id": user_id, "responses": [{"question_id": 1, "answer": [0]}]})
+    assert response.status_code == 409
+    assert "/api/quiz/1/session" in response.json["message"]
+
+
+def test_submit_within_grace_is_graded(app, client, clock, timed_quiz, student):
+    session_id = timed_quiz()
+    clock(LIMIT * 60 + GRACE - 1)
+    response = client.post(f"/api/session/{session_id}/submit", headers=student[1], json={})
+    assert response.status_code == 201
+    assert scores(app, student) == [(1, 2)]
+
+
+def test_submit_past_grace_is_rejected_and_saved_answers_graded(app, client, clock, timed_quiz, student):
+    session_id = timed_quiz()
+    clock(LIMIT * 60 + GRACE + 1)
+    late = {"responses": [{"question_id": 1, "answer": [1]}, {"question_id": 2, "answer": [1]}]}
+    assert client.post(f"/api/session/{session_id}/heartbeat", headers=student[1], json=late).status_code == 409
+    response = client.post(f"/api/session/{session_id}/submit", headers=student[1], json=late)
+    assert response.status_code == 409
+    assert response.json["data"]["status"] == "expired"
+    assert scores(app, student) == [(1, 2)]
+
+
+# Nothing runs at the deadline: the next read of an overdue session submits it
+def test_overdue_session_expires_when_read(app, client, clock, timed_quiz, student):
+    session_id = timed_quiz()
+    assert client.get(f"/api/session/{session_id}", headers=student[1]).json["status"] == "active"
+    clock(LIMIT * 60 + GRACE + 1)
+    view = client.get(f"/api/session/{session_id}", headers=student[1]).json
+    assert view["status"] == "expired" and view["submission_id"] is not None
+    assert scores(app, student) == [(1, 2)]
+
+
+def test_sweep_expires_overdue_sessions_and_forgets_old_ones(app, client, clock, timed_quiz, student):
+    overdue = [timed_quiz(1), timed_quiz(2)]
+    clock(LIMIT * 60 + GRACE + 1)
+    timed_quiz(3)
+    with app.app_context():
+        assert quiz_sessions.sweep() == 2
+        assert quiz_sessions.store.active_count() == 1
+    assert scores(app, student) == [(1, 2), (2, 2)]
+    assert client.get(f"/api/session/{overdue[0]}", headers=student[1]).json["status"] == "expired"
+
+    clock(quiz_sessions.retention.total_seconds() + LIMIT * 60)
+    with app.app_context():
+        assert quiz_sessions.sweep() == 1
+    assert [client.get(f"/api/session/{session_id}", headers=student[1]).status_code for session_id in overdue] == [404, 404]
+
+
+# The sweep can expire and forget a session between the ownership check and the save: the
+# heartbeat and the submit then find nothing and must say so, not fail on the missing session
+@pytest.mark.parametrize("action", ["heartbeat", "submit"])
+def test_session_forgotten_mid_request_is_gone(app, client, seed_catalog, student, monkeypatch, action):
+    with app.app_context():
+        seed_catalog(questions=2)
+    _, headers = student
+    session_id = client.post("/api/quiz/1/session", headers=headers).json["data"]["session_id"]
+
+    # Found by ownedSession, gone by the time the save fails
+    with app.app_context():
+        lookups = iter([quiz_sessions.get(session_id)])
+    monkeypatch.setattr(quiz_sessions, "get", lambda session_id: next(lookups, None))
+    monkeypatch.setattr(quiz_sessions, "heartbeat", lambda session, answers: False)
+    monkeypatch.setattr(quiz_sessions, "finish", lambda session: None)
+
+    response = client.post(f"/api/session/{session_id}/{action}", headers=headers, json={})
+    assert response.status_code == 410
@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import insert, inspect, update
+from app import createApp
+from backend import search
+from backend.bootstrap import init_db
+from backend.database import engine_options
+from backend.models import Quiz, Subject, db
+
+
+@pytest.fixture(params=["fts5", "like"])
+def search_backend(request, app, monkeypatch):
+    with app.app_context():
+        if request.param == "fts5" and not search.available(db.session.connection()):
+            pytest.skip("SQLite built without FTS5")
+        if request.param == "like":
+            monkeypatch.setitem(search._fts5, db.engine, False)
+    return request.param
+
+
+def test_available_matches_the_sqlite_build(app):
+    with app.app_context():
+        connection = db.session.connection()
+        compiled = connection.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar()
+        assert search.available(connection) == bool(compiled)
+
+
+# Students only see the questions of a pooled quiz through their session's paper
+def test_students_do_not_find_questions_of_pooled_quizzes(app, client, seed_catalog, student, admin, search_backend):
+    with app.app_context():
+        seed_catalog(quizzes=2, questions=2)
+        db.session.execute(update(Quiz).where(Quiz.id == 2).values(pool_size=1))
+        db.session.commit()
+
+    def found(headers):
+        response = client.get("/api/search?q=question&kind=question", headers=headers)
+        assert response.status_code == 200
+        return sorted(result["parent_id"] for result in response.json)
+
+    assert found(student[1]) == [1, 1]
+    assert found(admin[1]) == [1, 1, 2, 2]
+
+
+# Without FTS5 migration 2 creates no index, and search scans with LIKE instead
+def test_migrates_and_searches_without_fts5(tmp_path, monkeypatch):
+    monkeypatch.setattr(search, "available", lambda connection: False)
+    uri = f"sqlite:///{tmp_path / 'plain.sqlite3'}"
+    app = createApp({"SQLALCHEMY_DATABASE_URI": uri, "SQLALCHEMY_ENGINE_OPTIONS": engine_options(uri), "PASSWORD_HASH_WORKERS": 0})
+    with app.app_context():
+        init_db()
+        assert "search_index" not in inspect(db.engine).get_table_names()
+        db.session.execute(insert(Subject).values(name="Physics", description="Mechanics", image_url="x.png"))
+        db.session.commit()
+        results, _ = search.search("mechan")
+        assert [result["title"] for result in results] == ["Physics"]
+        db.engine.dispose()
@@ -0,0 +1,61 @@
+import json
+from datetime import datetime
+import pytest
+from flask_restful import marshal
+from backend import resources, serializers
+from backend.models import Attempt, Chapter, Question, Quiz, Response, Subject
+from backend.serializers import dumps, serialize
+
+SCHEMAS = {name: value for name, value in vars(resources).items() if "_fields" in name and isinstance(value, dict)}
+
+
+def question(id, **columns):
+    return Question(**{"id": id, "quiz_id": 1, "question_statement": f"Question {id}", "ans_type": "single", "options": ["a", "b", 3],
+                       "marks": 2, **columns})
+
+
+def quiz(id, **columns):
+    return Quiz(id=id, chapter_id=1, name=f"Quiz {id}", description=None, total_marks=4, time_limit=30,
+                questions=[question(1), question(2, options=None)], **columns)
+
+
+# Filled in and mostly empty objects of each schema, plus the dicts and None the resources also pass
+SAMPLES = {
+    "response_fields": [Response(id=1, question_id=2, attempt_id=3, answer=[0, 2], is_correct=True),
+                        Response(id=2, question_id=2, attempt_id=3, answer=4.5), Response(), {"id": 3, "answer": "text", "is_correct": 0}],
+    "attempts_fields": [Attempt(student_id=1, quiz_id=2, attempt_number=3, attempt_date=datetime(2025, 1, 2, 3, 4, 5), score=7),
+                        Attempt(), {"student_id": "4", "score": None}],
+    "question_fields": [question(1), question(2, options=None), Question(), None],
+    "quiz_fields": [quiz(1, pool_size=2, pool_strata="marks", shuffle_options=True), quiz(2), Quiz(), {"id": 3, "pool_size": None}],
+    "quiz_fields_with_questions": [quiz(1, pool_size=2), quiz(2), Quiz()],
+    "chapter_fields": [Chapter(id=1, name="Chapter", description="Text", quizzes=[quiz(1), quiz(2, pool_size=1)]), Chapter()],
+    "subject_fields": [Subject(id=1, name="Subject", description=None, image_url="x.png",
+                               chapters=[Chapter(id=1, name="Chapter", quizzes=[quiz(1)]), Chapter(id=2, name="Empty")]), Subject()],
+}
+
+
+def test_every_schema_has_samples():
+    assert sorted(SCHEMAS) == sorted(SAMPLES)
+
+
+@pytest.mark.parametrize("name", sorted(SAMPLES))
+def test_serialize_matches_marshal(name):
+    schema = SCHEMAS[name]
+    for sample in SAMPLES[name]:
+        assert serialize(sample, schema) == marshal(sample, schema)
+    assert serialize(SAMPLES[name], schema) == marshal(SAMPLES[name], schema)
+
+
+def test_depth_and_fields_project_the_marshalled_payload():
+    subject = SAMPLES["subject_fields"][0]
+    assert serialize(subject, resources.subject_fields, depth=0) == {key: value for key, value in marshal(subject, resources.subject_fields).items()
+                                                                    if key != "chapters"}
+    assert serialize(subject, resources.subject_fields, names="id,name") == {"id": 1, "name": "Subject"}
+
+
+def test_orjson_and_json_encode_alike(monkeypatch):
+    payload = marshal(SAMPLES["subject_fields"][0], resources.subject_fields)
+    assert serializers.orjson is not None
+    fast = dumps(payload)
+    monkeypatch.setattr(serializers, "orjson", None)
+    assert json.loads(fast) == json.loads(dumps(payload))
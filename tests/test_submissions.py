@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select, update
+from backend.models import Attempt, Response, Submission, db
+from backend.submissions import FAILED, GRADED, GRADING, QUEUED, claim, enqueue, submission_queue
+from conftest import sign_in
+
+
+# Queued submissions, graded only when a test drains the queue: no worker threads
+@pytest.fixture
+def app_config():
+    return {"SUBMISSION_MODE": "queue", "SUBMISSION_WORKERS": 0, "SUBMISSION_BATCH_SIZE": 3, "SUBMISSION_CLAIM_TIMEOUT": 60}
+
+
+def statuses():
+    return db.session.execute(select(Submission.id, Submission.status).order_by(Submission.id)).all()
+
+
+def test_queued_submission_through_the_api(app, client, seed_catalog, student):
+    user_id, headers = student
+    with app.app_context():
+        seed_catalog(questions=3)
+    response = client.post("/api/quiz/1/response", headers=headers, json={
+        "user_id": user_id, "responses": [{"question_id": 1, "answer": [0]}, {"question_id": 2, "answer": [1]}]})
+    assert response.status_code == 202
+    data = response.json["data"]
+    assert data["status"] == QUEUED
+    status = client.get(data["status_url"], headers=headers)
+    assert (status.json["status"], status.headers["Retry-After"]) == (QUEUED, "1")
+
+    with app.app_context():
+        assert db.session.execute(select(Attempt.id)).first() is None
+        assert submission_queue.drain_once() == 1
+    status = client.get(data["status_url"], headers=headers)
+    assert "Retry-After" not in status.headers
+    assert {name: status.json[name] for name in ("status", "attempt_number", "score", "total_marks", "error")} == {
+        "status": GRADED, "attempt_number": 1, "score": 1, "total_marks": 3, "error": None}
+    with app.app_context():
+        assert db.session.execute(select(Response.question_id, Response.is_correct).order_by(Response.id)).all() == [(1, True), (2, False)]
+
+    _, other = sign_in(app, client, "other@test.local", "user")
+    assert client.get(data["status_url"], headers=other).status_code == 403
+    assert client.get("/api/submission/99", headers=headers).status_code == 404
+
+
+# Oldest first, at most batch_size, and a claimed row is not handed out again until its
+# claim times out
+def test_claim_takes_the_oldest_unclaimed_rows(app, seed_catalog, student):
+    user_id, _ = student
+    with app.app_context():
+        seed_catalog(questions=1)
+        ids = [enqueue(user_id, 1, [(1, [0])]) for _ in range(5)]
+        db.session.commit()
+        first = claim(3, 60)
+        assert [row.id for row in first] == ids[:3]
+        assert [row.answers for row in first] == [[[1, [0]]]] * 3
+        assert [row.id for row in claim(3, 60)] == ids[3:]
+        assert claim(3, 60) == []
+        assert statuses() == [(submission_id, GRADING) for submission_id in ids]
+
+        # The worker that took the first batch died: its rows are claimed again after the timeout
+        db.session.execute(update(Submission).where(Submission.id.in_(ids[:2])).values(claimed_at=datetime.now() - timedelta(seconds=61)))
+        db.session.commit()
+        assert [row.id for row in claim(3, 60)] == ids[:2]
+
+
+# A batch that fails as a whole is graded one row at a time: the bad submission is marked
+# failed with its error and the rest of the batch is graded
+def test_failed_batch_is_retried_row_by_row(app, seed_catalog, student):
+    user_id, _ = student
+    with app.app_context():
+        seed_catalog(questions=2)
+        good = enqueue(user_id, 1, [(1, [0]), (2, [0])])
+        bad = enqueue(user_id, 1, [(1,)])  # an answer without a question id fails grading
+        last = enqueue(user_id, 1, [(2, [1])])
+        db.session.commit()
+        before = dict(submission_queue.metrics)
+        assert submission_queue.drain_once() == 3
+        assert statuses() == [(good, GRADED), (bad, FAILED), (last, GRADED)]
+        error, graded_at = db.session.execute(select(Submission.error, Submission.graded_at).where(Submission.id == bad)).one()
+        assert "values to unpack" in error and graded_at is not None
+        assert db.session.execute(select(Attempt.attempt_number, Attempt.score).order_by(Attempt.id)).all() == [(1, 2), (2, 0)]
+        assert {name: submission_queue.metrics[name] - before[name] for name in ("batches", "graded", "failed")} == {
+            "batches": 1, "graded": 2, "failed": 1}
+        assert submission_queue.drain_once() == 0